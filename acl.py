@@ -0,0 +1,309 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, Mapping, Optional, Tuple
+
+from storage_manager import TEMP_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Permission bits granted per user
+READ = 1
+WRITE = 2
+FULL = READ | WRITE
+
+EMPTY: FrozenSet[str] = frozenset()
+
+@dataclass(frozen=True)
+class AccessView:
+    """One user's effective permissions, computed once per ACL version.
+
+    Every folder with an ACL entry has a bit index; readable and writable
+    hold one bit per such folder, and readable_files one bit per locked file.
+    Folders without entries are readable by everyone. hidden lists, per
+    folder, the locked files this user may not read, so listings and
+    searches drop them while they iterate. Admins have every bit set.
+    """
+    version: int
+    admin: bool
+    readable: int
+    writable: int
+    readable_files: int
+    hidden: Mapping[str, FrozenSet[str]] = field(compare=False, repr=False)
+    folder_bits: Mapping[str, int] = field(compare=False, repr=False)
+
+    @property
+    def key(self) -> Tuple[int, int, int]:
+        """Hashable key shared by every user with the same read permissions."""
+        return self.version, self.readable, self.readable_files
+
+    def can_read_folder(self, folder_name: str) -> bool:
+        bit = self.folder_bits.get(folder_name)
+        return bit is None or bool(self.readable >> bit & 1)
+
+    def can_write_folder(self, folder_name: str) -> bool:
+        """True for admins and users granted WRITE on the folder."""
+        bit = self.folder_bits.get(folder_name)
+        return self.admin or (bit is not None and bool(self.writable >> bit & 1))
+
+    def hidden_in(self, folder_name: str) -> FrozenSet[str]:
+        """Return the locked files of a readable folder this user may not see."""
+        return self.hidden.get(folder_name, EMPTY)
+
+    def can_read(self, folder_name: str, filename: str) -> bool:
+        return self.can_read_folder(folder_name) and filename not in self.hidden_in(folder_name)
+
+class AccessControl:
+    """Per-folder and per-file access control keyed by Telegram user ID.
+
+    A locked folder or file is readable only by admins and users granted
+    READ on it; grants on unlocked folders can add WRITE (uploads). The
+    rules are stored as JSON next to the folder registry and reloaded when
+    another process rewrites them. Each change bumps version, which drops
+    the cached AccessView of every user. Rules are keyed by name and outlive
+    deletions, so a file or folder brought back by /restore, or re-added
+    under the same name, keeps its protection until it is unlocked.
+
+    Usernames listed in bootstrap_usernames become admins the first time
+    they are seen, after which their numeric ID is what counts; a claimed
+    username is never claimed again, even after revoke_admin.
+    """
+
+    def __init__(self, path: str, admin_ids: Iterable[int] = (), bootstrap_usernames: Iterable[str] = ()):
+        self.path = path
+        self._lock = threading.Lock()
+        self._bootstrap = {name.lstrip('@').lower() for name in bootstrap_usernames}
+        self._admins = set(admin_ids)
+        self._env_admins = frozenset(self._admins)
+        self._claimed = set()
+        # folder -> {'locked': bool, 'grants': {user_id: bits}}
+        self._folders: Dict[str, dict] = {}
+        # folder -> {locked filename: {user_id: bits}}
+        self._files: Dict[str, Dict[str, Dict[int, int]]] = {}
+        self._mtime = None
+        self._views: Dict[int, AccessView] = {}
+        self._folder_bits: Dict[str, int] = {}
+        self._file_bits: Dict[Tuple[str, str], int] = {}
+        self._open_mask = 0
+        self.version = 0
+        with self._lock:
+            self._reload_if_changed()
+            self._compile()
+
+    def _compile(self) -> None:
+        """Number the restricted folders and files and drop cached views (caller holds _lock)."""
+        self._folder_bits = {folder: i for i, folder in enumerate(sorted(self._folders))}
+        self._file_bits = {(folder, filename): i for i, (folder, filename) in enumerate(
+            sorted((folder, filename) for folder, files in self._files.items() for filename in files))}
+        self._open_mask = 0
+        for folder, rule in self._folders.items():
+            if not rule['locked']:
+                self._open_mask |= 1 << self._folder_bits[folder]
+        self._views = {}
+        self.version += 1
+
+    def _reload_if_changed(self) -> None:
+        """Reload the rules if their file changed on disk (caller holds _lock)."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load access rules: {str(e)}", exc_info=True)
+            return
+        self._admins = set(self._env_admins) | {int(uid) for uid in data.get('admins', [])}
+        self._claimed = set(data.get('claimed', []))
+        self._folders = {
+            folder: {'locked': bool(rule.get('locked')),
+                     'grants': {int(uid): bits for uid, bits in rule.get('grants', {}).items()}}
+            for folder, rule in data.get('folders', {}).items()
+        }
+        self._files = {
+            folder: {filename: {int(uid): bits for uid, bits in grants.items()}
+                     for filename, grants in files.items()}
+            for folder, files in data.get('files', {}).items()
+        }
+        self._mtime = mtime
+        if self.version:
+            self._compile()
+        logger.info(f"Loaded access rules: {len(self._folders)} folders, "
+                    f"{sum(len(files) for files in self._files.values())} locked files")
+
+    def _save(self) -> None:
+        """Atomically write the rules and recompile them (caller holds _lock)."""
+        data = {
+            'admins': sorted(self._admins - self._env_admins),
+            'claimed': sorted(self._claimed),
+            'folders': {folder: {'locked': rule['locked'],
+                                 'grants': {str(uid): bits for uid, bits in rule['grants'].items()}}
+                        for folder, rule in self._folders.items()},
+            'files': {folder: {filename: {str(uid): bits for uid, bits in grants.items()}
+                               for filename, grants in files.items()}
+                      for folder, files in self._files.items()},
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}{TEMP_SUFFIX}-{uuid.uuid4().hex}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._compile()
+
+    def _claim(self, user_id: int, username: Optional[str]) -> None:
+        """Promote a bootstrap username to admin by ID the first time it is seen (caller holds _lock)."""
+        name = username.lstrip('@').lower()
+        if name in self._bootstrap and name not in self._claimed:
+            self._claimed.add(name)
+            self._admins.add(user_id)
+            self._save()
+            logger.info(f"Registered admin {user_id} for username @{name}")
+
+    def _build_view(self, user_id: Optional[int]) -> AccessView:
+        """Compute a user's bitsets from the rules (caller holds _lock)."""
+        if user_id in self._admins:
+            return AccessView(self.version, True, -1, -1, -1, {}, self._folder_bits)
+        readable, writable = self._open_mask, 0
+        for folder, rule in self._folders.items():
+            bits = rule['grants'].get(user_id, 0)
+            if bits & READ:
+                readable |= 1 << self._folder_bits[folder]
+            if bits & WRITE:
+                writable |= 1 << self._folder_bits[folder]
+        readable_files = 0
+        hidden: Dict[str, FrozenSet[str]] = {}
+        for folder, files in self._files.items():
+            denied = []
+            for filename, grants in files.items():
+                if grants.get(user_id, 0) & READ:
+                    readable_files |= 1 << self._file_bits[(folder, filename)]
+                else:
+                    denied.append(filename)
+            if denied:
+                hidden[folder] = frozenset(denied)
+        return AccessView(self.version, False, readable, writable, readable_files, hidden, self._folder_bits)
+
+    def view(self, user_id: Optional[int], username: Optional[str] = None) -> AccessView:
+        """Return a user's effective permissions, cached until the rules change."""
+        with self._lock:
+            self._reload_if_changed()
+            if username and user_id is not None and self._bootstrap:
+                self._claim(user_id, username)
+            key = user_id if user_id is not None else 0
+            view = self._views.get(key)
+            if view is None:
+                view = self._views[key] = self._build_view(user_id)
+            return view
+
+    def is_admin(self, user_id: Optional[int], username: Optional[str] = None) -> bool:
+        return self.view(user_id, username).admin
+
+    def has_rules(self) -> bool:
+        """True when any folder or file has a rule, so users may see different results."""
+        with self._lock:
+            self._reload_if_changed()
+            return bool(self._folders or self._files)
+
+    def admins(self) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+        """Return (admins from the environment, admins stored in the rules)."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._env_admins, frozenset(self._admins - self._env_admins)
+
+    def revoke_admin(self, user_id: int) -> bool:
+        """Remove a stored admin (e.g. a claimed bootstrap username); returns False if there was none.
+
+        Admins from the environment can only be removed there.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            if user_id in self._env_admins or user_id not in self._admins:
+                return False
+            self._admins.discard(user_id)
+            self._save()
+        logger.info(f"Revoked admin rights of user {user_id}")
+        return True
+
+    def is_locked(self, folder_name: str) -> bool:
+        with self._lock:
+            self._reload_if_changed()
+            rule = self._folders.get(folder_name)
+            return bool(rule and rule['locked'])
+
+    def set_locked(self, folder_name: str, locked: bool, filename: Optional[str] = None) -> bool:
+        """Lock or unlock a folder or one file; returns False if nothing changed."""
+        with self._lock:
+            self._reload_if_changed()
+            if filename is not None:
+                files = self._files.setdefault(folder_name, {})
+                if locked == (filename in files):
+                    return False
+                if locked:
+                    files[filename] = {}
+                else:
+                    del files[filename]
+                    if not files:
+                        del self._files[folder_name]
+            else:
+                rule = self._folders.get(folder_name)
+                if bool(rule and rule['locked']) == locked:
+                    return False
+                if locked:
+                    self._folders.setdefault(folder_name, {'locked': True, 'grants': {}})['locked'] = True
+                elif rule['grants']:
+                    rule['locked'] = False
+                else:
+                    del self._folders[folder_name]
+            self._save()
+        logger.info(f"{'Locked' if locked else 'Unlocked'} {folder_name}/{filename or ''}")
+        return True
+
+    def grant(self, folder_name: str, user_id: int, bits: int = READ, filename: Optional[str] = None) -> None:
+        """Give a user permissions on a folder, or READ on a locked file (locking it if needed)."""
+        with self._lock:
+            self._reload_if_changed()
+            if filename is not None:
+                grants = self._files.setdefault(folder_name, {}).setdefault(filename, {})
+                grants[user_id] = grants.get(user_id, 0) | READ
+            else:
+                rule = self._folders.setdefault(folder_name, {'locked': False, 'grants': {}})
+                rule['grants'][user_id] = rule['grants'].get(user_id, 0) | bits
+            self._save()
+        logger.info(f"Granted {bits} on {folder_name}/{filename or ''} to user {user_id}")
+
+    def revoke(self, folder_name: str, user_id: int, filename: Optional[str] = None) -> bool:
+        """Remove a user's grant on a folder or file; returns False if there was none."""
+        with self._lock:
+            self._reload_if_changed()
+            if filename is not None:
+                grants = self._files.get(folder_name, {}).get(filename, {})
+            else:
+                rule = self._folders.get(folder_name)
+                grants = rule['grants'] if rule else {}
+            if grants.pop(user_id, None) is None:
+                return False
+            if filename is None and not rule['locked'] and not grants:
+                del self._folders[folder_name]
+            self._save()
+        logger.info(f"Revoked access to {folder_name}/{filename or ''} from user {user_id}")
+        return True
+
+    def describe(self, folder_name: str) -> Dict[str, object]:
+        """Summarize the rules of one folder."""
+        with self._lock:
+            self._reload_if_changed()
+            rule = self._folders.get(folder_name, {'locked': False, 'grants': {}})
+            return {
+                'locked': rule['locked'],
+                'grants': dict(rule['grants']),
+                'files': {filename: dict(grants) for filename, grants in self._files.get(folder_name, {}).items()},
+            }
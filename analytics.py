@@ -0,0 +1,177 @@
+import functools
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Tuple
+
+from loop_monitor import describe_update
+
+logger = logging.getLogger(__name__)
+
+# (timestamp, command, folder, filename, latency seconds, bytes, ok)
+Event = Tuple[float, str, str, str, float, int, bool]
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+class Analytics:
+    """Usage events buffered in memory and written to SQLite in batches.
+
+    emit() appends to a bounded ring buffer (the oldest events are dropped if
+    flushing falls behind), so handlers never touch the database. flush()
+    appends the batch to the raw events table and folds it into hourly and
+    daily rollups per command, folder and file in the same transaction.
+    Reports read only the rollups.
+    """
+
+    def __init__(self, db_path: str, capacity: int = 100000, raw_retention_days: float = 7):
+        self.db_path = db_path
+        self.raw_retention_seconds = raw_retention_days * DAY
+        self._buffer: Deque[Event] = deque(maxlen=capacity)
+        self.dropped = 0
+        self.flushed = 0
+        self._last_prune = 0.0
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        connection = self._connect()
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the analytics database."""
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        rollup_columns = (
+            "bucket INTEGER NOT NULL, command TEXT NOT NULL, folder TEXT NOT NULL, file TEXT NOT NULL, "
+            "count INTEGER NOT NULL, errors INTEGER NOT NULL, bytes INTEGER NOT NULL, "
+            "latency_sum REAL NOT NULL, latency_max REAL NOT NULL, "
+            "PRIMARY KEY (bucket, command, folder, file)"
+        )
+        connection.executescript(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "ts REAL NOT NULL, command TEXT NOT NULL, folder TEXT NOT NULL, file TEXT NOT NULL, "
+            "latency REAL NOT NULL, bytes INTEGER NOT NULL, ok INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS events_by_ts ON events (ts);"
+            f"CREATE TABLE IF NOT EXISTS hourly ({rollup_columns});"
+            f"CREATE TABLE IF NOT EXISTS daily ({rollup_columns});"
+        )
+        return connection
+
+    def emit(self, command: str, folder: str = "", filename: str = "",
+             latency: float = 0.0, size: int = 0, ok: bool = True) -> None:
+        """Record one event (O(1); safe to call from handlers)."""
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((time.time(), command, folder or "", filename or "", latency, size, ok))
+
+    @staticmethod
+    def _rollup(events: List[Event], width: int) -> Dict[Tuple[int, str, str, str], List[float]]:
+        """Aggregate a batch into (bucket, command, folder, file) -> [count, errors, bytes, latency sum, max]."""
+        rollup: Dict[Tuple[int, str, str, str], List[float]] = {}
+        for ts, command, folder, filename, latency, size, ok in events:
+            bucket = int(ts // width * width)
+            # Per-file rows only where a file was involved; every event counts towards its folder row
+            for key in {(bucket, command, folder, filename), (bucket, command, folder, "")}:
+                row = rollup.setdefault(key, [0, 0, 0, 0.0, 0.0])
+                row[0] += 1
+                row[1] += 0 if ok else 1
+                row[2] += size
+                row[3] += latency
+                row[4] = max(row[4], latency)
+        return rollup
+
+    def flush(self) -> int:
+        """Write buffered events and update the rollups (blocking); returns how many were written."""
+        events = []
+        try:
+            while True:
+                events.append(self._buffer.popleft())
+        except IndexError:
+            pass  # Drained (possibly racing another flush)
+        if not events:
+            return 0
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                       [event[:6] + (int(event[6]),) for event in events])
+                for table, width in (("hourly", HOUR), ("daily", DAY)):
+                    connection.executemany(
+                        f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (bucket, command, folder, file) DO UPDATE SET "
+                        "count = count + excluded.count, errors = errors + excluded.errors, "
+                        "bytes = bytes + excluded.bytes, latency_sum = latency_sum + excluded.latency_sum, "
+                        "latency_max = MAX(latency_max, excluded.latency_max)",
+                        [key + tuple(values) for key, values in self._rollup(events, width).items()]
+                    )
+                now = time.time()
+                if now - self._last_prune > HOUR:
+                    self._last_prune = now
+                    connection.execute("DELETE FROM events WHERE ts < ?", (now - self.raw_retention_seconds,))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(events)} analytics events: {str(e)}", exc_info=True)
+            self.dropped += len(events)
+            return 0
+        finally:
+            connection.close()
+        self.flushed += len(events)
+        return len(events)
+
+    def report(self, days: int = 7, top: int = 5) -> Dict[str, Any]:
+        """Summarize usage from the rollups only (blocking)."""
+        now = time.time()
+        since_day = int((now - days * DAY) // DAY * DAY)
+        since_hour = int((now - DAY) // HOUR * HOUR)
+        connection = self._connect()
+        try:
+            commands = connection.execute(
+                "SELECT command, SUM(count), SUM(errors), SUM(latency_sum), MAX(latency_max) FROM daily "
+                "WHERE bucket >= ? AND file = '' GROUP BY command ORDER BY SUM(count) DESC",
+                (since_day,)
+            ).fetchall()
+            folders = connection.execute(
+                "SELECT folder, SUM(count), SUM(bytes) FROM daily WHERE bucket >= ? AND command = 'download' "
+                "AND file = '' GROUP BY folder ORDER BY SUM(count) DESC LIMIT ?",
+                (since_day, top)
+            ).fetchall()
+            files = connection.execute(
+                "SELECT folder, file, SUM(count), SUM(bytes) FROM daily WHERE bucket >= ? AND command = 'download' "
+                "AND file != '' GROUP BY folder, file ORDER BY SUM(count) DESC LIMIT ?",
+                (since_day, top)
+            ).fetchall()
+            hourly = connection.execute(
+                "SELECT bucket, SUM(count) FROM hourly WHERE bucket >= ? AND file = '' "
+                "AND command != 'download' AND command != 'upload' GROUP BY bucket ORDER BY bucket",
+                (since_hour,)
+            ).fetchall()
+        finally:
+            connection.close()
+        return {'commands': commands, 'folders': folders, 'files': files, 'hourly': hourly}
+
+    def track(self, callback: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """Wrap a handler callback so every update it handles is counted and timed."""
+
+        @functools.wraps(callback)
+        async def tracked(update: Any, context: Any) -> Any:
+            started = time.monotonic()
+            ok = False
+            try:
+                result = await callback(update, context)
+                ok = True
+                return result
+            finally:
+                self.emit(describe_update(update), latency=time.monotonic() - started, ok=ok)
+
+        return tracked
+
+    def instrument(self, application: Any) -> None:
+        """Wrap the callback of every handler registered on an application.
+
+        Handlers in negative groups (e.g. the rate-limit guard) run for every
+        update before the real handler and are skipped so nothing counts twice.
+        """
+        for group, handlers in application.handlers.items():
+            if group < 0:
+                continue
+            for handler in handlers:
+                handler.callback = self.track(handler.callback)
@@ -0,0 +1,102 @@
+"""Offline relevance benchmark for the /get ranking stage.
+
+Compares the ranked order against the unranked directory order on a small
+hand-labelled corpus (mean reciprocal rank and precision@1), and times the
+heap-based top-k page against a full sort on a large synthetic candidate set.
+
+Usage: python benchmarks/relevance_benchmark.py
+"""
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ranking import Candidate, Ranker, RankingWeights  # noqa: E402
+
+DAY = 86400
+NOW = time.time()
+
+# (folder, filename, age in days, popularity score)
+CORPUS: List[Tuple[str, str, float, float]] = [
+    ("MockTests", "Old Mock Test Solutions 2021.pdf", 900, 0.5),
+    ("MockTests", "Sectional Mock - Legal Reasoning.pdf", 200, 2.0),
+    ("MockTests", "Mock Test 12 Questions.pdf", 3, 40.0),
+    ("MockTests", "Mock Test 12 Answer Key.pdf", 3, 25.0),
+    ("MockTests", "Mock Test 11 Questions.pdf", 10, 8.0),
+    ("MockTests", "Full Length Mock Analysis.pdf", 60, 4.0),
+    ("GK-CA1-YSTATIC", "Static GK Compilation Part 2.pdf", 40, 6.0),
+    ("GK-CA1-YSTATIC", "GK Static Capsule 2023.pdf", 400, 1.0),
+    ("GK-CA1-YSTATIC", "Static GK Compilation Part 1.pdf", 45, 12.0),
+    ("LegalMaximsTerms", "Maxims Revision Sheet.pdf", 20, 3.0),
+    ("LegalMaximsTerms", "Important Legal Maxims.pdf", 100, 15.0),
+    ("LegalMaximsTerms", "Latin Terms Used in Law.pdf", 300, 2.0),
+    ("CaseLawsJudgments", "Recent Constitution Bench Judgments.pdf", 15, 9.0),
+    ("CaseLawsJudgments", "Landmark Judgments Constitution.pdf", 500, 20.0),
+    ("CaseLawsJudgments", "Constitution Articles Summary.pdf", 90, 5.0),
+]
+
+# query -> the file a student actually wanted
+JUDGEMENTS: Dict[str, str] = {
+    "mock test 12": "Mock Test 12 Questions.pdf",
+    "mock": "Mock Test 12 Questions.pdf",
+    "static gk": "Static GK Compilation Part 1.pdf",
+    "maxims": "Important Legal Maxims.pdf",
+    "constitution": "Landmark Judgments Constitution.pdf",
+    "answer key": "Mock Test 12 Answer Key.pdf",
+}
+
+def build_candidates() -> Tuple[List[Candidate], Dict[Tuple[str, str], float]]:
+    """Turn the corpus into ranking candidates and a popularity table."""
+    candidates = [(folder, name, NOW - age * DAY) for folder, name, age, _ in CORPUS]
+    popularity = {(folder, name): score for folder, name, _, score in CORPUS}
+    return candidates, popularity
+
+def matches_for(query: str, candidates: List[Candidate]) -> List[Candidate]:
+    """Apply the same substring match rule as StorageManager.search_files."""
+    return [c for c in candidates if query.lower() in c[1].lower()]
+
+def evaluate(order_fn) -> Tuple[float, float]:
+    """Return (MRR, precision@1) of an ordering function over all judged queries."""
+    reciprocal_ranks = []
+    hits_at_one = 0
+    candidates, _ = build_candidates()
+    for query, wanted in JUDGEMENTS.items():
+        ordered = [c[1] for c in order_fn(query, matches_for(query, candidates))]
+        rank = ordered.index(wanted) + 1 if wanted in ordered else None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        hits_at_one += rank == 1
+    return sum(reciprocal_ranks) / len(reciprocal_ranks), hits_at_one / len(JUDGEMENTS)
+
+def time_top_k(ranker: Ranker, size: int = 100000, k: int = 5) -> Tuple[float, float]:
+    """Time one results page with the heap versus a full sort."""
+    rng = random.Random(42)
+    candidates = [("Folder", f"notes part {rng.randint(0, 10**6)} revision.pdf", NOW - rng.random() * 400 * DAY)
+                  for _ in range(size)]
+    start = time.perf_counter()
+    ranker.top_k("notes", candidates, k)
+    heap_seconds = time.perf_counter() - start
+
+    query_tokens = {"notes"}
+    start = time.perf_counter()
+    sorted(candidates, key=lambda c: ranker.score("notes", query_tokens, c, NOW), reverse=True)[:k]
+    sort_seconds = time.perf_counter() - start
+    return heap_seconds, sort_seconds
+
+def main() -> None:
+    """Run the benchmark and print a summary."""
+    _, popularity = build_candidates()
+    ranker = Ranker(RankingWeights(), popularity=lambda folder, name: popularity.get((folder, name), 0.0))
+
+    baseline_mrr, baseline_p1 = evaluate(lambda query, matches: matches)
+    ranked_mrr, ranked_p1 = evaluate(lambda query, matches: ranker.top_k(query, matches, len(matches)))
+    print(f"Directory order: MRR {baseline_mrr:.3f}, P@1 {baseline_p1:.2f}")
+    print(f"Ranked order:    MRR {ranked_mrr:.3f}, P@1 {ranked_p1:.2f}")
+
+    heap_seconds, sort_seconds = time_top_k(ranker)
+    print(f"Top-5 of 100k candidates: heap {heap_seconds * 1000:.1f}ms, full sort {sort_seconds * 1000:.1f}ms")
+
+if __name__ == '__main__':
+    main()
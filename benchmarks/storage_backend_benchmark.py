@@ -0,0 +1,56 @@
+"""Storage backend benchmark for StorageManager's hot paths.
+
+Times saving files, rescanning folder listings and searching through
+StorageManager on the local filesystem backend and the in-memory backend,
+so storage changes can be measured without disk noise.
+
+Usage: python benchmarks/storage_backend_benchmark.py [files per folder]
+"""
+import os
+import sys
+import tempfile
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage_backends import LocalFSBackend, MemoryBackend  # noqa: E402
+from storage_manager import StorageManager  # noqa: E402
+
+FOLDERS = ["MockTests", "LegalMaximsTerms", "CaseLawsJudgments", "GK-CA1-YSTATIC"]
+CONTENT = b"x" * 4096
+
+def run(storage: StorageManager, files_per_folder: int) -> Dict[str, float]:
+    """Return seconds spent saving, rescanning and searching."""
+    timings = {}
+    started = time.perf_counter()
+    for folder in FOLDERS:
+        storage.create_folder(folder)
+        for i in range(files_per_folder):
+            storage.save_file(folder, f"Mock Test {i} Questions.pdf", CONTENT)
+    timings['save'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for folder in FOLDERS:
+        storage.invalidate_folder(folder)
+        storage.list_files(folder)
+    timings['rescan'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for i in range(100):
+        storage.search_files(f"mock test {i}", include_similar=False)
+    timings['search x100'] = time.perf_counter() - started
+    return timings
+
+def main() -> None:
+    """Run the benchmark and print a summary."""
+    files_per_folder = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(f"{len(FOLDERS)} folders x {files_per_folder} files of {len(CONTENT)} bytes")
+    with tempfile.TemporaryDirectory() as local_dir, tempfile.TemporaryDirectory() as state_dir:
+        for name, storage in (("local", StorageManager(local_dir, backend=LocalFSBackend(local_dir))),
+                              ("memory", StorageManager(state_dir, backend=MemoryBackend()))):
+            timings = run(storage, files_per_folder)
+            print(f"{name:>6}: " + ", ".join(f"{step} {seconds * 1000:.1f}ms" for step, seconds in timings.items()))
+
+if __name__ == '__main__':
+    main()
@@ -1,97 +1,294 @@
+import asyncio
+import hashlib
+import io
 import logging
+import math
 import os
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
-from storage_manager import StorageManager
-from config import ALLOWED_EXTENSIONS, MAX_FILE_SIZE, STORAGE_PATH
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQuery,
+    InlineQueryResultCachedDocument, InlineQueryResultsButton
+)
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+from storage_manager import StorageManager, is_safe_filename
+from storage_backends import create_backend
+from preview_manager import PreviewManager
+from media_optimizer import MediaOptimizer
+from popularity import PopularityTracker, WarmCache
+from ranking import Ranker, RankingWeights
+from inline_search import Debouncer, InlineSearchCache
+from storage_maintenance import StorageMaintenance
+from cold_storage import ColdStorage
+from storage_watcher import StorageWatcher
+from request_control import RateLimiter, SingleFlight
+from loop_monitor import LoopMonitor
+from folder_registry import DEFAULT_FOLDERS, FolderRegistry, sanitize_folder_name
+from catalog_snapshot import CatalogSnapshot
+from broadcast import BroadcastEngine
+from coaccess import FETCH, SEARCH, AccessLog, CoAccessIndex
+from analytics import Analytics
+from spelling import SpellCorrector
+from acl import FULL, READ, AccessControl, AccessView
+from storage_snapshots import SnapshotStore
+from media_groups import MediaGroupSender
+from import_files import take_import_notices
+from config import (
+    ALLOWED_EXTENSIONS, MAX_FILE_SIZE, STORAGE_PATH,
+    STORAGE_BACKEND, S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION, S3_MULTIPART_MB, S3_MAX_CONNECTIONS,
+    REMOTE_CACHE_MB,
+    ENABLE_PREVIEWS, PREVIEW_WORKERS, PREVIEW_MAX_DIMENSION,
+    ENABLE_MEDIA_OPTIMIZATION, OPTIMIZER_WORKERS, OPTIMIZER_MIN_SAVINGS,
+    POPULARITY_HALF_LIFE_HOURS, POPULARITY_PERSIST_SECONDS, PERSISTENCE_PATH,
+    WARM_CACHE_BYTES, WARM_CACHE_MAX_FILE_BYTES,
+    WARM_TIER_SIZE, WARM_TIER_REFRESH_SECONDS, SEND_ALL_MAX_FILES, ALBUM_CHAT_INTERVAL_SECONDS, ALBUM_MAX_PARALLEL,
+    RANKING_WEIGHT_POSITION, RANKING_WEIGHT_TOKEN_OVERLAP, RANKING_WEIGHT_RECENCY,
+    RANKING_WEIGHT_POPULARITY, RANKING_RECENCY_HALF_LIFE_DAYS,
+    INLINE_DEBOUNCE_SECONDS, INLINE_CACHE_TIME, INLINE_RESULT_TTL_SECONDS, INLINE_MAX_CANDIDATES,
+    FOLDER_QUOTA_MB, GLOBAL_QUOTA_MB, STORAGE_MAINTENANCE_INTERVAL_SECONDS, TEMP_FILE_MAX_AGE_SECONDS,
+    COLD_TIER_AFTER_DAYS, COLD_TIER_CHECK_INTERVAL_SECONDS, COLD_PACK_MAX_MB, COLD_COMPRESSION_LEVEL,
+    SNAPSHOT_INTERVAL_SECONDS, SNAPSHOT_KEEP_LAST, SNAPSHOT_KEEP_DAILY,
+    ENABLE_STORAGE_WATCHER, STORAGE_WATCHER_DEBOUNCE_SECONDS, STORAGE_WATCHER_POLL_SECONDS,
+    IMPORT_NOTICE_CHECK_SECONDS,
+    RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST,
+    LOOP_LAG_THRESHOLD_SECONDS, SLOW_HANDLER_SECONDS, PROFILE_MAX_SECONDS,
+    LOCAL_BOT_API_URL, LOCAL_BOT_API_INGEST,
+    FOLDER_REGISTRY_PATH, ADMIN_USER_IDS, ADMIN_BOOTSTRAP_USERNAMES, ACL_PATH, CATALOG_SNAPSHOT_PATH, CATALOG_SNAPSHOT_INTERVAL_SECONDS,
+    CATALOG_DRIFT_CHECK_INTERVAL_SECONDS,
+    BROADCAST_DB_PATH, BROADCAST_DEBOUNCE_SECONDS, BROADCAST_MAX_DELAY_SECONDS,
+    BROADCAST_RATE_PER_SECOND, BROADCAST_CHAT_INTERVAL_SECONDS,
+    ACCESS_LOG_PATH, ACCESS_LOG_MAX_MB, COACCESS_REFRESH_SECONDS, COACCESS_SESSION_MINUTES,
+    RECOMMENDATIONS_SHOWN,
+    ANALYTICS_DB_PATH, ANALYTICS_BUFFER_SIZE, ANALYTICS_FLUSH_SECONDS, ANALYTICS_RAW_RETENTION_DAYS
+)
 
 logger = logging.getLogger(__name__)
 
-def sanitize_folder_name(folder_name: str) -> str:
-    """Sanitize folder name to prevent path traversal."""
-    # Remove any path separators and spaces, preserve more characters
-    sanitized = "".join(c for c in folder_name if c.isalnum() or c in "-_@()")
-    logger.debug(f"Sanitizing folder name: '{folder_name}' -> '{sanitized}'")
-    return sanitized
-
-# Initialize storage with the configured path
-logger.info(f"Initializing StorageManager with path: {STORAGE_PATH}")
-if not os.path.exists(STORAGE_PATH):
-    os.makedirs(STORAGE_PATH, exist_ok=True)
-    logger.info(f"Created storage base path: {STORAGE_PATH}")
-
-storage = StorageManager(STORAGE_PATH)
-
-# Initialize storage and predefined folders
-PREDEFINED_FOLDERS = [
-    "GK-CA (1-Y) STATIC",
-    "GMB New (2025)",
-    "CLAT Gc Material",
-    "Case Laws & Judgments",
-    "CLAT Notification & Updates",
-    "English Language",
-    "Extra Resources",
-    "Group Study & Discussion Notes",
-    "Legal Maxims & Terms",
-    "Legal Reasoning",
-    "Logical Reasoning",
-    "Mock Tests",
-    "NLU Information",
-    "Notes & Summaries",
-    "Quants (Maths)",
-    "Syllabus & Strategy",
-    "Time Management & Study Planner",
-    "Video Lectures & PDFs"
-]
+# Telegram allows at most 50 results per inline answer
+INLINE_MAX_RESULTS = 50
+
+# Services are built per process by init_services(), never at import time, so
+# the ingress process of worker mode stays a thin update router. Exactly one
+# process (the single process, or worker 0) is the leader and runs the
+# storage-wide work: the watcher, broadcasts and maintenance jobs.
+_leader = False
+storage = catalog = previews = optimizer = None
+popularity = warm_cache = speller = inline_cache = inline_debouncer = None
+maintenance = cold_storage = snapshots = storage_watcher = None
+search_flight = send_flight = rate_limiter = loop_monitor = None
+folder_registry = acl = broadcaster = access_log = coaccess = analytics = album_sender = None
+
+def is_leader() -> bool:
+    """Check whether this process runs the storage-wide background work."""
+    return _leader
+
+async def _inline_search(query: str, view: Optional[AccessView]) -> Tuple[List[Tuple[str, str]], bool]:
+    """Search storage for inline mode off the event loop; returns (matches, whether the list is complete).
+
+    Files the view may not read are skipped before the candidates are cut off.
+    Partial queries typed into inline mode are not recorded as search history.
+    """
+    search_results = await asyncio.to_thread(storage.search_files, query, per_page=INLINE_MAX_CANDIDATES,
+                                             include_similar=False, record_history=False, view=view)
+    return search_results['results'], search_results['total_count'] <= INLINE_MAX_CANDIDATES
+
+def compose_new_files_notice(folder_name: str, filenames: List[str]) -> Tuple[str, Optional[str]]:
+    """Build the notification for new files, reusing the file id of a single known upload."""
+    entry = folder_registry.by_folder(folder_name)
+    title = entry.name if entry else folder_name
+    number = entry.number if entry else None
+    # Subscribers are chats, so names of locked files are never broadcast
+    public = acl.view(None)
+    visible = [filename for filename in filenames if public.can_read(folder_name, filename)]
+    shown = "\n".join(f"📄 {filename}" for filename in visible[:10])
+    more = f"\n➕ and {len(visible) - 10} more" if len(visible) > 10 else ""
+    if len(visible) < len(filenames):
+        more += f"\n🔒 {len(filenames) - len(visible)} restricted"
+    hint = f"\n\n💡 /get {number} all – View folder\n🔕 /unsubscribe {number} – Stop alerts" if number else ""
+    text = (
+        f"🔔 𝗡𝗲𝘄 𝗶𝗻 📂 {title}\n"
+        "════════════════\n"
+        f"{shown}{more}{hint}"
+    )
+    file_id = warm_cache.peek_file_id(folder_name, visible[0]) if len(visible) == len(filenames) == 1 else None
+    return text, file_id
 
 def initialize_folders():
-    """Initialize all predefined folders."""
-    logger.info(f"Initializing predefined folders in {storage.base_path}")
+    """Create the directory of every registered folder and register unknown directories."""
+    logger.info(f"Initializing registered folders in {storage.base_path}")
 
     # Verify base path exists
     if not os.path.exists(storage.base_path):
         os.makedirs(storage.base_path, exist_ok=True)
         logger.info(f"Created base storage directory: {storage.base_path}")
 
-    # Create all predefined folders
-    for folder in PREDEFINED_FOLDERS:
+    # Create all registered folders
+    for entry in folder_registry.entries():
+        folder = entry.name
         try:
-            sanitized_folder = sanitize_folder_name(folder)
+            sanitized_folder = entry.folder
             folder_path = os.path.join(storage.base_path, sanitized_folder)
-            if not os.path.exists(folder_path):
-                os.makedirs(folder_path, exist_ok=True)
+            if not storage.folder_exists(sanitized_folder):
+                storage.create_folder(sanitized_folder)
                 logger.info(f"Created folder: {folder_path}")
             else:
                 logger.info(f"Folder already exists: {folder_path}")
-
-            # Debug: List contents to verify
-            if os.path.exists(folder_path):
-                logger.debug(f"Verified folder exists at: {folder_path}")
-                logger.debug(f"Folder contents: {os.listdir(folder_path)}")
         except Exception as e:
             logger.error(f"Error creating folder {folder}: {str(e)}", exc_info=True)
             raise
 
-# Add debug logging after initialization
-logger.info("Starting folder initialization...")
-initialize_folders()
-logger.info("Folder initialization complete")
-logger.debug(f"All folders in storage: {os.listdir(STORAGE_PATH)}")
-
-# Developer usernames both with and without @ symbol
-DEVELOPER_USERNAMES = ['CV_Owner', '@CV_Owner', 'Ace_Clat', '@Ace_Clat']
+    # Directories created before the registry existed get the next free numbers
+    for entry in folder_registry.adopt(storage.list_folders()):
+        logger.info(f"Registered existing folder '{entry.folder}' as number {entry.number}")
+
+def init_services(leader: bool = True) -> None:
+    """Build the storage stack and every service of this process (call once before handling updates)."""
+    global _leader, storage, catalog, previews, optimizer, popularity, warm_cache, speller
+    global inline_cache, inline_debouncer, maintenance, cold_storage, snapshots, storage_watcher
+    global search_flight, send_flight, rate_limiter, loop_monitor, folder_registry, acl
+    global broadcaster, access_log, coaccess, analytics, album_sender
+    _leader = leader
+
+    # Initialize storage with the configured path
+    logger.info(f"Initializing StorageManager with path: {STORAGE_PATH}")
+    if not os.path.exists(STORAGE_PATH):
+        os.makedirs(STORAGE_PATH, exist_ok=True)
+        logger.info(f"Created storage base path: {STORAGE_PATH}")
+
+    storage = StorageManager(STORAGE_PATH, backend=create_backend(
+        STORAGE_BACKEND, STORAGE_PATH, bucket=S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL,
+        region_name=S3_REGION, part_size=int(S3_MULTIPART_MB * 1024 * 1024), max_pool_connections=S3_MAX_CONNECTIONS
+    ))
+
+    # Listings are served from the mapped catalog until a folder changes
+    catalog = CatalogSnapshot(CATALOG_SNAPSHOT_PATH)
+    catalog.attach(storage)
+
+    # Background preview generation for newly stored files
+    previews = None
+    if ENABLE_PREVIEWS and storage.is_local:
+        previews = PreviewManager(STORAGE_PATH, max_workers=PREVIEW_WORKERS, max_dimension=PREVIEW_MAX_DIMENSION)
+        previews.attach(storage)
+
+    # Optional compression of uploads; smaller variants are served by default
+    optimizer = None
+    if ENABLE_MEDIA_OPTIMIZATION and storage.is_local:
+        optimizer = MediaOptimizer(STORAGE_PATH, max_workers=OPTIMIZER_WORKERS, min_savings=OPTIMIZER_MIN_SAVINGS)
+        optimizer.attach(storage)
+
+    # Access counters (shared by all processes through the state database) and the
+    # warm tier of hot files (Telegram ids, also shared through the database, and small file bytes)
+    popularity = PopularityTracker(half_life_seconds=POPULARITY_HALF_LIFE_HOURS * 3600, db_path=PERSISTENCE_PATH)
+    warm_cache = WarmCache(popularity, max_bytes=WARM_CACHE_BYTES, max_file_bytes=WARM_CACHE_MAX_FILE_BYTES,
+                           db_path=PERSISTENCE_PATH)
+    warm_cache.attach(storage)
+
+    # Rank search results by match quality, recency and popularity
+    storage.ranker = Ranker(
+        RankingWeights(
+            position=RANKING_WEIGHT_POSITION,
+            token_overlap=RANKING_WEIGHT_TOKEN_OVERLAP,
+            recency=RANKING_WEIGHT_RECENCY,
+            popularity=RANKING_WEIGHT_POPULARITY,
+            recency_half_life_days=RANKING_RECENCY_HALF_LIFE_DAYS
+        ),
+        popularity=popularity.score
+    )
 
-def is_developer(username: str) -> bool:
-    """Check if the user is a developer."""
-    if not username:
-        logger.debug("No username provided for developer check")
+    # Misspelled query words are corrected against the words in stored filenames
+    speller = SpellCorrector()
+    speller.attach(storage)
+
+    inline_cache = InlineSearchCache(_inline_search, ttl_seconds=INLINE_RESULT_TTL_SECONDS, correct=speller.correct)
+    inline_debouncer = Debouncer(INLINE_DEBOUNCE_SECONDS)
+    storage.add_listener(lambda event, folder_name, filename: inline_cache.clear())
+    # Frozen result orders are rebuilt once the files they rank change
+    storage.add_listener(lambda event, folder_name, filename: storage.ranker.clear_orders())
+
+    # Quotas and periodic garbage collection of temp files and trash
+    storage.folder_quota_bytes = int(FOLDER_QUOTA_MB * 1024 * 1024)
+    storage.global_quota_bytes = int(GLOBAL_QUOTA_MB * 1024 * 1024)
+    maintenance = StorageMaintenance(storage, popularity, temp_max_age_seconds=TEMP_FILE_MAX_AGE_SECONDS,
+                                     remote_cache_bytes=int(REMOTE_CACHE_MB * 1024 * 1024))
+
+    # Compressed cold tier; archived files stay listed and are restored on first access
+    cold_storage = ColdStorage(storage, max_pack_bytes=int(COLD_PACK_MAX_MB * 1024 * 1024),
+                               compression_level=COLD_COMPRESSION_LEVEL)
+    if storage.is_local:
+        cold_storage.attach(storage)
+
+    # Incremental hardlink snapshots; /restore brings back deleted folders and files
+    snapshots = SnapshotStore(storage, keep_last=SNAPSHOT_KEEP_LAST, keep_daily=SNAPSHOT_KEEP_DAILY)
+
+    # Picks up files rsynced straight into storage/ without rescanning folders; one watcher is enough
+    storage_watcher = None
+    if leader and ENABLE_STORAGE_WATCHER and storage.is_local:
+        storage_watcher = StorageWatcher(storage, debounce_seconds=STORAGE_WATCHER_DEBOUNCE_SECONDS,
+                                         poll_interval=STORAGE_WATCHER_POLL_SECONDS)
+
+    # Identical concurrent searches and sends share one computation and one upload
+    search_flight = SingleFlight()
+    send_flight = SingleFlight()
+    rate_limiter = RateLimiter(rate_per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST)
+
+    # Event-loop lag and slow-handler monitoring, plus on-demand profiling via /profile
+    loop_monitor = LoopMonitor(lag_threshold=LOOP_LAG_THRESHOLD_SECONDS, slow_handler_threshold=SLOW_HANDLER_SECONDS)
+
+    # Numbered folder list; /addfolder and /kickfolder update it without a restart
+    folder_registry = FolderRegistry(FOLDER_REGISTRY_PATH, defaults=DEFAULT_FOLDERS)
+    folder_registry.attach(storage)
+
+    # Folder and file locks with per-user grants; searches and listings apply them as they scan
+    acl = AccessControl(ACL_PATH, admin_ids=ADMIN_USER_IDS, bootstrap_usernames=ADMIN_BOOTSTRAP_USERNAMES)
+
+    # Subscribers hear about new files in their folders instead of polling /list
+    broadcaster = BroadcastEngine(storage, BROADCAST_DB_PATH, compose_new_files_notice,
+                                  debounce_seconds=BROADCAST_DEBOUNCE_SECONDS,
+                                  max_delay_seconds=BROADCAST_MAX_DELAY_SECONDS,
+                                  rate_per_second=BROADCAST_RATE_PER_SECOND,
+                                  per_chat_interval=BROADCAST_CHAT_INTERVAL_SECONDS)
+    broadcaster.attach(storage)
+
+    # Searches and downloads feed a co-access index rebuilt incrementally in the background
+    access_log = AccessLog(ACCESS_LOG_PATH, max_bytes=int(ACCESS_LOG_MAX_MB * 1024 * 1024))
+    coaccess = CoAccessIndex(ACCESS_LOG_PATH, session_gap=COACCESS_SESSION_MINUTES * 60)
+    coaccess.attach(storage)
+
+    # Usage events from handlers; /analytics reads only the rollups
+    analytics = Analytics(ANALYTICS_DB_PATH, capacity=ANALYTICS_BUFFER_SIZE,
+                          raw_retention_days=ANALYTICS_RAW_RETENTION_DAYS)
+
+    # Several matches go out as albums, reusing file ids Telegram already has
+    album_sender = MediaGroupSender(resolve_serving_path, warm_cache, max_parallel=ALBUM_MAX_PARALLEL,
+                                    chat_interval=ALBUM_CHAT_INTERVAL_SECONDS, local_mode=bool(LOCAL_BOT_API_URL))
+
+    logger.info("Starting folder initialization...")
+    initialize_folders()
+    logger.info("Folder initialization complete")
+
+def is_developer(user) -> bool:
+    """Check if a Telegram user is an admin (by user ID)."""
+    if user is None:
         return False
-    # Remove @ symbol if present for comparison
-    clean_username = username.lstrip('@')
-    is_dev = clean_username in [name.lstrip('@') for name in DEVELOPER_USERNAMES]
-    logger.debug(f"Developer check for username '{username}' (cleaned: '{clean_username}'): {is_dev}")
+    is_dev = acl.is_admin(user.id, user.username)
+    logger.debug(f"Developer check for user {user.id} (@{user.username}): {is_dev}")
     return is_dev
 
+def access_for(user) -> AccessView:
+    """Return the cached effective permissions of a Telegram user."""
+    return acl.view(user.id, user.username) if user else acl.view(None)
+
+async def locked_message(message) -> None:
+    """Tell a user that a folder or file is locked for them."""
+    await message.reply_text(
+        "🔒 𝗟𝗼𝗰𝗸𝗲𝗱\n"
+        "════════════════\n\n"
+        "💡 This folder is restricted. Ask an admin to /share it with you.\n"
+        "════════════════"
+    )
+
 async def unauthorized_message(update: Update) -> None:
     """Send unauthorized access message."""
     logger.debug(f"Unauthorized access attempt by user: {update.effective_user.username}")
@@ -127,23 +324,891 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "𝗙𝗼𝗿 𝗺𝗼𝗿𝗲 𝗱𝗲𝘁𝗮𝗶𝗹𝘀 ,𝗧𝘆𝗽𝗲 /help 🚀"
     )
 
+# ((registry version, ACL version), keyboard) of the last folder keyboard built
+_folder_keyboard_cache: Tuple[Optional[Tuple[int, int]], Optional[InlineKeyboardMarkup]] = (None, None)
+
 async def get_folder_keyboard():
     """Create an inline keyboard with folder buttons in a two-column grid."""
+    global _folder_keyboard_cache
+    entries = folder_registry.entries()
+    version = (folder_registry.version, acl.version)
+    if _folder_keyboard_cache[0] == version:
+        return _folder_keyboard_cache[1]
+
     keyboard = []
     row = []
-    for i, folder in enumerate(PREDEFINED_FOLDERS):
-        sanitized_name = sanitize_folder_name(folder)
+    for i, entry in enumerate(entries):
         # Add number, folder emoji and arrow for better visibility
-        button_text = f"{i+1}. 📁 {folder} →"
+        icon = "🔒" if acl.is_locked(entry.folder) else "📁"
+        button_text = f"{entry.number}. {icon} {entry.name} →"
         # Use sanitized name in callback data
-        row.append(InlineKeyboardButton(button_text, callback_data=f"folder_{sanitized_name}"))
+        row.append(InlineKeyboardButton(button_text, callback_data=f"folder_{entry.folder}"))
 
         # Create rows with 2 buttons each
-        if len(row) == 2 or i == len(PREDEFINED_FOLDERS) - 1:
+        if len(row) == 2 or i == len(entries) - 1:
             keyboard.append(row)
             row = []
 
-    return InlineKeyboardMarkup(keyboard)
+    markup = InlineKeyboardMarkup(keyboard)
+    _folder_keyboard_cache = (version, markup)
+    return markup
+
+# Maximum number of pagination cursors remembered per chat
+MAX_PAGINATION_CURSORS = 50
+
+def remember_pagination(context: ContextTypes.DEFAULT_TYPE, message_id: int,
+                        folder_name: str, query: str, page: int) -> None:
+    """Store the pagination cursor of a results message in chat_data."""
+    if context.chat_data is None:
+        return
+    cursors = context.chat_data.setdefault('pagination', {})
+    cursors.pop(message_id, None)
+    cursors[message_id] = {'folder': folder_name, 'query': query, 'page': page}
+    while len(cursors) > MAX_PAGINATION_CURSORS:
+        cursors.pop(next(iter(cursors)))
+
+async def rate_limit_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Drop updates from users over their rate limit before any handler runs.
+
+    Inline queries arrive on every keystroke, so they are charged by
+    answer_inline_query once the debounced search runs, not here.
+    """
+    user = update.effective_user
+    if not user or is_developer(user) or update.inline_query:
+        return
+    if rate_limiter.allow(user.id):
+        context.user_data.pop('rate_limit_notified', None)
+        return
+
+    retry_after = rate_limiter.retry_after(user.id)
+    logger.info(f"Rate limited user {user.id}; retry in {retry_after:.0f}s")
+    if update.callback_query:
+        await update.callback_query.answer(f"⏳ Too many requests. Try again in {retry_after:.0f}s.")
+    elif update.message and not context.user_data.get('rate_limit_notified'):
+        # Warn once per burst instead of answering every flooded message
+        context.user_data['rate_limit_notified'] = True
+        await update.message.reply_text(
+            "⏳ 𝗦𝗹𝗼𝘄 𝗗𝗼𝘄𝗻\n"
+            "════════════════\n\n"
+            f"💡 Too many requests. Please try again in {retry_after:.0f}s.\n"
+            "════════════════"
+        )
+    raise ApplicationHandlerStop
+
+async def restore_persisted_state(application) -> None:
+    """Reattach persisted state to in-memory services after startup."""
+    storage.search_history = application.bot_data.setdefault('search_history', storage.search_history)
+    logger.info(f"Restored {len(storage.search_history)} search history entries")
+
+def resolve_serving_path(folder_name: str, filename: str) -> Tuple[str, str]:
+    """Return (path, filename) of what should be sent for a stored file."""
+    variant = optimizer.get_variant(folder_name, filename) if optimizer else None
+    if variant:
+        return variant
+    return storage.get_file_path(folder_name, filename), filename
+
+async def _upload_document(message, folder_name: str, filename: str, cached) -> Optional[str]:
+    """Upload a stored file to a chat and return the Telegram file_id it got."""
+    # Off the event loop: an archived file is decompressed here
+    file_path, send_name = await asyncio.to_thread(resolve_serving_path, folder_name, filename)
+    if LOCAL_BOT_API_URL:
+        # The local server reads the file itself; nothing passes through this process
+        sent = await message.reply_document(document=Path(file_path), filename=send_name)
+    elif cached and cached.content is not None:
+        sent = await message.reply_document(document=cached.content, filename=send_name)
+    else:
+        with open(file_path, 'rb') as f:
+            sent = await message.reply_document(
+                document=f,
+                filename=send_name
+            )
+    if sent and sent.document:
+        warm_cache.remember_file_id(folder_name, filename, sent.document.file_id)
+        return sent.document.file_id
+    return None
+
+async def store_upload(bot, file_id: str, folder_name: str, filename: str) -> None:
+    """Fetch an uploaded file from Telegram and save it in a folder.
+
+    Through a local Bot API server the file already sits on disk, so it is
+    hardlinked (or moved) into storage instead of being downloaded.
+    """
+    started = time.monotonic()
+    file_obj = await bot.get_file(file_id)
+    if not file_obj:
+        raise ValueError("Could not get file from Telegram")
+    if LOCAL_BOT_API_URL and file_obj.file_path and os.path.isabs(file_obj.file_path):
+        await storage.ingest_file_async(folder_name, filename, file_obj.file_path,
+                                        move=LOCAL_BOT_API_INGEST == "move")
+    else:
+        destination = io.BytesIO()
+        await file_obj.download_to_memory(destination)
+        if not destination.getvalue():
+            raise ValueError("Could not download file content")
+        await storage.save_file_async(folder_name, filename, destination.getvalue())
+    await asyncio.to_thread(broadcaster.announce, folder_name, [filename])
+    analytics.emit("upload", folder_name, filename, time.monotonic() - started, file_obj.file_size or 0)
+
+async def send_stored_document(message, folder_name: str, filename: str) -> None:
+    """Send the full stored file as a document and record the download."""
+    started = time.monotonic()
+    ok = False
+    try:
+        await _deliver_stored_document(message, folder_name, filename)
+        ok = True
+    finally:
+        size = storage.file_entries(folder_name).get(filename, (0, 0))[0] if ok else 0
+        analytics.emit("download", folder_name, filename, time.monotonic() - started, size, ok)
+
+async def _deliver_stored_document(message, folder_name: str, filename: str) -> None:
+    """Send the full stored file as a document, reusing warm-tier data when possible.
+
+    Concurrent sends of the same file wait for a single upload and then send
+    the file_id it produced.
+    """
+    popularity.record(folder_name, filename)
+    access_log.record(FETCH, message.chat_id, [(folder_name, filename)])
+    cached = warm_cache.lookup(folder_name, filename)
+    if cached and cached.file_id:
+        try:
+            await message.reply_document(document=cached.file_id)
+            return
+        except TelegramError as e:
+            logger.warning(f"Cached file id for {folder_name}/{filename} failed, re-uploading: {str(e)}")
+            warm_cache.forget_file_id(folder_name, filename)
+
+    key = (folder_name, filename)
+    follower = send_flight.in_flight(key)
+    try:
+        file_id, shared = await send_flight.do(
+            key, lambda: _upload_document(message, folder_name, filename, cached)
+        )
+    except TelegramError:
+        if not follower:
+            raise
+        # The shared upload failed in another chat; upload to this one directly
+        await _upload_document(message, folder_name, filename, cached)
+        return
+    if shared:
+        if file_id:
+            await message.reply_document(document=file_id)
+        else:
+            await _upload_document(message, folder_name, filename, cached)
+
+async def send_all_matches(message, files: List[Tuple[str, str]]) -> int:
+    """Send files as albums of up to 10 documents and record the downloads; returns how many were sent."""
+    started = time.monotonic()
+    for folder_name, filename in files:
+        popularity.record(folder_name, filename)
+    access_log.record(FETCH, message.chat_id, files)
+    sent = await album_sender.send(message, files)
+    latency = (time.monotonic() - started) / max(1, len(files))
+    for folder_name, filename in files[:sent]:
+        size = storage.file_entries(folder_name).get(filename, (0, 0))[0]
+        analytics.emit("download", folder_name, filename, latency, size)
+    return sent
+
+def send_all_rows(total_count: int) -> List[List[InlineKeyboardButton]]:
+    """Keyboard row offering to send every match at once, when there is more than one."""
+    if total_count < 2:
+        return []
+    shown = min(total_count, SEND_ALL_MAX_FILES)
+    return [[InlineKeyboardButton(f"📥 Send All ({shown})", callback_data="sendall")]]
+
+async def coalesced_search(query: str, folder_name: Optional[str] = None, page: int = 1,
+                           chat_id: Optional[int] = None, view: Optional[AccessView] = None) -> Dict[str, Any]:
+    """Search off the event loop, sharing the work with identical concurrent searches.
+
+    Users whose access views have the same key see the same results, so they share searches too.
+    """
+    search_results, _ = await search_flight.do(
+        (query, folder_name, page, view.key if view else None),
+        lambda: asyncio.to_thread(storage.search_files, query, folder_name, page=page,
+                                  record_history=False, view=view)
+    )
+    storage.record_search(query, search_results['results'], search_results['similar_files'])
+    if chat_id is not None and query:
+        shown = [(folder_name, result) if folder_name else tuple(result) for result in search_results['results'][:3]]
+        access_log.record(SEARCH, chat_id, shown, query=query)
+    return search_results
+
+def recommendations_for(folder_name: str, filename: str,
+                        view: Optional[AccessView] = None) -> List[Tuple[str, str]]:
+    """Return files often fetched together with this one that still exist (and the user may read)."""
+    related = []
+    for (other_folder, other_name), _ in coaccess.neighbours(folder_name, filename):
+        if view is not None and not view.can_read(other_folder, other_name):
+            continue
+        try:
+            if other_name in storage.file_entries(other_folder):
+                related.append((other_folder, other_name))
+        except FileNotFoundError:
+            continue
+        if len(related) >= RECOMMENDATIONS_SHOWN:
+            break
+    return related
+
+async def reply_recommendations(message, folder_name: str, filename: str,
+                                view: Optional[AccessView] = None) -> None:
+    """Follow a sent file with what other students fetched alongside it, if anything."""
+    related = recommendations_for(folder_name, filename, view)
+    if not related:
+        return
+    lines = []
+    for other_folder, other_name in related:
+        entry = folder_registry.by_folder(other_folder)
+        lines.append(f"• 📄 {other_name} (📂 {entry.name if entry else other_folder})")
+    await message.reply_text(
+        "👥 𝗦𝘁𝘂𝗱𝗲𝗻𝘁𝘀 𝗮𝗹𝘀𝗼 𝗳𝗲𝘁𝗰𝗵𝗲𝗱:\n" + "\n".join(lines) + "\n════════════════"
+    )
+
+async def send_stored_file(message, folder_name: str, filename: str) -> None:
+    """Send a stored file, leading with a small preview when one is cached."""
+    preview = previews.get_preview(folder_name, filename) if previews else None
+    if not preview:
+        await send_stored_document(message, folder_name, filename)
+        return
+
+    token, preview_path = preview
+    keyboard = [[InlineKeyboardButton("📥 Download Full", callback_data=f"dl_{token}")]]
+    with open(preview_path, 'rb') as f:
+        await message.reply_photo(
+            photo=f,
+            caption=f"👀 𝗣𝗿𝗲𝘃𝗶𝗲𝘄: {filename}\n💡 Tap below to download the full file",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+
+def _read_file_bytes(file_path: str) -> bytes:
+    """Read a whole file (used off the event loop)."""
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+async def refresh_warm_tier(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Fold pending accesses into popularity scores and preload hot small files."""
+    popularity.drain()
+    for (folder_name, filename), _ in popularity.top(WARM_TIER_SIZE):
+        if warm_cache.has_content(folder_name, filename):
+            continue
+        try:
+            # Taken before reading, so bytes of a file changed meanwhile are discarded on lookup
+            version = (await asyncio.to_thread(storage.file_entries, folder_name)).get(filename)
+            file_path, _ = await asyncio.to_thread(resolve_serving_path, folder_name, filename)
+            if os.path.getsize(file_path) > warm_cache.max_file_bytes:
+                continue
+            content = await asyncio.to_thread(_read_file_bytes, file_path)
+        except (FileNotFoundError, ValueError) as e:
+            logger.debug(f"Skipping warm tier load of {folder_name}/{filename}: {str(e)}")
+            continue
+        if version:
+            warm_cache.store_content(folder_name, filename, content, version)
+
+async def persist_access_state(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Merge this process's access counts and Telegram file ids into the state database off the event loop."""
+    await asyncio.to_thread(popularity.persist)
+    await asyncio.to_thread(warm_cache.persist)
+
+async def run_storage_maintenance(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Collect garbage and check quotas off the event loop."""
+    await asyncio.to_thread(maintenance.run)
+
+async def migrate_cold_files(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Move long-unused files into the compressed cold tier off the event loop."""
+    popularity.drain()
+    await asyncio.to_thread(cold_storage.archive_idle, COLD_TIER_AFTER_DAYS * 86400, popularity.last_access)
+
+async def take_storage_snapshot(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Snapshot the storage tree and apply the retention policy off the event loop."""
+    await asyncio.to_thread(snapshots.create)
+    await asyncio.to_thread(snapshots.prune)
+
+async def save_catalog_snapshot(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Rewrite the catalog snapshot off the event loop when listings changed."""
+    if catalog.dirty:
+        await asyncio.to_thread(catalog.write, storage)
+
+async def check_catalog_drift(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Rescan storage/ in the background and repair listings that drifted from disk."""
+    drift = await asyncio.to_thread(catalog.find_drift, storage)
+    for folder_name, changes in drift.items():
+        logger.warning(f"Catalog drift in folder '{folder_name}': {len(changes)} files differ from disk")
+        storage.apply_external_changes(folder_name, changes)
+
+async def apply_import_notices(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Announce files import_files.py copied into storage/ and, unless the watcher
+    already reported them, register them so listeners treat them as uploads."""
+    notices = await asyncio.to_thread(take_import_notices, storage)
+    for notice in notices:
+        for folder_name, filenames in notice.items():
+            if storage_watcher is None:
+                storage.register_files(folder_name, filenames)
+            await asyncio.to_thread(broadcaster.announce, folder_name, filenames)
+
+async def flush_analytics(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Write buffered usage events and their rollups off the event loop."""
+    await asyncio.to_thread(analytics.flush)
+
+async def refresh_coaccess(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Append logged accesses and fold them into the co-access index off the event loop."""
+    await asyncio.to_thread(access_log.flush)
+    await asyncio.to_thread(coaccess.update)
+
+def start_storage_watcher() -> None:
+    """Start watching storage/ for external changes (call from the running event loop)."""
+    if storage_watcher:
+        storage_watcher.start(asyncio.get_running_loop())
+
+def start_spelling_index() -> None:
+    """Index the words of all stored filenames in the background (call from the running event loop)."""
+    asyncio.get_running_loop().create_task(asyncio.to_thread(speller.rebuild, storage))
+
+def start_loop_monitor() -> None:
+    """Start measuring event-loop lag (call from the running event loop)."""
+    loop_monitor.start()
+
+def start_broadcasts(application) -> None:
+    """Start delivering new-file notifications, resuming any queued sends."""
+    broadcaster.start(application.bot)
+
+def setup_background_jobs(application) -> None:
+    """Schedule recurring jobs on the application's JobQueue.
+
+    Every process flushes its own buffers and refreshes its own warm tier;
+    only the leader runs the jobs that act on the shared storage tree.
+    """
+    if application.job_queue is None:
+        logger.warning("JobQueue unavailable (install python-telegram-bot[job-queue]); background jobs disabled")
+        return
+    application.job_queue.run_repeating(refresh_warm_tier, interval=WARM_TIER_REFRESH_SECONDS, first=WARM_TIER_REFRESH_SECONDS)
+    application.job_queue.run_repeating(flush_analytics, interval=ANALYTICS_FLUSH_SECONDS, first=ANALYTICS_FLUSH_SECONDS)
+    application.job_queue.run_repeating(refresh_coaccess, interval=COACCESS_REFRESH_SECONDS, first=5)
+    application.job_queue.run_repeating(persist_access_state, interval=POPULARITY_PERSIST_SECONDS,
+                                        first=POPULARITY_PERSIST_SECONDS)
+    if not is_leader():
+        return
+    application.job_queue.run_repeating(run_storage_maintenance, interval=STORAGE_MAINTENANCE_INTERVAL_SECONDS, first=60)
+    if COLD_TIER_AFTER_DAYS > 0 and storage.is_local:
+        application.job_queue.run_repeating(migrate_cold_files, interval=COLD_TIER_CHECK_INTERVAL_SECONDS, first=300)
+    if SNAPSHOT_INTERVAL_SECONDS > 0 and storage.is_local:
+        application.job_queue.run_repeating(take_storage_snapshot, interval=SNAPSHOT_INTERVAL_SECONDS, first=120)
+    application.job_queue.run_repeating(save_catalog_snapshot, interval=CATALOG_SNAPSHOT_INTERVAL_SECONDS, first=10)
+    application.job_queue.run_repeating(check_catalog_drift, interval=CATALOG_DRIFT_CHECK_INTERVAL_SECONDS,
+                                        first=CATALOG_DRIFT_CHECK_INTERVAL_SECONDS)
+    if storage.is_local:
+        application.job_queue.run_repeating(apply_import_notices, interval=IMPORT_NOTICE_CHECK_SECONDS, first=15)
+
+def instrument_application(application) -> None:
+    """Time every handler for the loop monitor and count every update for /analytics."""
+    loop_monitor.instrument(application)
+    analytics.instrument(application)
+
+def _format_size(size: int) -> str:
+    """Format a byte count for display."""
+    return f"{size / (1024 * 1024):.1f}MB"
+
+async def storage_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show disk usage, quotas and archive candidates (developer only)."""
+    user = update.effective_user
+    if not is_developer(user):
+        await unauthorized_message(update)
+        return
+
+    popularity.drain()
+    usage = await asyncio.to_thread(storage.total_usage)
+    largest = await asyncio.to_thread(maintenance.largest_files, 5)
+    coldest = await asyncio.to_thread(maintenance.least_accessed_files, 5)
+    cold = await asyncio.to_thread(cold_storage.stats)
+    variants = await asyncio.to_thread(optimizer.get_metrics) if optimizer else None
+
+    folder_quota = f" / {_format_size(storage.folder_quota_bytes)}" if storage.folder_quota_bytes else ""
+    usage_lines = [f"• {folder}: {_format_size(used)}{folder_quota}"
+                   for folder, used in sorted(usage.items(), key=lambda item: item[1], reverse=True)]
+    global_quota = f" of {_format_size(storage.global_quota_bytes)}" if storage.global_quota_bytes else ""
+    largest_lines = [f"{i+1}. 📄 {filename} ({folder}) – {_format_size(size)}"
+                     for i, (folder, filename, size) in enumerate(largest)]
+    coldest_lines = [f"{i+1}. 📄 {filename} ({folder}) – {_format_size(size)}"
+                     f"{'' if last_access else ' – never fetched'}"
+                     for i, (folder, filename, size, last_access) in enumerate(coldest)]
+
+    await update.message.reply_text(
+        "💽 𝗦𝘁𝗼𝗿𝗮𝗴𝗲 𝗥𝗲𝗽𝗼𝗿𝘁\n"
+        "════════════════\n\n"
+        f"📊 Total: {_format_size(sum(usage.values()))}{global_quota}\n"
+        f"🗄 Cold tier: {cold['files']} files, {_format_size(cold['original_bytes'])} "
+        f"packed into {_format_size(cold['packed_bytes'])}\n"
+        + (f"🗜 Optimized: {variants['optimized_files']} files, {_format_size(variants['bytes_saved'])} saved\n"
+           if variants else "") + "\n"
+        "📂 𝗙𝗼𝗹𝗱𝗲𝗿𝘀:\n" + ("\n".join(usage_lines) or "No folders") + "\n\n"
+        "📦 𝗟𝗮𝗿𝗴𝗲𝘀𝘁 𝗙𝗶𝗹𝗲𝘀:\n" + ("\n".join(largest_lines) or "No files") + "\n\n"
+        "🧊 𝗟𝗲𝗮𝘀𝘁 𝗔𝗰𝗰𝗲𝘀𝘀𝗲𝗱:\n" + ("\n".join(coldest_lines) or "No files") + "\n"
+        "════════════════"
+    )
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Subscribe the chat to new-file notifications for a folder, or list its subscriptions."""
+    chat_id = update.effective_chat.id
+    if not context.args:
+        folders = await asyncio.to_thread(broadcaster.subscriptions, chat_id)
+        lines = []
+        for folder in folders:
+            entry = folder_registry.by_folder(folder)
+            lines.append(f"{entry.number}. 📂 {entry.name}" if entry else f"📂 {folder}")
+        await update.message.reply_text(
+            "🔔 𝗬𝗼𝘂𝗿 𝗦𝘂𝗯𝘀𝗰𝗿𝗶𝗽𝘁𝗶𝗼𝗻𝘀\n"
+            "════════════════\n\n"
+            + ("\n".join(lines) or "No subscriptions yet") + "\n\n"
+            "💡 /subscribe <folder_number> – Get notified of new files\n"
+            "🔕 /unsubscribe <folder_number|all> – Stop notifications\n"
+            "════════════════"
+        )
+        return
+
+    entry = folder_registry.by_number(int(context.args[0])) if context.args[0].isdigit() else None
+    if entry is None:
+        await update.message.reply_text(
+            "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗼𝗹𝗱𝗲𝗿 𝗡𝘂𝗺𝗯𝗲𝗿\n"
+            "════════════════\n\n"
+            f"💡 Please use a number between 1 and {folder_registry.highest_number()}\n"
+            "════════════════"
+        )
+        return
+
+    if not access_for(update.effective_user).can_read_folder(entry.folder):
+        await locked_message(update.message)
+        return
+
+    added = await asyncio.to_thread(broadcaster.subscribe, chat_id, entry.folder)
+    await update.message.reply_text(
+        (f"🔔 Subscribed to 📂 {entry.name}\n"
+         "💡 You'll get a message when new files are added.\n" if added
+         else f"ℹ️ Already subscribed to 📂 {entry.name}\n")
+        + "════════════════"
+    )
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Stop new-file notifications for one folder or all folders."""
+    chat_id = update.effective_chat.id
+    if not context.args:
+        await update.message.reply_text("💡 Usage: /unsubscribe <folder_number|all>\n════════════════")
+        return
+
+    if context.args[0].lower() == "all":
+        removed = await asyncio.to_thread(broadcaster.unsubscribe, chat_id)
+        await update.message.reply_text(f"🔕 Removed {removed} subscriptions\n════════════════")
+        return
+
+    entry = folder_registry.by_number(int(context.args[0])) if context.args[0].isdigit() else None
+    if entry is None:
+        await update.message.reply_text(
+            "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗼𝗹𝗱𝗲𝗿 𝗡𝘂𝗺𝗯𝗲𝗿\n"
+            "════════════════\n\n"
+            f"💡 Please use a number between 1 and {folder_registry.highest_number()}\n"
+            "════════════════"
+        )
+        return
+
+    removed = await asyncio.to_thread(broadcaster.unsubscribe, chat_id, entry.folder)
+    await update.message.reply_text(
+        (f"🔕 Unsubscribed from 📂 {entry.name}\n" if removed
+         else f"ℹ️ You were not subscribed to 📂 {entry.name}\n")
+        + "════════════════"
+    )
+
+async def broadcast_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show subscriber counts, queue depth and broadcast throughput (developer only)."""
+    user = update.effective_user
+    if not is_developer(user):
+        await unauthorized_message(update)
+        return
+
+    stats = await asyncio.to_thread(broadcaster.stats)
+    recent_lines = []
+    for broadcast_id, folder, total, sent, failed, created, finished in stats['recent']:
+        elapsed = (finished or time.time()) - created
+        state = "done" if finished else "sending"
+        recent_lines.append(f"#{broadcast_id} 📂 {folder}: {sent}/{total} sent, {failed} failed, "
+                            f"{elapsed:.0f}s ({state})")
+
+    await update.message.reply_text(
+        "📣 𝗕𝗿𝗼𝗮𝗱𝗰𝗮𝘀𝘁𝘀\n"
+        "════════════════\n\n"
+        f"👥 Subscribers: {stats['subscribers']}\n"
+        f"📬 Queued messages: {stats['queued']}\n"
+        f"⏳ Batches waiting: {stats['pending_batches']}\n"
+        f"🚀 Throughput (1 min): {stats['rate']:.1f} msg/s\n"
+        f"✅ Sent: {stats['sent']} | ❌ Failed: {stats['failed']}\n\n"
+        "🕘 𝗥𝗲𝗰𝗲𝗻𝘁:\n" + ("\n".join(recent_lines) or "No broadcasts yet") + "\n"
+        "════════════════"
+    )
+
+async def analytics_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show usage from the hourly and daily rollups (developer only)."""
+    user = update.effective_user
+    if not is_developer(user):
+        await unauthorized_message(update)
+        return
+
+    days = int(context.args[0]) if context.args and context.args[0].isdigit() else 7
+    await asyncio.to_thread(analytics.flush)
+    report = await asyncio.to_thread(analytics.report, days)
+
+    def folder_title(folder: str) -> str:
+        entry = folder_registry.by_folder(folder)
+        return entry.name if entry else folder
+
+    command_lines = [f"• {command}: {count} ({errors} failed), avg {latency_sum / count * 1000:.0f}ms, "
+                     f"max {latency_max * 1000:.0f}ms"
+                     for command, count, errors, latency_sum, latency_max in report['commands']]
+    folder_lines = [f"{i+1}. 📂 {folder_title(folder)} – {count} downloads, {_format_size(size)}"
+                    for i, (folder, count, size) in enumerate(report['folders'])]
+    file_lines = [f"{i+1}. 📄 {filename} ({folder_title(folder)}) – {count} downloads"
+                  for i, (folder, filename, count, _) in enumerate(report['files'])]
+    hourly = [count for _, count in report['hourly']]
+    peak = max(hourly, default=0)
+
+    await update.message.reply_text(
+        "📈 𝗔𝗻𝗮𝗹𝘆𝘁𝗶𝗰𝘀\n"
+        "════════════════\n\n"
+        f"🕘 Last 24h: {sum(hourly)} updates, peak {peak}/hour\n\n"
+        f"⌨️ 𝗖𝗼𝗺𝗺𝗮𝗻𝗱𝘀 ({days}d):\n" + ("\n".join(command_lines) or "No data") + "\n\n"
+        "📂 𝗧𝗼𝗽 𝗙𝗼𝗹𝗱𝗲𝗿𝘀:\n" + ("\n".join(folder_lines) or "No downloads") + "\n\n"
+        "📄 𝗧𝗼𝗽 𝗙𝗶𝗹𝗲𝘀:\n" + ("\n".join(file_lines) or "No downloads") + "\n"
+        "════════════════"
+    )
+
+async def hot_files(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the hottest files and their warm-tier hit rates (developer only)."""
+    user = update.effective_user
+    if not is_developer(user):
+        await unauthorized_message(update)
+        return
+
+    limit = int(context.args[0]) if context.args and context.args[0].isdigit() else 10
+    popularity.drain()
+    top = popularity.top(limit)
+    if not top:
+        await update.message.reply_text("🔥 No file downloads recorded yet.\n════════════════")
+        return
+
+    lines = []
+    for i, ((folder_name, filename), score) in enumerate(top):
+        cached_marker = " 💾" if warm_cache.has_content(folder_name, filename) else ""
+        lines.append(f"{i+1}. 🔥 {filename} (Folder: {folder_name})\n"
+                     f"    Score: {score:.1f} | Hit rate: {warm_cache.hit_rate(folder_name, filename):.0%}{cached_marker}")
+
+    await update.message.reply_text(
+        f"🔥 𝗛𝗼𝘁 𝗙𝗶𝗹𝗲𝘀 (𝗧𝗼𝗽 {len(top)})\n"
+        "════════════════\n\n"
+        + "\n".join(lines) +
+        f"\n\n📊 Overall hit rate: {warm_cache.hit_rate():.0%}\n"
+        f"💾 Warm tier: {warm_cache.used_bytes / (1024*1024):.1f}MB of {warm_cache.max_bytes / (1024*1024):.1f}MB\n"
+        "════════════════"
+    )
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show loop health, or profile live traffic for N seconds and send the report (developer only)."""
+    user = update.effective_user
+    if not is_developer(user):
+        await unauthorized_message(update)
+        return
+
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text(
+            "🩺 𝗟𝗼𝗼𝗽 𝗛𝗲𝗮𝗹𝘁𝗵\n"
+            "════════════════\n\n"
+            f"⏱ Lag p50 {loop_monitor.lag_percentile(50) * 1000:.1f}ms, "
+            f"p99 {loop_monitor.lag_percentile(99) * 1000:.1f}ms, max {loop_monitor.max_lag * 1000:.1f}ms\n"
+            f"🧱 Stalls: {loop_monitor.stalls}\n"
+            f"🐢 Slow handlers: {loop_monitor.slow_handlers}\n\n"
+            "💡 /profile <seconds> [sample] – Profile live traffic\n"
+            "════════════════"
+        )
+        return
+
+    seconds = min(int(context.args[0]), PROFILE_MAX_SECONDS)
+    mode = "sample" if len(context.args) > 1 and context.args[1].lower() == "sample" else "cprofile"
+    if loop_monitor.profiling:
+        await update.message.reply_text("⏳ A profile is already running.\n════════════════")
+        return
+
+    await update.message.reply_text(f"🔬 Profiling live traffic for {seconds}s ({mode})...\n════════════════")
+    report = await loop_monitor.profile(seconds, mode)
+    await update.message.reply_document(
+        document=io.BytesIO(report.encode()),
+        filename=f"profile-{mode}-{int(time.time())}.txt",
+        caption=f"🔬 Profile of {seconds}s ({mode})"
+    )
+
+async def _resolve_acl_target(update: Update, args: List[str], usage: str):
+    """Parse '<folder_number> ...' for the ACL commands; returns the folder entry and remaining args."""
+    entry = folder_registry.by_number(int(args[0])) if args and args[0].isdigit() else None
+    if entry is None:
+        await update.message.reply_text(
+            f"💡 Usage: {usage}\n"
+            f"🔍 Folder numbers run from 1 to {folder_registry.highest_number()}\n"
+            "════════════════"
+        )
+        return None, None
+    return entry, args[1:]
+
+async def _resolve_acl_file(update: Update, folder_name: str, args: List[str]) -> Optional[str]:
+    """Resolve a (partial) filename for the ACL commands, replying with the error if it fails."""
+    try:
+        return storage.resolve_filename(folder_name, " ".join(args))
+    except (FileNotFoundError, ValueError) as e:
+        await update.message.reply_text(f"❌ {str(e)}\n════════════════")
+        return None
+
+async def _set_lock(update: Update, context: ContextTypes.DEFAULT_TYPE, locked: bool) -> None:
+    """Lock or unlock a folder, or one file in it."""
+    if not is_developer(update.effective_user):
+        await unauthorized_message(update)
+        return
+    command = "/lock" if locked else "/unlock"
+    entry, rest = await _resolve_acl_target(update, context.args, f"{command} <folder_number> [filename]")
+    if entry is None:
+        return
+    filename = None
+    if rest:
+        filename = await _resolve_acl_file(update, entry.folder, rest)
+        if filename is None:
+            return
+
+    changed = await asyncio.to_thread(acl.set_locked, entry.folder, locked, filename)
+    target = f"📄 {filename} in 📂 {entry.name}" if filename else f"📂 {entry.name}"
+    if not changed:
+        text = f"ℹ️ {target} is already {'locked' if locked else 'unlocked'}\n"
+    elif locked:
+        text = f"🔒 Locked {target}\n💡 /share {entry.number} <user_id> – Give someone access\n"
+    else:
+        text = f"🔓 Unlocked {target}\n"
+    await update.message.reply_text(text + "════════════════")
+
+async def lock_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Restrict a folder or file to admins and the users it is shared with (developer only)."""
+    await _set_lock(update, context, True)
+
+async def unlock_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Lift a folder or file lock (developer only)."""
+    await _set_lock(update, context, False)
+
+async def _set_share(update: Update, context: ContextTypes.DEFAULT_TYPE, sharing: bool) -> None:
+    """Grant or revoke a user's access to a folder or file.
+
+    The user is given by numeric ID or by replying to one of their messages.
+    """
+    if not is_developer(update.effective_user):
+        await unauthorized_message(update)
+        return
+    command = "/share" if sharing else "/unshare"
+    usage = f"{command} <folder_number> <user_id> [{'rw|' if sharing else ''}filename]"
+    entry, rest = await _resolve_acl_target(update, context.args, usage)
+    if entry is None:
+        return
+
+    reply = update.message.reply_to_message
+    if rest and rest[0].isdigit():
+        user_id, rest = int(rest[0]), rest[1:]
+    elif reply and reply.from_user:
+        user_id = reply.from_user.id
+    elif sharing and not rest:
+        # No user given: show the folder's current rules
+        rules = await asyncio.to_thread(acl.describe, entry.folder)
+        grants = [f"👤 {uid}: {'read/write' if bits & FULL == FULL else 'read'}"
+                  for uid, bits in rules['grants'].items()]
+        files = [f"📄 {filename}: {', '.join(str(uid) for uid in uids) or 'admins only'}"
+                 for filename, uids in rules['files'].items()]
+        await update.message.reply_text(
+            f"{'🔒' if rules['locked'] else '📂'} 𝗔𝗰𝗰𝗲𝘀𝘀 𝘁𝗼 {entry.name}\n"
+            "════════════════\n\n"
+            + ("\n".join(grants + files) or "Open to everyone") + "\n\n"
+            f"💡 Usage: {usage}\n"
+            "════════════════"
+        )
+        return
+    else:
+        await update.message.reply_text(f"💡 Usage: {usage}\n════════════════")
+        return
+
+    bits = READ
+    filename = None
+    if sharing and rest and rest[0].lower() == "rw" and len(rest) == 1:
+        bits = FULL
+    elif rest:
+        filename = await _resolve_acl_file(update, entry.folder, rest)
+        if filename is None:
+            return
+
+    target = f"📄 {filename} in 📂 {entry.name}" if filename else f"📂 {entry.name}"
+    if sharing:
+        await asyncio.to_thread(acl.grant, entry.folder, user_id, bits, filename)
+        text = f"🤝 Shared {target} with {user_id} ({'read/write' if bits == FULL else 'read'})\n"
+    elif await asyncio.to_thread(acl.revoke, entry.folder, user_id, filename):
+        text = f"🚫 Revoked {user_id}'s access to {target}\n"
+    else:
+        text = f"ℹ️ {target} was not shared with {user_id}\n"
+    await update.message.reply_text(text + "════════════════")
+
+async def share_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Give a user access to a folder or file, or show who has access (developer only)."""
+    await _set_share(update, context, True)
+
+async def unshare_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Take a user's access to a folder or file away (developer only)."""
+    await _set_share(update, context, False)
+
+async def unadmin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Revoke a stored admin, such as one claimed through a bootstrap username, or list admins (admin only)."""
+    if not is_developer(update.effective_user):
+        await unauthorized_message(update)
+        return
+    if not context.args or not context.args[0].isdigit():
+        env_admins, stored_admins = await asyncio.to_thread(acl.admins)
+        lines = [f"👤 {uid} (ADMIN_USER_IDS)" for uid in sorted(env_admins)]
+        lines += [f"👤 {uid}" for uid in sorted(stored_admins)]
+        await update.message.reply_text(
+            "🛡 𝗔𝗱𝗺𝗶𝗻𝘀\n"
+            "════════════════\n\n"
+            + ("\n".join(lines) or "No admins") + "\n\n"
+            "💡 Usage: /unadmin <user_id>\n"
+            "════════════════"
+        )
+        return
+    user_id = int(context.args[0])
+    if await asyncio.to_thread(acl.revoke_admin, user_id):
+        await update.message.reply_text(f"✅ User {user_id} is no longer an admin")
+    else:
+        await update.message.reply_text(f"❌ User {user_id} is not a revocable admin (ADMIN_USER_IDS admins are set in the environment)")
+
+async def snapshots_report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """List storage snapshots, or take one now with /snapshots now (developer only)."""
+    user = update.effective_user
+    if not is_developer(user):
+        await unauthorized_message(update)
+        return
+
+    if not storage.is_local:
+        await update.message.reply_text("❌ Snapshots need the local storage backend (STORAGE_BACKEND=local).")
+        return
+
+    if context.args and context.args[0].lower() == "now":
+        summary = await asyncio.to_thread(snapshots.create)
+        await update.message.reply_text(
+            f"📸 Snapshot {summary['id']} taken\n"
+            f"📄 {summary['linked']} files linked, {summary['reused']} unchanged\n"
+            "════════════════"
+        )
+        return
+
+    ids = await asyncio.to_thread(snapshots.ids)
+    shown = "\n".join(f"• {snapshot_id}" for snapshot_id in reversed(ids[-10:]))
+    await update.message.reply_text(
+        "📸 𝗦𝘁𝗼𝗿𝗮𝗴𝗲 𝗦𝗻𝗮𝗽𝘀𝗵𝗼𝘁𝘀\n"
+        "════════════════\n\n"
+        + (shown or "No snapshots yet") + "\n\n"
+        f"📊 {len(ids)} kept (last {SNAPSHOT_KEEP_LAST} + {SNAPSHOT_KEEP_DAILY} daily)\n"
+        "💡 /snapshots now – Take a snapshot\n"
+        "♻️ /restore <snapshot> <folder> [filename] – Restore\n"
+        "════════════════"
+    )
+
+async def restore_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Restore a folder, or one file, from a snapshot (developer only)."""
+    user = update.effective_user
+    if not is_developer(user):
+        await unauthorized_message(update)
+        return
+
+    if not storage.is_local:
+        await update.message.reply_text("❌ Snapshots need the local storage backend (STORAGE_BACKEND=local).")
+        return
+
+    if not context.args or len(context.args) < 2:
+        await update.message.reply_text(
+            "💡 Usage: /restore <snapshot> <folder> [filename]\n"
+            "🔍 Use /snapshots to see snapshot ids\n"
+            "════════════════"
+        )
+        return
+
+    snapshot_id = context.args[0]
+    # Deleted folders are no longer numbered, so their directory name works too
+    folder_entry = folder_registry.resolve(context.args[1])
+    folder_name = folder_entry.folder if folder_entry else sanitize_folder_name(context.args[1])
+    try:
+        manifest = await asyncio.to_thread(snapshots.load, snapshot_id)
+        filename = None
+        if len(context.args) > 2:
+            wanted = " ".join(context.args[2:])
+            names = list(manifest['folders'].get(folder_name, {}))
+            matches = [name for name in names if name == wanted] or \
+                [name for name in names if wanted.lower() in name.lower()]
+            if len(matches) != 1:
+                await update.message.reply_text(
+                    f"❌ {'No' if not matches else 'More than one'} file matching '{wanted}' in that snapshot\n"
+                    "════════════════"
+                )
+                return
+            filename = matches[0]
+
+        async with storage.locks.write_folder(folder_name):
+            restored = await asyncio.to_thread(snapshots.restore, snapshot_id, folder_name, filename)
+        storage.register_files(folder_name, restored)
+        entry = folder_registry.by_folder(folder_name) or folder_registry.adopt([folder_name])[0]
+        await update.message.reply_text(
+            f"♻️ Restored {len(restored)} file(s) into 📂 {entry.name} (folder {entry.number})\n"
+            "════════════════"
+        )
+    except FileNotFoundError as e:
+        await update.message.reply_text(f"❌ {str(e)}\n════════════════")
+    except Exception as e:
+        logger.error(f"Error restoring from snapshot: {str(e)}", exc_info=True)
+        await update.message.reply_text(f"Error restoring from snapshot: {str(e)}")
+
+async def answer_inline_query(inline_query: InlineQuery) -> None:
+    """Answer an inline query with stored files Telegram already has (no upload needed)."""
+    user = inline_query.from_user
+    if not is_developer(user) and not rate_limiter.allow(user.id):
+        retry_after = rate_limiter.retry_after(user.id)
+        logger.info(f"Rate limited inline query of user {user.id}; retry in {retry_after:.0f}s")
+        # Answer anyway so the client stops waiting; the empty list is cached only briefly
+        await inline_query.answer([], cache_time=max(1, math.ceil(retry_after)), is_personal=True)
+        return
+
+    text = inline_query.query.strip()
+    view = access_for(user)
+    if text:
+        matches = await inline_cache.get(text, view)
+    else:
+        matches = [key for key, _ in popularity.top(INLINE_MAX_RESULTS)]
+
+    results = []
+    for folder_name, filename in matches:
+        if not view.can_read(folder_name, filename):
+            continue
+        file_id = warm_cache.peek_file_id(folder_name, filename)
+        if not file_id:
+            continue
+        results.append(InlineQueryResultCachedDocument(
+            id=hashlib.sha1(f"{folder_name}/{filename}".encode()).hexdigest(),
+            title=filename,
+            document_file_id=file_id,
+            description=f"📁 {folder_name}"
+        ))
+        if len(results) >= INLINE_MAX_RESULTS:
+            break
+
+    await inline_query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        # Telegram shares cached answers between users unless they are personal
+        is_personal=acl.has_rules(),
+        button=InlineQueryResultsButton(text="🔍 Search all files in the bot", start_parameter="search")
+    )
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle @bot <query> searches, answering only once the user stops typing."""
+    query = update.inline_query
+    inline_debouncer.submit(query.from_user.id, lambda: answer_inline_query(query))
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
@@ -157,14 +1222,26 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "➜ /get <folder_number> <query> – Find file\n"
         "➜ /get <query> – Search across folders\n"
         "➜ /list <folder_number> – View folder files\n"
+        "➜ /subscribe <folder_number> – Get new-file alerts\n"
+        "➜ /unsubscribe <folder_number|all> – Stop alerts\n"
         "════════════════\n"
         "🛠 𝗗𝗲𝘃𝗲𝗹𝗼𝗽𝗲𝗿 𝗖𝗼𝗺𝗺𝗮𝗻𝗱𝘀:\n"
         "➜ /addfolder <folder_name> – Create a folder\n"
         "➜ /kickfolder <folder_number> – Delete a folder\n"
         "➜ /add <folder_number> – Add files to a folder\n"
         "➜ /kick <folder_number> <filename> – Delete a file\n"
-        "➜ /share <filename> [telegram I'd] – Grant access\n"
-        "➜ /lock <folder_number> – Restrict access\n"
+        "➜ /lock <folder_number> [filename] – Restrict access\n"
+        "➜ /unlock <folder_number> [filename] – Lift a lock\n"
+        "➜ /share <folder_number> <user_id> [rw|filename] – Grant access\n"
+        "➜ /unshare <folder_number> <user_id> [filename] – Revoke access\n"
+        "➜ /unadmin [user_id] – List admins or revoke one\n"
+        "➜ /hot [count] – Show most requested files\n"
+        "➜ /storage – Disk usage & archive candidates\n"
+        "➜ /snapshots [now] – Storage snapshots\n"
+        "➜ /restore <snapshot> <folder> [filename] – Undo deletions\n"
+        "➜ /profile [seconds] – Loop health & live profiling\n"
+        "➜ /broadcasts – Subscriber alerts & throughput\n"
+        "➜ /analytics [days] – Usage rollups\n"
         "════════════════\n"
         "📁 𝗩𝗶𝗲𝘄 𝗔𝘃𝗮𝗶𝗹𝗮𝗯𝗹𝗲 𝗙𝗼𝗹𝗱𝗲𝗿𝘀:",
         reply_markup=keyboard
@@ -192,27 +1269,32 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         # Check if first argument is a number (folder_number)
         is_folder_search = context.args[0].isdigit()
         page = 1  # Default page number
+        view = access_for(update.effective_user)
 
         if is_folder_search:
             folder_num = int(context.args[0]) - 1  # Convert to 0-based index
-            if folder_num < 0 or folder_num >= len(PREDEFINED_FOLDERS):
+            folder_entry = folder_registry.by_number(folder_num + 1)
+            if folder_entry is None:
                 await update.message.reply_text(
                     "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗼𝗹𝗱𝗲𝗿 𝗡𝘂𝗺𝗯𝗲𝗿\n"
                     "════════════════\n\n"
-                    "💡 Please use a number between 1 and 18\n"
+                    f"💡 Please use a number between 1 and {folder_registry.highest_number()}\n"
                     "🔍 Use /help to see available folders\n"
                     "════════════════"
                 )
                 return
 
-            folder_name = PREDEFINED_FOLDERS[folder_num]
-            sanitized_folder = sanitize_folder_name(folder_name)
+            folder_name = folder_entry.name
+            sanitized_folder = folder_entry.folder
             query = " ".join(context.args[1:])  # Rest is the search query
+            if not view.can_read_folder(sanitized_folder):
+                await locked_message(update.message)
+                return
 
             if query.lower() == 'all':
                 # List all files in folder with pagination
                 try:
-                    search_results = storage.search_files(query="", folder_name=sanitized_folder, page=page)
+                    search_results = await coalesced_search("", sanitized_folder, page=page, view=view)
                     files = search_results['results']
                     total_count = search_results['total_count']
 
@@ -233,11 +1315,12 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                         keyboard.append([
                             InlineKeyboardButton("📄 Load More", callback_data=f"more_{sanitized_folder}_{page+1}")
                         ])
+                    keyboard.extend(send_all_rows(total_count))
                     keyboard.append([
                         InlineKeyboardButton("🔄 Back", callback_data="back")
                     ])
 
-                    await update.message.reply_text(
+                    sent = await update.message.reply_text(
                         f"📂 𝗙𝗶𝗹𝗲𝘀 𝗶𝗻 '{folder_name}':\n\n"
                         f"{files_list}\n\n"
                         f"📊 Results: {len(files)} of {total_count}\n"
@@ -245,6 +1328,7 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                         f"════════════════",
                         reply_markup=InlineKeyboardMarkup(keyboard)
                     )
+                    remember_pagination(context, sent.message_id, sanitized_folder, "", page)
 
                 except Exception as e:
                     logger.error(f"Error listing files: {str(e)}", exc_info=True)
@@ -258,7 +1342,8 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             else:
                 # Search in specific folder
                 try:
-                    search_results = storage.search_files(query, sanitized_folder, page=page)
+                    search_results = await coalesced_search(query, sanitized_folder, page=page,
+                                                            chat_id=update.effective_chat.id, view=view)
                     exact_matches = search_results['results']
                     similar_files = search_results['similar_files']
                     total_count = search_results['total_count']
@@ -275,6 +1360,8 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
                     # Format results message
                     message_parts = [f"🔍 𝗦𝗲𝗮𝗿𝗰𝗵 𝗥𝗲𝘀𝘂𝗹𝘁𝘀 𝗳𝗼𝗿 '{query}':\n"]
+                    if search_results['corrected_query']:
+                        message_parts.append(f"🔤 Showing results for '{search_results['corrected_query']}'")
 
                     if exact_matches:
                         message_parts.append("\n📂 𝗘𝘅𝗮𝗰𝘁 𝗠𝗮𝘁𝗰𝗵𝗲𝘀:")
@@ -292,23 +1379,21 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                         keyboard.append([
                             InlineKeyboardButton("📄 Load More", callback_data=f"more_{sanitized_folder}_{page+1}_{query}")
                         ])
+                    keyboard.extend(send_all_rows(total_count))
                     keyboard.append([
                         InlineKeyboardButton("🔄 Back", callback_data="back")
                     ])
 
-                    await update.message.reply_text(
+                    sent = await update.message.reply_text(
                         "\n".join(message_parts) + "\n════════════════",
                         reply_markup=InlineKeyboardMarkup(keyboard)
                     )
+                    remember_pagination(context, sent.message_id, sanitized_folder, query, page)
 
                     # If there's exactly one match, send the file
                     if len(exact_matches) == 1:
-                        file_path = storage.get_file_path(sanitized_folder, exact_matches[0])
-                        with open(file_path, 'rb') as f:
-                            await update.message.reply_document(
-                                document=f,
-                                filename=exact_matches[0]
-                            )
+                        await send_stored_file(update.message, sanitized_folder, exact_matches[0])
+                        await reply_recommendations(update.message, sanitized_folder, exact_matches[0], view)
 
                 except Exception as e:
                     logger.error(f"Error searching files: {str(e)}", exc_info=True)
@@ -324,7 +1409,8 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             # Global search across all folders
             query = " ".join(context.args)
             try:
-                search_results = storage.search_files(query, page=page)
+                search_results = await coalesced_search(query, page=page, chat_id=update.effective_chat.id,
+                                                        view=view)
                 exact_matches = search_results['results']
                 similar_files = search_results['similar_files']
                 total_count = search_results['total_count']
@@ -341,6 +1427,8 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
                 # Format results message
                 message_parts = [f"🔍 𝗚𝗹𝗼𝗯𝗮𝗹 𝗦𝗲𝗮𝗿𝗰𝗵 𝗥𝗲𝘀𝘂𝗹𝘁𝘀 𝗳𝗼𝗿 '{query}':\n"]
+                if search_results['corrected_query']:
+                    message_parts.append(f"🔤 Showing results for '{search_results['corrected_query']}'")
 
                 if exact_matches:
                     message_parts.append("\n📂 𝗘𝘅𝗮𝗰𝘁 𝗠𝗮𝘁𝗰𝗵𝗲𝘀:")
@@ -360,24 +1448,22 @@ async def get_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                     keyboard.append([
                         InlineKeyboardButton("📄 Load More", callback_data=f"more_global_{page+1}_{query}")
                     ])
+                keyboard.extend(send_all_rows(total_count))
                 keyboard.append([
                     InlineKeyboardButton("🔄 Back", callback_data="back")
                 ])
 
-                await update.message.reply_text(
+                sent = await update.message.reply_text(
                     "\n".join(message_parts) + "\n════════════════",
                     reply_markup=InlineKeyboardMarkup(keyboard)
                 )
+                remember_pagination(context, sent.message_id, "global", query, page)
 
                 # If there's exactly one match, send the file
                 if len(exact_matches) == 1:
                     folder_name, filename = exact_matches[0]
-                    file_path = storage.get_file_path(folder_name, filename)
-                    with open(file_path, 'rb') as f:
-                        await update.message.reply_document(
-                            document=f,
-                            filename=filename
-                        )
+                    await send_stored_file(update.message, folder_name, filename)
+                    await reply_recommendations(update.message, folder_name, filename, view)
 
             except Exception as e:
                 logger.error(f"Error in global search: {str(e)}", exc_info=True)
@@ -414,6 +1500,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Handle button clicks for pagination and navigation."""
     query = update.callback_query
     await query.answer()
+    view = access_for(query.from_user)
 
     try:
         if query.data == "back":
@@ -421,18 +1508,56 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             await query.message.edit_reply_markup(reply_markup=None)
             return
 
+        if query.data == "sendall":
+            # Every match of the search this message shows, re-run with the user's permissions
+            cursor = (context.chat_data or {}).get('pagination', {}).get(query.message.message_id)
+            if cursor is None:
+                await query.message.reply_text("⌛ These results expired. Please search again.\n════════════════")
+                return
+            folder_name = None if cursor['folder'] == "global" else cursor['folder']
+            search_results = await asyncio.to_thread(
+                storage.search_files, cursor['query'], folder_name, per_page=SEND_ALL_MAX_FILES,
+                include_similar=False, record_history=False, view=view
+            )
+            files = [(folder_name, result) if folder_name else tuple(result) for result in search_results['results']]
+            if not files:
+                await query.message.reply_text("❌ No files to send.\n════════════════")
+                return
+            await query.message.reply_text(f"📤 Sending {len(files)} files...\n════════════════")
+            await send_all_matches(query.message, files)
+            return
+
+        if query.data.startswith("dl_"):
+            # Full download requested from a preview
+            target = previews.resolve_token(query.data[3:]) if previews else None
+            if not target:
+                await query.message.reply_text(
+                    "❌ 𝗙𝗶𝗹𝗲 𝗡𝗼 𝗟𝗼𝗻𝗴𝗲𝗿 𝗔𝘃𝗮𝗶𝗹𝗮𝗯𝗹𝗲\n"
+                    "════════════════\n\n"
+                    "🔍 Use /get to search for it again\n"
+                    "════════════════"
+                )
+                return
+            folder_name, filename = target
+            if not view.can_read(folder_name, filename):
+                await locked_message(query.message)
+                return
+            await query.message.edit_reply_markup(reply_markup=None)
+            await send_stored_document(query.message, folder_name, filename)
+            return
+
         if query.data.startswith("folder_"):
             # Extract folder name from callback data
             folder_name = query.data[7:]  # Remove 'folder_' prefix
             try:
                 # Get the original folder name (before sanitization)
-                original_folder_name = next(
-                    (name for name in PREDEFINED_FOLDERS
-                     if sanitize_folder_name(name) == folder_name),
-                    folder_name
-                )
+                folder_entry = folder_registry.by_folder(folder_name)
+                original_folder_name = folder_entry.name if folder_entry else folder_name
 
-                files = storage.list_files(folder_name)
+                if not view.can_read_folder(folder_name):
+                    await locked_message(query.message)
+                    return
+                files = storage.list_files(folder_name, view)
                 if not files:
                     await query.message.edit_text(
                         f"📂 𝗙𝗼𝗹𝗱𝗲𝗿 '{original_folder_name}' 𝗶𝘀 𝗲𝗺𝗽𝘁𝘆\n\n"
@@ -444,7 +1569,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 # Create a numbered list of files with emoji
                 files_list = "\n".join([f"{i+1}. 📄 {file}" for i, file in enumerate(files)])
                 # Get folder number for the tip
-                folder_num = PREDEFINED_FOLDERS.index(original_folder_name) + 1
+                folder_num = folder_entry.number if folder_entry else "<folder_number>"
 
                 keyboard = [[InlineKeyboardButton("🔄 Back", callback_data="back")]]
 
@@ -475,13 +1600,13 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 # Global search pagination
                 page = int(parts[2])
                 search_query = "_".join(parts[3:])
-                search_results = storage.search_files(search_query, page=page)
+                search_results = await coalesced_search(search_query, page=page, view=view)
             else:
                 # Folder-specific pagination
                 folder_name = parts[1]
                 page = int(parts[2])
                 search_query = "_".join(parts[3:]) if len(parts) > 3 else ""
-                search_results = storage.search_files(search_query, folder_name=folder_name, page=page)
+                search_results = await coalesced_search(search_query, folder_name, page=page, view=view)
 
             # Format results message similar to the original search
             message_parts = []
@@ -505,10 +1630,13 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 keyboard.append([
                     InlineKeyboardButton("📄 Load More", callback_data=callback_data)
                 ])
+            keyboard.extend(send_all_rows(search_results['total_count']))
             keyboard.append([
                 InlineKeyboardButton("🔄 Back", callback_data="back")
             ])
 
+            remember_pagination(context, query.message.message_id, parts[1], search_query, page)
+
             # Update message with new results
             if message_parts:
                 await query.message.edit_text(
@@ -538,7 +1666,7 @@ async def create_folder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user = update.effective_user
     logger.debug(f"Create folder attempt by user: {user.username}")
 
-    if not is_developer(user.username):
+    if not is_developer(user):
         await unauthorized_message(update)
         return
 
@@ -546,15 +1674,17 @@ async def create_folder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await update.message.reply_text("Please specify a folder name: /addfolder <folder_name>")
         return
 
-    folder_name = sanitize_folder_name(context.args[0])
+    display_name = " ".join(context.args)
+    folder_name = sanitize_folder_name(display_name)
     if not folder_name:
         await update.message.reply_text("Invalid folder name. Use only letters, numbers, hyphens and underscores.")
         return
 
     try:
         storage.create_folder(folder_name)
+        entry = folder_registry.add(display_name, folder_name)
         logger.debug(f"Folder '{folder_name}' created successfully by user: {user.username}")
-        await update.message.reply_text(f"Folder '{folder_name}' created successfully!")
+        await update.message.reply_text(f"Folder '{entry.name}' created successfully as folder {entry.number}!")
     except Exception as e:
         logger.error(f"Error creating folder: {str(e)}", exc_info=True)
         await update.message.reply_text(f"Error creating folder: {str(e)}")
@@ -594,34 +1724,38 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         folder_num = int(update.message.caption.strip()) - 1  # Convert to 0-based index
         logger.debug(f"Received folder number: {folder_num + 1} (index: {folder_num})")
 
-        if folder_num < 0 or folder_num >= len(PREDEFINED_FOLDERS):
+        folder_entry = folder_registry.by_number(folder_num + 1)
+        if folder_entry is None:
             await update.message.reply_text(
                 "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗼𝗹𝗱𝗲𝗿 𝗡𝘂𝗺𝗯𝗲𝗿\n"
                 "════════════════\n\n"
-                "💡 Please use a number between 1 and 18\n"
+                f"💡 Please use a number between 1 and {folder_registry.highest_number()}\n"
                 "🔍 Use /help to see available folders\n"
                 "════════════════"
             )
             return
 
         # Get folder name and sanitize it
-        folder_name = PREDEFINED_FOLDERS[folder_num]
-        sanitized_folder = sanitize_folder_name(folder_name)
+        folder_name = folder_entry.name
+        sanitized_folder = folder_entry.folder
         logger.debug(f"Using folder name: {folder_name}")
+
+        # Locked folders only take uploads from users they are shared with for writing
+        view = access_for(user)
+        if acl.is_locked(sanitized_folder) and not view.can_write_folder(sanitized_folder):
+            await locked_message(update.message)
+            return
         logger.debug(f"Sanitized to: {sanitized_folder}")
 
         # Debug: Check if folder exists and create if needed
         folder_path = os.path.join(storage.base_path, sanitized_folder)
         logger.debug(f"Full folder path: {folder_path}")
-        if not os.path.exists(folder_path):
+        if not storage.folder_exists(sanitized_folder):
             logger.info(f"Creating missing folder: {folder_path}")
-            os.makedirs(folder_path, exist_ok=True)
+            storage.create_folder(sanitized_folder)
 
         # Verify folder was created
-        if os.path.exists(folder_path):
-            logger.debug(f"Verified folder exists at: {folder_path}")
-            logger.debug(f"Folder contents: {os.listdir(folder_path)}")
-        else:
+        if not storage.folder_exists(sanitized_folder):
             logger.error(f"Failed to create/verify folder: {folder_path}")
             raise Exception("Failed to create folder")
 
@@ -665,21 +1799,19 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         # Download and save file
         try:
             logger.debug(f"Getting file from Telegram with ID: {file.file_id}")
-            file_obj = await context.bot.get_file(file.file_id)
-            if not file_obj:
-                raise ValueError("Could not get file from Telegram")
 
             # Generate a unique filename using the file ID
             filename = f"{file.file_id}{file_extension}"
             logger.debug(f"Generated filename: {filename}")
 
             # Save file using storage manager
-            destination = io.BytesIO()
-            await file_obj.download_to_memory(destination)
-            storage.save_file(sanitized_folder, filename, destination.getvalue())
+            await store_upload(context.bot, file.file_id, sanitized_folder, filename)
+            if update.message.document:
+                # The upload's file id can be re-sent as-is, e.g. from inline mode
+                warm_cache.remember_file_id(sanitized_folder, filename, file.file_id)
 
             # Get updated file list
-            files = storage.list_files(sanitized_folder)
+            files = storage.list_files(sanitized_folder, view)
             files_list = "\n".join([f"{i+1}. 📄 {f}" for i, f in enumerate(files)])
 
             # Send confirmation message
@@ -723,7 +1855,7 @@ async def remove_folder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     user = update.effective_user
     logger.debug(f"Remove folder attempt by user: {user.username}")
 
-    if not is_developer(user.username):
+    if not is_developer(user):
         await unauthorized_message(update)
         return
 
@@ -738,15 +1870,30 @@ async def remove_folder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
         return
 
-    folder_name = sanitize_folder_name(context.args[0])
+    # Accept a folder number or name; unregistered directories are matched by name
+    folder_entry = folder_registry.resolve(" ".join(context.args))
+    folder_name = folder_entry.folder if folder_entry else sanitize_folder_name(" ".join(context.args))
     if not folder_name:
         await update.message.reply_text("Invalid folder name. Use only letters, numbers, hyphens and underscores.")
         return
 
     try:
-        storage.delete_folder(folder_name)
+        undo = ""
+        if SNAPSHOT_INTERVAL_SECONDS > 0 and storage.is_local and storage.folder_exists(folder_name):
+            # Make the deletion undoable even between scheduled snapshots
+            summary = await asyncio.to_thread(snapshots.create)
+            undo = f"\n♻️ Undo with /restore {summary['id']} {folder_name}"
+        try:
+            await storage.delete_folder_async(folder_name)
+        except FileNotFoundError:
+            # A registered folder whose directory is already gone only needs unregistering
+            if folder_entry is None:
+                raise
+        folder_registry.remove(folder_name)
         logger.debug(f"Folder '{folder_name}' deleted successfully by user: {user.username}")
-        await update.message.reply_text(f"Folder '{folder_name}' and its contents deleted successfully!")
+        await update.message.reply_text(
+            f"Folder '{folder_entry.name if folder_entry else folder_name}' and its contents deleted successfully!{undo}"
+        )
     except Exception as e:
         logger.error(f"Error deleting folder: {str(e)}", exc_info=True)
         await update.message.reply_text(f"Error deleting folder: {str(e)}")
@@ -756,7 +1903,7 @@ async def remove_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     user = update.effective_user
     logger.debug(f"Remove file attempt by user: {user.username}")
 
-    if not is_developer(user.username):
+    if not is_developer(user):
         await unauthorized_message(update)
         return
 
@@ -774,23 +1921,24 @@ async def remove_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     try:
         # Get folder number and validate
         folder_num = int(context.args[0]) - 1  # Convert to 0-based index
-        if folder_num < 0 or folder_num >= len(PREDEFINED_FOLDERS):
+        folder_entry = folder_registry.by_number(folder_num + 1)
+        if folder_entry is None:
             await update.message.reply_text(
                 "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗼𝗹𝗱𝗲𝗿 𝗡𝘂𝗺𝗯𝗲𝗿\n"
                 "════════════════\n\n"
-                "💡 Please use a number between 1 and 18\n"
+                f"💡 Please use a number between 1 and {folder_registry.highest_number()}\n"
                 "🔍 Use /help to see available folders\n"
                 "════════════════"
             )
             return
 
         # Get folder name and sanitize it
-        folder_name = PREDEFINED_FOLDERS[folder_num]
-        sanitized_folder = sanitize_folder_name(folder_name)
+        folder_name = folder_entry.name
+        sanitized_folder = folder_entry.folder
         file_name = " ".join(context.args[1:])  # Join all remaining arguments as filename
 
         try:
-            storage.delete_file(sanitized_folder, file_name)
+            await storage.delete_file_async(sanitized_folder, file_name)
 
             # Get updated file list for summary
             files = storage.list_files(sanitized_folder)
@@ -833,7 +1981,9 @@ async def handle_command_with_file(update: Update, context: ContextTypes.DEFAULT
     user = update.effective_user
     logger.debug(f"Handling /add command from user: {user.username}")
 
-    if not is_developer(user.username):
+    # Admins may add anywhere; other users only to folders shared with them for writing
+    view = access_for(user)
+    if not view.admin and not view.writable:
         await unauthorized_message(update)
         return
 
@@ -887,20 +2037,24 @@ async def handle_command_with_file(update: Update, context: ContextTypes.DEFAULT
         folder_num = int(context.args[0]) - 1  # Convert to 0-based index
         logger.debug(f"Received folder number: {folder_num + 1}")
 
-        if folder_num < 0 or folder_num >= len(PREDEFINED_FOLDERS):
+        folder_entry = folder_registry.by_number(folder_num + 1)
+        if folder_entry is None:
             await update.message.reply_text(
                 "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗼𝗹𝗱𝗲𝗿 𝗡𝘂𝗺𝗯𝗲𝗿\n"
                 "════════════════\n\n"
-                "💡 Please use a number between 1 and 18\n"
+                f"💡 Please use a number between 1 and {folder_registry.highest_number()}\n"
                 "🔍 Use /help to see available folders\n"
                 "════════════════"
             )
             return
 
         # Get folder name and sanitize it
-        folder_name = PREDEFINED_FOLDERS[folder_num]
-        sanitized_folder = sanitize_folder_name(folder_name)
+        folder_name = folder_entry.name
+        sanitized_folder = folder_entry.folder
         logger.debug(f"Using folder: {folder_name} (sanitized: {sanitized_folder})")
+        if not view.can_write_folder(sanitized_folder):
+            await unauthorized_message(update)
+            return
 
         # Get the file
         file = None
@@ -940,27 +2094,30 @@ async def handle_command_with_file(update: Update, context: ContextTypes.DEFAULT
             )
             return
 
+        # The name ends up in backend paths and keys, so it must stay inside the folder
+        if not is_safe_filename(custom_filename):
+            logger.warning(f"Rejected unsafe filename from user {user.id}: {custom_filename!r}")
+            await update.message.reply_text(
+                "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗶𝗹𝗲𝗻𝗮𝗺𝗲\n"
+                "════════════════\n\n"
+                "💡 Filenames cannot contain / or \\ or start with a dot\n"
+                "📄 Example: /add 3 my_notes.pdf\n"
+                "════════════════"
+            )
+            return
+
         # Process and save file
         try:
-            # Get file from Telegram
+            # Get file from Telegram and save it
             logger.debug(f"Requesting file with ID: {file.file_id}")
-            file_obj = await context.bot.get_file(file.file_id)
-            if not file_obj:
-                raise ValueError("Could not get file from Telegram")
-
-            # Download file content
-            logger.debug("Downloading file content")
-            destination = io.BytesIO()
-            await file_obj.download_to_memory(destination)
-            if not destination.getvalue():
-                raise ValueError("Could not download file content")
-
-            # Save file
             logger.debug(f"Saving file as: {custom_filename}")
-            storage.save_file(sanitized_folder, custom_filename, destination.getvalue())
+            await store_upload(context.bot, file.file_id, sanitized_folder, custom_filename)
+            if reply_msg.document:
+                # The upload's file id can be re-sent as-is, e.g. from inline mode
+                warm_cache.remember_file_id(sanitized_folder, custom_filename, file.file_id)
 
             # Get updated file list
-            files = storage.list_files(sanitized_folder)
+            files = storage.list_files(sanitized_folder, view)
             files_list = "\n".join([f"{i+1}. 📄 {file}" for i, file in enumerate(files)])
 
             await update.message.reply_text(
@@ -1039,20 +2196,25 @@ async def list_files(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     try:
         # Get folder number and validate
         folder_num = int(context.args[0]) - 1  # Convert to 0-based index
-        if folder_num < 0 or folder_num >= len(PREDEFINED_FOLDERS):
+        folder_entry = folder_registry.by_number(folder_num + 1)
+        if folder_entry is None:
             await update.message.reply_text(
                 "❌ 𝗜𝗻𝘃𝗮𝗹𝗶𝗱 𝗙𝗼𝗹𝗱𝗲𝗿 𝗡𝘂𝗺𝗯𝗲𝗿\n"
                 "════════════════\n\n"
-                "💡 Please use a number between 1 and 18\n"
+                f"💡 Please use a number between 1 and {folder_registry.highest_number()}\n"
                 "🔍 Use /help to see available folders\n"
                 "════════════════"
             )
             return
 
         # Get folder name and sanitize it
-        folder_name = PREDEFINED_FOLDERS[folder_num]
-        sanitized_folder = sanitize_folder_name(folder_name)
-        files = storage.list_files(sanitized_folder)
+        folder_name = folder_entry.name
+        sanitized_folder = folder_entry.folder
+        view = access_for(update.effective_user)
+        if not view.can_read_folder(sanitized_folder):
+            await locked_message(update.message)
+            return
+        files = storage.list_files(sanitized_folder, view)
 
         if files:
             # Create a numbered list of files with emoji
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+from request_control import RateLimiter
+from storage_manager import FOLDER_DELETED, StorageManager
+
+logger = logging.getLogger(__name__)
+
+# compose(folder_name, filenames) -> (text, file_id or None)
+Composer = Callable[[str, List[str]], Tuple[str, Optional[str]]]
+
+class BroadcastEngine:
+    """Notify folder subscribers about new files through a persistent send queue.
+
+    Uploads and imports are announced explicitly by any process through
+    announce(); announcements are deduplicated per file in SQLite and
+    debounced per folder, so a burst of uploads becomes one notification.
+    Each notification is expanded into one queue row per subscriber, and rows
+    are leased in chunks, so a restart resumes where the last sender stopped.
+    Only one process (the leader) runs the sender, which keeps the global
+    token bucket truly global; a per-chat bucket paces each chat, and a
+    RetryAfter from Telegram pauses all sending for the requested time.
+    """
+
+    def __init__(self, storage: StorageManager, db_path: str, compose: Composer,
+                 debounce_seconds: float = 30, max_delay_seconds: float = 300,
+                 rate_per_second: float = 25, per_chat_interval: float = 1.0,
+                 chunk_size: int = 200, max_attempts: int = 3, lease_seconds: float = 120):
+        self.storage = storage
+        self.db_path = db_path
+        self.compose = compose
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.global_limiter = RateLimiter(rate_per_minute=rate_per_second * 60, burst=max(1, int(rate_per_second)))
+        self.chat_limiter = RateLimiter(rate_per_minute=60 / per_chat_interval, burst=1)
+        self._owner = uuid.uuid4().hex
+        self._paused_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._sent_times: Deque[float] = deque(maxlen=10000)
+        self.sent = 0
+        self.failed = 0
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        connection = self._connect()
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the broadcast database."""
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            "chat_id INTEGER NOT NULL, folder TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (folder, chat_id));"
+            "CREATE INDEX IF NOT EXISTS subscriptions_by_chat ON subscriptions (chat_id);"
+            "CREATE TABLE IF NOT EXISTS broadcasts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, folder TEXT NOT NULL, files TEXT NOT NULL, "
+            "text TEXT NOT NULL, file_id TEXT, created REAL NOT NULL, total INTEGER NOT NULL, "
+            "sent INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, finished REAL);"
+            "CREATE TABLE IF NOT EXISTS queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, broadcast_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0, owner TEXT);"
+            "CREATE INDEX IF NOT EXISTS queue_by_lease ON queue (lease_until, id);"
+            "CREATE TABLE IF NOT EXISTS announcements ("
+            "folder TEXT NOT NULL, filename TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (folder, filename));"
+        )
+        return connection
+
+    # Subscriptions
+
+    def subscribe(self, chat_id: int, folder_name: str) -> bool:
+        """Subscribe a chat to a folder; False if it already was (blocking)."""
+        connection = self._connect()
+        try:
+            with connection:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO subscriptions (chat_id, folder, created) VALUES (?, ?, ?)",
+                    (chat_id, folder_name, time.time())
+                )
+            return cursor.rowcount > 0
+        finally:
+            connection.close()
+
+    def unsubscribe(self, chat_id: int, folder_name: Optional[str] = None) -> int:
+        """Remove one or all of a chat's subscriptions; returns how many were removed (blocking)."""
+        connection = self._connect()
+        try:
+            with connection:
+                if folder_name is None:
+                    cursor = connection.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+                else:
+                    cursor = connection.execute("DELETE FROM subscriptions WHERE chat_id = ? AND folder = ?",
+                                                (chat_id, folder_name))
+            return cursor.rowcount
+        finally:
+            connection.close()
+
+    def subscriptions(self, chat_id: int) -> List[str]:
+        """Return the folders a chat is subscribed to (blocking)."""
+        connection = self._connect()
+        try:
+            return [folder for (folder,) in connection.execute(
+                "SELECT folder FROM subscriptions WHERE chat_id = ? ORDER BY created", (chat_id,))]
+        finally:
+            connection.close()
+
+    def _drop_folder(self, folder_name: str) -> None:
+        """Forget subscriptions and pending announcements of a deleted folder (blocking)."""
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM subscriptions WHERE folder = ?", (folder_name,))
+                connection.execute("DELETE FROM announcements WHERE folder = ?", (folder_name,))
+        finally:
+            connection.close()
+
+    # Batching
+
+    def announce(self, folder_name: str, filenames: List[str]) -> None:
+        """Record newly uploaded or imported files for the next notification (blocking).
+
+        Safe to call from any process; a file announced twice before its batch
+        goes out is notified once.
+        """
+        now = time.time()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO announcements (folder, filename, created, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (folder, filename) DO UPDATE SET updated = excluded.updated",
+                    [(folder_name, filename, now, now) for filename in filenames]
+                )
+        finally:
+            connection.close()
+
+    def _on_storage_event(self, event: str, folder_name: str, filename: Optional[str]) -> None:
+        """Deleted folders lose their subscribers and pending announcements."""
+        if event == FOLDER_DELETED:
+            threading.Thread(target=self._drop_folder, args=(folder_name,), daemon=True).start()
+
+    def _take_due(self) -> List[Tuple[str, List[str]]]:
+        """Take the announced batches whose folder has been quiet for the debounce time (blocking)."""
+        now = time.time()
+        connection = self._connect()
+        try:
+            with connection:
+                folders = connection.execute(
+                    "SELECT folder FROM announcements GROUP BY folder HAVING MAX(updated) <= ? OR MIN(created) <= ?",
+                    (now - self.debounce_seconds, now - self.max_delay_seconds)
+                ).fetchall()
+                due = []
+                for (folder_name,) in folders:
+                    filenames = [filename for (filename,) in connection.execute(
+                        "SELECT filename FROM announcements WHERE folder = ? ORDER BY created", (folder_name,))]
+                    connection.execute("DELETE FROM announcements WHERE folder = ?", (folder_name,))
+                    due.append((folder_name, filenames))
+            return due
+        finally:
+            connection.close()
+
+    def _enqueue(self, folder_name: str, filenames: List[str], text: str, file_id: Optional[str]) -> int:
+        """Create a broadcast with one queue row per subscriber (blocking); returns the row count."""
+        connection = self._connect()
+        try:
+            with connection:
+                total = connection.execute("SELECT COUNT(*) FROM subscriptions WHERE folder = ?",
+                                           (folder_name,)).fetchone()[0]
+                if not total:
+                    return 0
+                cursor = connection.execute(
+                    "INSERT INTO broadcasts (folder, files, text, file_id, created, total) VALUES (?, ?, ?, ?, ?, ?)",
+                    (folder_name, json.dumps(filenames), text, file_id, time.time(), total)
+                )
+                connection.execute(
+                    "INSERT INTO queue (broadcast_id, chat_id) SELECT ?, chat_id FROM subscriptions WHERE folder = ?",
+                    (cursor.lastrowid, folder_name)
+                )
+            return total
+        finally:
+            connection.close()
+
+    async def _enqueue_due(self) -> None:
+        """Turn quiet batches into queued broadcasts."""
+        for folder_name, filenames in await asyncio.to_thread(self._take_due):
+            text, file_id = self.compose(folder_name, filenames)
+            total = await asyncio.to_thread(self._enqueue, folder_name, filenames, text, file_id)
+            if total:
+                logger.info(f"Queued broadcast of {len(filenames)} new files in '{folder_name}' "
+                            f"to {total} subscribers")
+
+    # Sending
+
+    def _lease(self) -> List[Tuple[int, int, int, str, Optional[str]]]:
+        """Lease the next chunk of queue rows to this sender (blocking)."""
+        now = time.time()
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "UPDATE queue SET lease_until = ?, owner = ? WHERE id IN ("
+                    "SELECT id FROM queue WHERE lease_until < ? ORDER BY id LIMIT ?)",
+                    (now + self.lease_seconds, self._owner, now, self.chunk_size)
+                )
+                return connection.execute(
+                    "SELECT queue.id, queue.chat_id, queue.attempts, broadcasts.text, broadcasts.file_id "
+                    "FROM queue JOIN broadcasts ON broadcasts.id = queue.broadcast_id "
+                    "WHERE queue.owner = ? AND queue.lease_until > ? ORDER BY queue.id",
+                    (self._owner, now)
+                ).fetchall()
+        finally:
+            connection.close()
+
+    def _settle(self, done: List[int], failed: List[int], retry: List[int], deferred: List[int],
+                blocked_chats: List[int]) -> None:
+        """Record the outcome of a chunk and finish completed broadcasts (blocking)."""
+        connection = self._connect()
+        try:
+            with connection:
+                for column, ids in (("sent", done), ("failed", failed)):
+                    connection.executemany(
+                        f"UPDATE broadcasts SET {column} = {column} + 1 "
+                        "WHERE id = (SELECT broadcast_id FROM queue WHERE id = ?)",
+                        [(row_id,) for row_id in ids]
+                    )
+                connection.executemany("DELETE FROM queue WHERE id = ?", [(row_id,) for row_id in done + failed])
+                connection.executemany("UPDATE queue SET attempts = attempts + 1, lease_until = 0 WHERE id = ?",
+                                       [(row_id,) for row_id in retry])
+                connection.executemany("UPDATE queue SET lease_until = 0 WHERE id = ?",
+                                       [(row_id,) for row_id in deferred])
+                connection.executemany("DELETE FROM subscriptions WHERE chat_id = ?",
+                                       [(chat_id,) for chat_id in blocked_chats])
+                finished = connection.execute(
+                    "SELECT id, folder, total, sent, failed, created FROM broadcasts WHERE finished IS NULL "
+                    "AND NOT EXISTS (SELECT 1 FROM queue WHERE queue.broadcast_id = broadcasts.id)"
+                ).fetchall()
+                now = time.time()
+                connection.executemany("UPDATE broadcasts SET finished = ? WHERE id = ?",
+                                       [(now, row[0]) for row in finished])
+        finally:
+            connection.close()
+        for broadcast_id, folder_name, total, sent, failed_count, created in finished:
+            elapsed = max(now - created, 0.001)
+            logger.info(f"Broadcast {broadcast_id} to '{folder_name}' finished: {sent}/{total} sent, "
+                        f"{failed_count} failed in {elapsed:.0f}s ({sent / elapsed:.1f} msg/s)")
+
+    async def _acquire_global(self) -> None:
+        """Wait for a global send token, honouring any flood-control pause."""
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            elif self.global_limiter.allow("global"):
+                return
+            else:
+                await asyncio.sleep(self.global_limiter.retry_after("global"))
+
+    async def _send(self, bot, chat_id: int, text: str, file_id: Optional[str]) -> None:
+        """Send one notification, reusing a Telegram file id when there is one."""
+        if file_id:
+            await bot.send_document(chat_id=chat_id, document=file_id, caption=text)
+        else:
+            await bot.send_message(chat_id=chat_id, text=text)
+
+    async def _drain_chunk(self, bot) -> int:
+        """Send one leased chunk; returns how many sends were attempted."""
+        rows = await asyncio.to_thread(self._lease)
+        if not rows:
+            return 0
+        done, failed, retry, deferred, blocked = [], [], [], [], []
+
+        async def deliver(row_id: int, chat_id: int, attempts: int, text: str, file_id: Optional[str]) -> None:
+            try:
+                await self._send(bot, chat_id, text, file_id)
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Flood control hit during broadcast; pausing {delay}s")
+                deferred.append(row_id)
+            except Forbidden:
+                # The user blocked the bot or left the chat
+                blocked.append(chat_id)
+                failed.append(row_id)
+            except BadRequest as e:
+                logger.debug(f"Dropping broadcast to chat {chat_id}: {str(e)}")
+                failed.append(row_id)
+            except TelegramError as e:
+                logger.debug(f"Broadcast to chat {chat_id} failed (attempt {attempts + 1}): {str(e)}")
+                (failed if attempts + 1 >= self.max_attempts else retry).append(row_id)
+            else:
+                done.append(row_id)
+                self._sent_times.append(time.monotonic())
+
+        sends = []
+        for row_id, chat_id, attempts, text, file_id in rows:
+            if not self.chat_limiter.allow(chat_id):
+                # Another notification just went to this chat; pick it up in a later chunk
+                deferred.append(row_id)
+                continue
+            await self._acquire_global()
+            sends.append(asyncio.create_task(deliver(row_id, chat_id, attempts, text, file_id)))
+        if sends:
+            await asyncio.gather(*sends)
+
+        self.sent += len(done)
+        self.failed += len(failed)
+        await asyncio.to_thread(self._settle, done, failed, retry, deferred, blocked)
+        if blocked:
+            logger.info(f"Unsubscribed {len(blocked)} chats that blocked the bot")
+        return len(sends)
+
+    async def run(self, bot, idle_interval: float = 1.0) -> None:
+        """Batch new files and drain the send queue until cancelled."""
+        while True:
+            try:
+                await self._enqueue_due()
+                if not await self._drain_chunk(bot):
+                    await asyncio.sleep(idle_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broadcast engine error: {str(e)}", exc_info=True)
+                await asyncio.sleep(idle_interval)
+
+    def start(self, bot) -> None:
+        """Start sending on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run(bot))
+            logger.info("Broadcast engine started")
+
+    def attach(self, storage: StorageManager) -> None:
+        """Drop subscriptions of folders deleted through storage."""
+        storage.add_listener(self._on_storage_event)
+
+    # Reporting
+
+    def throughput(self, window: float = 60) -> float:
+        """Messages per second sent over the last window seconds."""
+        cutoff = time.monotonic() - window
+        return sum(1 for sent_at in self._sent_times if sent_at >= cutoff) / window
+
+    def stats(self) -> Dict[str, object]:
+        """Summarize subscribers, the queue and recent broadcasts (blocking)."""
+        connection = self._connect()
+        try:
+            subscribers = connection.execute("SELECT COUNT(DISTINCT chat_id) FROM subscriptions").fetchone()[0]
+            queued = connection.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+            pending = connection.execute("SELECT COUNT(DISTINCT folder) FROM announcements").fetchone()[0]
+            recent = connection.execute(
+                "SELECT id, folder, total, sent, failed, created, finished FROM broadcasts ORDER BY id DESC LIMIT 5"
+            ).fetchall()
+        finally:
+            connection.close()
+        return {
+            'subscribers': subscribers,
+            'queued': queued,
+            'pending_batches': pending,
+            'rate': self.throughput(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'recent': recent,
+        }
@@ -0,0 +1,235 @@
+import array
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from storage_manager import FILE_SAVED, FILE_DELETED, FOLDER_DELETED, TEMP_SUFFIX, StorageManager
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BOTCAT01"
+# magic, folder count, file count, string table bytes, creation time
+HEADER = struct.Struct('<8sIIQd')
+# name offset, name length, first file, file count, folder mtime_ns, lock mtime_ns
+FOLDER_RECORD = struct.Struct('<IIIIqq')
+
+Generation = Tuple[int, int]
+Entries = Dict[str, Tuple[int, float]]
+
+class CatalogSnapshot:
+    """Compact on-disk catalog of every listing, memory-mapped at startup.
+
+    Layout: a header, one fixed-size record per folder (name, file range and
+    the listing generation it was taken at), then column arrays for all files
+    sorted by folder (sizes, mtimes, folder ids, name offsets and lengths) and
+    finally one string table holding every folder and file name. Nothing is
+    decoded up front; a folder's entries are built from its range the first
+    time StorageManager asks for them, and only while its generation is
+    unchanged since the snapshot was written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._folders: Dict[str, Tuple[int, int, Generation]] = {}
+        self._sizes = self._mtimes = self._name_offsets = self._name_lengths = None
+        self._strings = None
+        # The mapping and the views into it; replaced (and closed) on every load
+        self._mapped: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self.dirty = False
+        self.loaded_at: Optional[float] = None
+        self.file_count = 0
+        self.hits = 0
+        self.load()
+
+    def load(self) -> bool:
+        """Memory-map the snapshot file; returns False if it is missing or unreadable."""
+        started = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return False
+
+        view = sizes = mtimes = name_offsets = name_lengths = strings = None
+        try:
+            view = memoryview(mapped)
+            magic, folder_count, file_count, strings_len, created = HEADER.unpack_from(view, 0)
+            if magic != MAGIC:
+                raise ValueError("bad magic")
+            offset = HEADER.size
+            records = []
+            for _ in range(folder_count):
+                records.append(FOLDER_RECORD.unpack_from(view, offset))
+                offset += FOLDER_RECORD.size
+
+            def column(fmt: str, width: int) -> memoryview:
+                nonlocal offset
+                data = view[offset:offset + width * file_count].cast(fmt)
+                offset += width * file_count
+                return data
+
+            sizes = column('Q', 8)
+            mtimes = column('d', 8)
+            column('I', 4)  # folder ids; ranges in the folder records make them redundant for lookups
+            name_offsets = column('I', 4)
+            name_lengths = column('I', 4)
+            strings = view[offset:offset + strings_len]
+            if len(strings) != strings_len:
+                raise ValueError("truncated snapshot")
+        except (ValueError, struct.error) as e:
+            logger.error(f"Ignoring unreadable catalog snapshot {self.path}: {str(e)}")
+            for data in (sizes, mtimes, name_offsets, name_lengths, strings, view):
+                if data is not None:
+                    data.release()
+            mapped.close()
+            return False
+
+        folders = {}
+        for name_offset, name_length, first, count, folder_mtime, lock_mtime in records:
+            name = bytes(strings[name_offset:name_offset + name_length]).decode('utf-8', 'surrogateescape')
+            folders[name] = (first, count, (folder_mtime, lock_mtime))
+        with self._lock:
+            self._release()
+            self._mapped, self._view = mapped, view
+            self._folders = folders
+            self._sizes, self._mtimes = sizes, mtimes
+            self._name_offsets, self._name_lengths = name_offsets, name_lengths
+            self._strings = strings
+            self.file_count = file_count
+            self.loaded_at = created
+        logger.info(f"Mapped catalog snapshot with {len(folders)} folders and {file_count} files "
+                    f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return True
+
+    def _release(self) -> None:
+        """Release the views of the current mapping and close it (caller holds _lock)."""
+        for data in (self._sizes, self._mtimes, self._name_offsets, self._name_lengths, self._strings, self._view):
+            if data is not None:
+                data.release()
+        self._sizes = self._mtimes = self._name_offsets = self._name_lengths = None
+        self._strings = self._view = None
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+        self._folders = {}
+
+    def close(self) -> None:
+        """Unmap the snapshot; entries_for finds nothing until the next load."""
+        with self._lock:
+            self._release()
+
+    def entries_for(self, folder_name: str, generation: Generation) -> Optional[Entries]:
+        """Build a folder's entries from the snapshot if it was taken at this generation."""
+        with self._lock:
+            record = self._folders.get(folder_name)
+            if record is None or record[2] != tuple(generation):
+                # The folder changed since the snapshot; the next save pass refreshes it
+                self.dirty = True
+                return None
+            first, count, _ = record
+            sizes, mtimes = self._sizes, self._mtimes
+            offsets, lengths, strings = self._name_offsets, self._name_lengths, self._strings
+            entries = {}
+            for i in range(first, first + count):
+                name = bytes(strings[offsets[i]:offsets[i] + lengths[i]]).decode('utf-8', 'surrogateescape')
+                entries[name] = (sizes[i], mtimes[i])
+            self.hits += 1
+            return entries
+
+    def write(self, storage: StorageManager) -> int:
+        """Atomically write a snapshot of every folder listing (blocking); returns the file count."""
+        self.dirty = False
+        strings = bytearray()
+        interned: Dict[str, int] = {}
+
+        def intern(text: str) -> Tuple[int, int]:
+            encoded = text.encode('utf-8', 'surrogateescape')
+            offset = interned.get(text)
+            if offset is None:
+                offset = interned[text] = len(strings)
+                strings.extend(encoded)
+            return offset, len(encoded)
+
+        records = []
+        sizes, mtimes = array.array('Q'), array.array('d')
+        folder_ids, name_offsets, name_lengths = array.array('I'), array.array('I'), array.array('I')
+        for folder_id, folder_name in enumerate(sorted(storage.list_folders())):
+            try:
+                generation, entries = storage.listing_state(folder_name)
+            except FileNotFoundError:
+                continue  # Deleted while the snapshot was being taken
+            name_offset, name_length = intern(folder_name)
+            records.append((name_offset, name_length, len(sizes), len(entries), generation[0], generation[1]))
+            for filename, (size, mtime) in entries.items():
+                offset, length = intern(filename)
+                sizes.append(size)
+                mtimes.append(mtime)
+                folder_ids.append(folder_id)
+                name_offsets.append(offset)
+                name_lengths.append(length)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}{TEMP_SUFFIX}-{uuid.uuid4().hex}"
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(records), len(sizes), len(strings), time.time()))
+            for record in records:
+                f.write(FOLDER_RECORD.pack(*record))
+            for column in (sizes, mtimes, folder_ids, name_offsets, name_lengths):
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                column.tofile(f)
+            f.write(strings)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        logger.info(f"Wrote catalog snapshot: {len(records)} folders, {len(sizes)} files, "
+                    f"{os.path.getsize(self.path)} bytes")
+        self.load()
+        return len(sizes)
+
+    def find_drift(self, storage: StorageManager) -> Dict[str, Dict[str, Optional[Tuple[int, float]]]]:
+        """Compare cached listings with a real scan of the tree (blocking).
+
+        Returns the differences per folder in the form accepted by
+        StorageManager.apply_external_changes. Archived cold-tier files count
+        as present.
+        """
+        drift = {}
+        for folder_name in storage.list_folders():
+            cached = storage.cached_listing_state(folder_name)
+            if not cached:
+                continue  # Not cached, so the next access scans anyway
+            try:
+                actual = {name: (stat.size, stat.mtime) for name, stat in storage.backend.list(folder_name).items()}
+            except FileNotFoundError:
+                continue
+            if storage.cold_tier:
+                for filename, meta in storage.cold_tier.entries(folder_name).items():
+                    actual.setdefault(filename, meta)
+            believed = cached[1]
+            changes = {name: actual.get(name) for name in set(actual) | set(believed)
+                       if actual.get(name) != believed.get(name)}
+            if changes:
+                drift[folder_name] = changes
+        return drift
+
+    def _on_storage_event(self, event: str, folder_name: str, filename: Optional[str]) -> None:
+        """Mark the snapshot stale after any mutation."""
+        if event in (FILE_SAVED, FILE_DELETED, FOLDER_DELETED):
+            self.dirty = True
+
+    def attach(self, storage: StorageManager) -> None:
+        """Seed storage listings from this snapshot and track mutations."""
+        storage.snapshot = self
+        storage.add_listener(self._on_storage_event)
+        if self.loaded_at is None:
+            # No snapshot yet; write one on the first save pass
+            self.dirty = True
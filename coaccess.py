@@ -0,0 +1,209 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+from storage_manager import FILE_DELETED, FOLDER_DELETED, StorageManager
+
+logger = logging.getLogger(__name__)
+
+FileKey = Tuple[str, str]  # (folder_name, filename)
+
+FETCH = "fetch"
+SEARCH = "search"
+
+class AccessLog:
+    """Append-only log of searches and downloads, one JSON object per line.
+
+    record() only appends to a deque; flush() writes the pending events in one
+    append from a background job. When the log grows past max_bytes it is
+    rotated to <path>.1, keeping one previous generation.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._pending: Deque[dict] = deque()
+
+    def record(self, kind: str, chat_id: int, files: Iterable[FileKey], query: Optional[str] = None) -> None:
+        """Record one search (with the files it showed) or one download (cheap; safe from handlers)."""
+        event = {'t': time.time(), 'c': chat_id, 'e': kind, 'f': [list(key) for key in files]}
+        if query is not None:
+            event['q'] = query
+        self._pending.append(event)
+
+    def flush(self) -> int:
+        """Append pending events to the log (blocking); returns how many were written."""
+        if not self._pending:
+            return 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            if os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+                logger.info(f"Rotated access log {self.path}")
+        except FileNotFoundError:
+            pass
+        lines = []
+        while self._pending:
+            lines.append(json.dumps(self._pending.popleft(), ensure_ascii=False))
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        return len(lines)
+
+class CoAccessIndex:
+    """Item-item co-access counts with precomputed top-k neighbours per file.
+
+    Events are grouped into sessions per chat (a gap longer than session_gap
+    starts a new one). Two files downloaded in the same session count 1.0
+    towards each other; a download also counts shown_weight towards files
+    that a search in the session showed. update() reads only the part of the
+    log added since the last call and recomputes the neighbours of files it
+    touched, so neighbours() is a dictionary lookup.
+    """
+
+    def __init__(self, log_path: str, top_k: int = 5, session_gap: float = 1800,
+                 shown_weight: float = 0.25, max_session_items: int = 50):
+        self.log_path = log_path
+        self.top_k = top_k
+        self.session_gap = session_gap
+        self.shown_weight = shown_weight
+        self.max_session_items = max_session_items
+        self._lock = threading.Lock()
+        self._counts: Dict[FileKey, Dict[FileKey, float]] = {}
+        self._neighbours: Dict[FileKey, List[Tuple[FileKey, float]]] = {}
+        # chat -> (last event time, {file: weight it pairs with})
+        self._sessions: Dict[int, Tuple[float, Dict[FileKey, float]]] = {}
+        self._inode: Optional[int] = None
+        self._offset = 0
+        self._started = False
+        self.events = 0
+
+    def neighbours(self, folder_name: str, filename: str, limit: Optional[int] = None) -> List[Tuple[FileKey, float]]:
+        """Return files most often accessed together with this one, strongest first."""
+        return self._neighbours.get((folder_name, filename), [])[:limit or self.top_k]
+
+    def _add_pair(self, a: FileKey, b: FileKey, weight: float, touched: Set[FileKey]) -> None:
+        """Count a co-access in both directions (caller holds _lock)."""
+        for key, other in ((a, b), (b, a)):
+            counts = self._counts.setdefault(key, {})
+            counts[other] = counts.get(other, 0.0) + weight
+        touched.update((a, b))
+
+    def _apply(self, event: dict, touched: Set[FileKey]) -> None:
+        """Fold one log event into its chat's session (caller holds _lock)."""
+        chat_id, timestamp = event['c'], event['t']
+        last, items = self._sessions.get(chat_id, (timestamp, {}))
+        if timestamp - last > self.session_gap:
+            items = {}
+        files = [tuple(key) for key in event['f']]
+        if event['e'] == FETCH:
+            for key in files:
+                if items.get(key) == 1.0:
+                    continue  # Downloading the same file again adds nothing
+                for other, other_weight in items.items():
+                    if other != key:
+                        self._add_pair(key, other, other_weight, touched)
+                items.pop(key, None)
+                items[key] = 1.0
+        else:
+            for key in files:
+                items.setdefault(key, self.shown_weight)
+        while len(items) > self.max_session_items:
+            items.pop(next(iter(items)))
+        self._sessions[chat_id] = (timestamp, items)
+        self.events += 1
+
+    def _read_new_events(self, path: str, offset: int) -> Tuple[List[dict], int]:
+        """Read complete lines of a log file from offset; returns (events, new offset)."""
+        events = []
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return events, offset
+        end = data.rfind(b"\n") + 1  # Leave a partly written last line for the next pass
+        for line in data[:end].splitlines():
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                logger.warning(f"Skipping malformed access log line in {path}")
+        return events, offset + end
+
+    def update(self, batch_size: int = 5000) -> int:
+        """Fold new log events into the index (blocking); returns how many were applied."""
+        events = []
+        try:
+            inode = os.stat(self.log_path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if not self._started:
+            # The previous generation is read once so a rotation does not empty the index
+            events, _ = self._read_new_events(f"{self.log_path}.1", 0)
+            self._started = True
+        if inode != self._inode:
+            # First run, or the log was rotated after we finished reading it
+            self._inode, self._offset = inode, 0
+        new_events, self._offset = self._read_new_events(self.log_path, self._offset)
+        events += new_events
+
+        touched: Set[FileKey] = set()
+        for start in range(0, len(events), batch_size):
+            # Release the lock between batches so forget() on the event loop never waits long
+            with self._lock:
+                for event in events[start:start + batch_size]:
+                    self._apply(event, touched)
+        with self._lock:
+            cutoff = time.time() - self.session_gap
+            self._sessions = {chat: session for chat, session in self._sessions.items() if session[0] >= cutoff}
+            for key in touched:
+                self._refresh(key)
+        if events:
+            logger.debug(f"Co-access index applied {len(events)} events, refreshed {len(touched)} files")
+        return len(events)
+
+    def _refresh(self, key: FileKey) -> None:
+        """Recompute the top-k neighbours of one file (caller holds _lock)."""
+        counts = self._counts.get(key)
+        if counts:
+            self._neighbours[key] = heapq.nlargest(self.top_k, counts.items(), key=lambda item: item[1])
+        else:
+            self._neighbours.pop(key, None)
+
+    def forget(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Drop a deleted file or folder from the index and from its neighbours' lists."""
+        with self._lock:
+            keys = [key for key in self._counts
+                    if key[0] == folder_name and (filename is None or key[1] == filename)]
+            touched = set()
+            for key in keys:
+                for other in self._counts.pop(key, {}):
+                    if other in self._counts:
+                        self._counts[other].pop(key, None)
+                        touched.add(other)
+                self._neighbours.pop(key, None)
+            for key in touched - set(keys):
+                self._refresh(key)
+
+    def _on_storage_event(self, event: str, folder_name: str, filename: Optional[str]) -> None:
+        """Keep deleted files out of recommendations."""
+        if event == FILE_DELETED:
+            self.forget(folder_name, filename)
+        elif event == FOLDER_DELETED:
+            self.forget(folder_name)
+
+    def attach(self, storage: StorageManager) -> None:
+        """Track deletions in storage."""
+        storage.add_listener(self._on_storage_event)
+
+    def stats(self) -> Dict[str, int]:
+        """Summarize the index size."""
+        return {
+            'files': len(self._counts),
+            'pairs': sum(len(counts) for counts in self._counts.values()) // 2,
+            'events': self.events,
+        }
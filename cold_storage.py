@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Non-POSIX platforms fall back to in-process locking only
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional and not a declared dependency; zlib is the default codec
+    zstandard = None
+
+from storage_manager import FILE_SAVED, FILE_DELETED, FOLDER_DELETED, TEMP_SUFFIX, StorageManager
+
+logger = logging.getLogger(__name__)
+
+COLD_DIR = ".cold"
+INDEX_FILE = "index.json"
+INDEX_LOCK_FILE = "index.lock"
+
+CHUNK_SIZE = 1024 * 1024
+
+def compress_stream(source: BinaryIO, target: BinaryIO, level: int) -> str:
+    """Compress source into target chunk by chunk with zstd when available, otherwise zlib; returns the codec."""
+    if zstandard is not None:
+        zstandard.ZstdCompressor(level=level).copy_stream(source, target, read_size=CHUNK_SIZE, write_size=CHUNK_SIZE)
+        return "zstd"
+    compressor = zlib.compressobj(min(level, 9))
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+        target.write(compressor.compress(chunk))
+    target.write(compressor.flush())
+    return "zlib"
+
+def decompress_stream(codec: str, source: BinaryIO, length: int, target: BinaryIO) -> None:
+    """Decompress the length-byte frame at source's position into target chunk by chunk."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("File was archived with zstd; install zstandard to restore it")
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decompressor = zlib.decompressobj()
+    remaining = length
+    while remaining > 0:
+        chunk = source.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise EOFError("Cold pack is truncated")
+        remaining -= len(chunk)
+        target.write(decompressor.decompress(chunk))
+    target.write(decompressor.flush())
+
+class ColdStorage:
+    """Compressed cold tier for files nobody has fetched in a long time.
+
+    Files are stream-compressed one frame at a time and appended to pack files under
+    .cold/; the index maps (folder, filename) to the pack, offset and length of
+    its frame plus the original size and mtime. Listings and search read only
+    the index, and a frame is read back and decompressed on first access.
+    """
+
+    def __init__(self, storage: StorageManager, max_pack_bytes: int = 1024 * 1024 * 1024,
+                 compression_level: int = 10):
+        self.storage = storage
+        self.max_pack_bytes = max_pack_bytes
+        self.compression_level = compression_level
+        self.cold_dir = os.path.join(storage.base_path, COLD_DIR)
+        os.makedirs(self.cold_dir, exist_ok=True)
+        self.index_path = os.path.join(self.cold_dir, INDEX_FILE)
+        # folder -> filename -> {pack, offset, length, size, mtime, codec}
+        self._index: Dict[str, Dict[str, dict]] = {}
+        self._index_mtime = None
+        self._lock = threading.Lock()
+        self.archived_count = 0
+        self.restored_count = 0
+        with self._lock:
+            self._reload_if_changed()
+
+    def _reload_if_changed(self) -> None:
+        """Reload the index if another process rewrote it (caller holds _lock)."""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._index_mtime:
+            return
+        if mtime is None:
+            self._index = {}
+        else:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to load cold storage index: {str(e)}", exc_info=True)
+                return
+        self._index_mtime = mtime
+
+    def _save_index(self) -> None:
+        """Atomically rewrite the index (caller holds the index lock)."""
+        temp_path = f"{self.index_path}{TEMP_SUFFIX}-{uuid.uuid4().hex}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    @contextmanager
+    def _locked_index(self) -> Iterator[Dict[str, Dict[str, dict]]]:
+        """Hold the index exclusively across threads and processes, then save it."""
+        with self._lock, open(os.path.join(self.cold_dir, INDEX_LOCK_FILE), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload_if_changed()
+                yield self._index
+                self._save_index()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def entries(self, folder_name: str) -> Dict[str, Tuple[int, float]]:
+        """Map each archived file of a folder to its original (size, mtime)."""
+        with self._lock:
+            self._reload_if_changed()
+            return {filename: (entry['size'], entry['mtime'])
+                    for filename, entry in self._index.get(folder_name, {}).items()}
+
+    def contains(self, folder_name: str, filename: str) -> bool:
+        """Check whether a file lives in the cold tier."""
+        with self._lock:
+            self._reload_if_changed()
+            return filename in self._index.get(folder_name, {})
+
+    def _current_pack(self, incoming: int) -> str:
+        """Return the pack to append to, starting a new one when the current is full."""
+        packs = sorted(name for name in os.listdir(self.cold_dir) if name.endswith('.pack'))
+        if packs:
+            path = os.path.join(self.cold_dir, packs[-1])
+            size = os.path.getsize(path)
+            if size == 0 or size + incoming <= self.max_pack_bytes:
+                return packs[-1]
+            number = int(packs[-1][len('pack-'):-len('.pack')]) + 1
+        else:
+            number = 1
+        return f"pack-{number:06d}.pack"
+
+    def _append_files(self, files: List[Tuple[str, str, os.stat_result]]) -> List[Tuple[str, str, dict]]:
+        """Stream-compress files into the current pack, one frame each, and fsync it."""
+        pack_name = self._current_pack(sum(stat.st_size for _, _, stat in files))
+        placed = []
+        with open(os.path.join(self.cold_dir, pack_name), 'ab') as pack:
+            for folder_name, filename, stat in files:
+                path = os.path.join(self.storage.folder_path(folder_name), filename)
+                try:
+                    source = open(path, 'rb')
+                except FileNotFoundError:
+                    continue
+                offset = pack.tell()
+                with source:
+                    codec = compress_stream(source, pack, self.compression_level)
+                placed.append((folder_name, filename, {
+                    'pack': pack_name, 'offset': offset, 'length': pack.tell() - offset,
+                    'size': stat.st_size, 'mtime': stat.st_mtime, 'codec': codec
+                }))
+            pack.flush()
+            os.fsync(pack.fileno())
+        return placed
+
+    def _drop_unreferenced_packs(self) -> None:
+        """Delete packs no index entry points to anymore (caller holds the index lock)."""
+        live = {entry['pack'] for files in self._index.values() for entry in files.values()}
+        packs = sorted(name for name in os.listdir(self.cold_dir) if name.endswith('.pack'))
+        # The newest pack stays; it is still being appended to
+        for name in packs[:-1]:
+            if name not in live:
+                os.remove(os.path.join(self.cold_dir, name))
+                logger.info(f"Removed empty cold pack: {name}")
+
+    def archive(self, files: List[Tuple[str, str]]) -> Tuple[int, int]:
+        """Move files into the cold tier; returns (files archived, bytes saved on disk).
+
+        Frames are appended and the index is saved before any original is
+        removed, so a crash never loses a file. A file that changed while it
+        was being compressed stays hot.
+        """
+        present = []
+        for folder_name, filename in files:
+            try:
+                present.append((folder_name, filename,
+                                os.stat(os.path.join(self.storage.folder_path(folder_name), filename))))
+            except FileNotFoundError:
+                continue
+        placed = self._append_files(present) if present else []
+        if not placed:
+            return 0, 0
+
+        with self._locked_index() as index:
+            for folder_name, filename, entry in placed:
+                index.setdefault(folder_name, {})[filename] = entry
+
+        archived = 0
+        saved = 0
+        stale = []
+        for folder_name, filename, entry in placed:
+            path = os.path.join(self.storage.folder_path(folder_name), filename)
+            try:
+                with self.storage.folder_lock(folder_name):
+                    stat = os.stat(path)
+                    if stat.st_size != entry['size'] or stat.st_mtime != entry['mtime']:
+                        stale.append((folder_name, filename))
+                        continue
+                    os.remove(path)
+                    self.storage.invalidate_folder(folder_name)
+            except FileNotFoundError:
+                stale.append((folder_name, filename))
+                continue
+            archived += 1
+            saved += entry['size'] - entry['length']
+            logger.info(f"Archived {folder_name}/{filename} to {entry['pack']} "
+                        f"({entry['size']} -> {entry['length']} bytes, {entry['codec']})")
+
+        if stale:
+            with self._locked_index() as index:
+                for folder_name, filename in stale:
+                    index.get(folder_name, {}).pop(filename, None)
+        self.archived_count += archived
+        return archived, saved
+
+    def archive_idle(self, idle_seconds: float,
+                     last_access: Optional[Callable[[str, str], Optional[float]]] = None) -> Tuple[int, int]:
+        """Archive every hot file not modified or fetched within idle_seconds (blocking)."""
+        now = time.time()
+        candidates = []
+        for folder_name in self.storage.list_folders():
+            with os.scandir(self.storage.folder_path(folder_name)) as it:
+                for entry in it:
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    accessed = max(stat.st_mtime, stat.st_atime,
+                                   (last_access(folder_name, entry.name) if last_access else None) or 0.0)
+                    if now - accessed > idle_seconds:
+                        candidates.append((folder_name, entry.name))
+        archived, saved = self.archive(candidates)
+        if archived:
+            logger.info(f"Cold tier migration archived {archived} files, saving {saved} bytes")
+        return archived, saved
+
+    def restore(self, folder_name: str, filename: str) -> str:
+        """Decompress an archived file back into its folder and return its path."""
+        with self._lock:
+            self._reload_if_changed()
+            entry = self._index.get(folder_name, {}).get(filename)
+        if entry is None:
+            raise FileNotFoundError(f"'{filename}' is not in the cold tier")
+
+        folder_path = self.storage.folder_path(folder_name)
+        file_path = os.path.join(folder_path, filename)
+        temp_path = os.path.join(folder_path, f".{filename}{TEMP_SUFFIX}-{uuid.uuid4().hex}")
+        try:
+            with open(os.path.join(self.cold_dir, entry['pack']), 'rb') as pack, open(temp_path, 'wb') as f:
+                pack.seek(entry['offset'])
+                decompress_stream(entry['codec'], pack, entry['length'], f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.utime(temp_path, (time.time(), entry['mtime']))
+            with self.storage.folder_lock(folder_name):
+                # A delete or concurrent restore may have won the race meanwhile
+                if self.forget(folder_name, filename):
+                    os.replace(temp_path, file_path)
+                    self.storage.invalidate_folder(folder_name)
+                    self.restored_count += 1
+                    logger.info(f"Restored {folder_name}/{filename} from the cold tier")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"'{filename}' was deleted while it was being restored")
+        return file_path
+
+    def forget(self, folder_name: str, filename: Optional[str] = None) -> bool:
+        """Drop archived entries of a file or whole folder; returns whether any existed."""
+        with self._locked_index() as index:
+            if filename is None:
+                removed = index.pop(folder_name, None) is not None
+            else:
+                removed = index.get(folder_name, {}).pop(filename, None) is not None
+                if folder_name in index and not index[folder_name]:
+                    del index[folder_name]
+            if removed:
+                self._drop_unreferenced_packs()
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of archived files and their original and packed sizes."""
+        with self._lock:
+            self._reload_if_changed()
+            entries = [entry for files in self._index.values() for entry in files.values()]
+        return {
+            'files': len(entries),
+            'original_bytes': sum(entry['size'] for entry in entries),
+            'packed_bytes': sum(entry['length'] for entry in entries),
+        }
+
+    def _on_storage_event(self, event: str, folder_name: str, filename: Optional[str]) -> None:
+        """Drop archived copies superseded by a new upload or removed by a delete."""
+        if event == FOLDER_DELETED:
+            self.forget(folder_name)
+        elif event in (FILE_SAVED, FILE_DELETED) and filename and self.contains(folder_name, filename):
+            self.forget(folder_name, filename)
+
+    def attach(self, storage: StorageManager) -> None:
+        """Serve archived files through storage and keep the index in sync with it."""
+        storage.cold_tier = self
+        storage.add_listener(self._on_storage_event)
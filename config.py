@@ -2,10 +2,31 @@ import os
 
 # Bot configuration
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+# Self-hosted telegram-bot-api server started with --local (e.g. http://localhost:8081).
+# Uploads are then taken from its files directory by path and sends pass local paths;
+# its working directory must be visible to the bot at the same path.
+LOCAL_BOT_API_URL = os.environ.get("LOCAL_BOT_API_URL", "").rstrip("/")
+# How uploads leave the server's files directory: "link" (hardlink) or "move"
+LOCAL_BOT_API_INGEST = os.environ.get("LOCAL_BOT_API_INGEST", "link")
 
 # Storage configuration
 STORAGE_PATH = os.path.abspath("storage")  # Use absolute path
 
+# Where file contents live: "local" (STORAGE_PATH), "memory" (lost on exit) or "s3".
+# With a non-local backend STORAGE_PATH still holds locks, state and a local
+# cache of fetched files; the cold tier, snapshots, the storage watcher,
+# previews and media optimization need the local backend and are disabled.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+# S3-compatible object storage (AWS, MinIO, ...); credentials come from the usual AWS_* variables
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_PREFIX = os.environ.get("S3_PREFIX", "")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+S3_REGION = os.environ.get("S3_REGION") or None
+S3_MULTIPART_MB = float(os.environ.get("S3_MULTIPART_MB", "8"))
+S3_MAX_CONNECTIONS = int(os.environ.get("S3_MAX_CONNECTIONS", "16"))
+# Size of the local cache of files fetched from a remote backend
+REMOTE_CACHE_MB = float(os.environ.get("REMOTE_CACHE_MB", "1024"))
+
 # Allowed file types
 ALLOWED_EXTENSIONS = {
     '.pdf',
@@ -13,5 +34,152 @@ ALLOWED_EXTENSIONS = {
     '.mp4', '.avi', '.mov'
 }
 
-# Maximum file size (in bytes)
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
\ No newline at end of file
+# Maximum file size (in bytes): 2000MB through a local Bot API server, 50MB otherwise
+MAX_FILE_SIZE = (2000 if LOCAL_BOT_API_URL else 50) * 1024 * 1024
+
+# Deployment configuration
+# Number of worker processes that handle updates. 0 keeps the classic
+# single-process mode; N > 0 runs one ingress process that shards updates
+# by chat ID across N workers sharing the same storage tree.
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0"))
+
+# Receive updates through a webhook instead of polling when a URL is set
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+
+# Persistence configuration: bot_data/chat_data/user_data survive restarts
+PERSISTENCE_PATH = os.environ.get(
+    "PERSISTENCE_PATH", os.path.join(STORAGE_PATH, ".state", "bot_state.sqlite3")
+)
+PERSISTENCE_UPDATE_INTERVAL = float(os.environ.get("PERSISTENCE_UPDATE_INTERVAL", "30"))
+
+# Numbered folder registry (seeded from folder_registry.DEFAULT_FOLDERS on first start)
+FOLDER_REGISTRY_PATH = os.environ.get(
+    "FOLDER_REGISTRY_PATH", os.path.join(STORAGE_PATH, ".state", "folders.json")
+)
+
+# Access control: admins by Telegram user ID (comma-separated), plus per-folder
+# and per-file locks and grants managed with /lock and /share
+ADMIN_USER_IDS = [int(uid) for uid in os.environ.get("ADMIN_USER_IDS", "").replace(" ", "").split(",") if uid]
+# Usernames made admins (pinned to their user ID) the first time they use the bot;
+# set to an empty string to disable, and drop a claimed admin with /unadmin
+ADMIN_BOOTSTRAP_USERNAMES = [name for name in os.environ.get(
+    "ADMIN_BOOTSTRAP_USERNAMES", "CV_Owner,Ace_Clat").replace(" ", "").split(",") if name]
+ACL_PATH = os.environ.get("ACL_PATH", os.path.join(STORAGE_PATH, ".state", "acl.json"))
+
+# Memory-mapped catalog of every folder listing, so startup does not rescan storage/
+CATALOG_SNAPSHOT_PATH = os.environ.get(
+    "CATALOG_SNAPSHOT_PATH", os.path.join(STORAGE_PATH, ".state", "catalog.bin")
+)
+CATALOG_SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get("CATALOG_SNAPSHOT_INTERVAL_SECONDS", "60"))
+CATALOG_DRIFT_CHECK_INTERVAL_SECONDS = float(os.environ.get("CATALOG_DRIFT_CHECK_INTERVAL_SECONDS", "3600"))
+
+# New-file notifications for folder subscribers: uploads within the debounce
+# window are batched, and sends are paced to stay under Telegram's flood limits
+BROADCAST_DB_PATH = os.environ.get(
+    "BROADCAST_DB_PATH", os.path.join(STORAGE_PATH, ".state", "broadcast.sqlite3")
+)
+BROADCAST_DEBOUNCE_SECONDS = float(os.environ.get("BROADCAST_DEBOUNCE_SECONDS", "30"))
+BROADCAST_MAX_DELAY_SECONDS = float(os.environ.get("BROADCAST_MAX_DELAY_SECONDS", "300"))
+BROADCAST_RATE_PER_SECOND = float(os.environ.get("BROADCAST_RATE_PER_SECOND", "25"))
+BROADCAST_CHAT_INTERVAL_SECONDS = float(os.environ.get("BROADCAST_CHAT_INTERVAL_SECONDS", "1.0"))
+
+# "Students also fetched" recommendations from an append-only log of searches and downloads
+ACCESS_LOG_PATH = os.environ.get(
+    "ACCESS_LOG_PATH", os.path.join(STORAGE_PATH, ".state", "access.log")
+)
+ACCESS_LOG_MAX_MB = float(os.environ.get("ACCESS_LOG_MAX_MB", "64"))
+COACCESS_REFRESH_SECONDS = float(os.environ.get("COACCESS_REFRESH_SECONDS", "300"))
+COACCESS_SESSION_MINUTES = float(os.environ.get("COACCESS_SESSION_MINUTES", "30"))
+RECOMMENDATIONS_SHOWN = int(os.environ.get("RECOMMENDATIONS_SHOWN", "3"))
+
+# Usage analytics: events are buffered in memory and flushed to SQLite with hourly/daily rollups
+ANALYTICS_DB_PATH = os.environ.get(
+    "ANALYTICS_DB_PATH", os.path.join(STORAGE_PATH, ".state", "analytics.sqlite3")
+)
+ANALYTICS_BUFFER_SIZE = int(os.environ.get("ANALYTICS_BUFFER_SIZE", "100000"))
+ANALYTICS_FLUSH_SECONDS = float(os.environ.get("ANALYTICS_FLUSH_SECONDS", "10"))
+ANALYTICS_RAW_RETENTION_DAYS = float(os.environ.get("ANALYTICS_RAW_RETENTION_DAYS", "7"))
+
+# Preview configuration: small previews generated in the background on upload
+ENABLE_PREVIEWS = os.environ.get("ENABLE_PREVIEWS", "1") == "1"
+PREVIEW_WORKERS = int(os.environ.get("PREVIEW_WORKERS", "2"))
+PREVIEW_MAX_DIMENSION = int(os.environ.get("PREVIEW_MAX_DIMENSION", "320"))
+
+# Optional re-encoding of uploads into smaller variants (originals are kept)
+ENABLE_MEDIA_OPTIMIZATION = os.environ.get("ENABLE_MEDIA_OPTIMIZATION", "0") == "1"
+OPTIMIZER_WORKERS = int(os.environ.get("OPTIMIZER_WORKERS", "1"))
+# Minimum relative size reduction for a variant to be kept
+OPTIMIZER_MIN_SAVINGS = float(os.environ.get("OPTIMIZER_MIN_SAVINGS", "0.1"))
+
+# Popularity tracking and the in-memory warm tier for hot files
+POPULARITY_HALF_LIFE_HOURS = float(os.environ.get("POPULARITY_HALF_LIFE_HOURS", "72"))
+# How often each process merges its access counts into the scores stored with the bot state
+POPULARITY_PERSIST_SECONDS = float(os.environ.get("POPULARITY_PERSIST_SECONDS", "60"))
+WARM_CACHE_BYTES = int(os.environ.get("WARM_CACHE_BYTES", str(64 * 1024 * 1024)))
+WARM_CACHE_MAX_FILE_BYTES = int(os.environ.get("WARM_CACHE_MAX_FILE_BYTES", str(5 * 1024 * 1024)))
+# Number of hottest files whose bytes are preloaded into the warm tier
+WARM_TIER_SIZE = int(os.environ.get("WARM_TIER_SIZE", "50"))
+WARM_TIER_REFRESH_SECONDS = float(os.environ.get("WARM_TIER_REFRESH_SECONDS", "30"))
+
+# "Send all" on search results: matches go out as albums of up to 10 documents
+SEND_ALL_MAX_FILES = int(os.environ.get("SEND_ALL_MAX_FILES", "50"))
+ALBUM_CHAT_INTERVAL_SECONDS = float(os.environ.get("ALBUM_CHAT_INTERVAL_SECONDS", "3.0"))
+ALBUM_MAX_PARALLEL = int(os.environ.get("ALBUM_MAX_PARALLEL", "4"))
+
+# Search ranking weights (see ranking.RankingWeights)
+RANKING_WEIGHT_POSITION = float(os.environ.get("RANKING_WEIGHT_POSITION", "1.0"))
+RANKING_WEIGHT_TOKEN_OVERLAP = float(os.environ.get("RANKING_WEIGHT_TOKEN_OVERLAP", "1.0"))
+RANKING_WEIGHT_RECENCY = float(os.environ.get("RANKING_WEIGHT_RECENCY", "0.3"))
+RANKING_WEIGHT_POPULARITY = float(os.environ.get("RANKING_WEIGHT_POPULARITY", "0.5"))
+RANKING_RECENCY_HALF_LIFE_DAYS = float(os.environ.get("RANKING_RECENCY_HALF_LIFE_DAYS", "30"))
+
+# Inline mode (@bot <query>): debounce, server-side answer cache and local result cache
+INLINE_DEBOUNCE_SECONDS = float(os.environ.get("INLINE_DEBOUNCE_SECONDS", "0.4"))
+INLINE_CACHE_TIME = int(os.environ.get("INLINE_CACHE_TIME", "300"))
+INLINE_RESULT_TTL_SECONDS = float(os.environ.get("INLINE_RESULT_TTL_SECONDS", "60"))
+# Matches considered per query; beyond this a result is not reused for longer queries
+INLINE_MAX_CANDIDATES = int(os.environ.get("INLINE_MAX_CANDIDATES", "200"))
+
+# Storage quotas (0 = unlimited) and background maintenance
+FOLDER_QUOTA_MB = float(os.environ.get("FOLDER_QUOTA_MB", "0"))
+GLOBAL_QUOTA_MB = float(os.environ.get("GLOBAL_QUOTA_MB", "0"))
+STORAGE_MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get("STORAGE_MAINTENANCE_INTERVAL_SECONDS", "3600"))
+# Hidden temp files older than this are considered abandoned
+TEMP_FILE_MAX_AGE_SECONDS = float(os.environ.get("TEMP_FILE_MAX_AGE_SECONDS", "3600"))
+
+# Cold tier: files neither modified nor fetched for this many days are moved
+# into compressed packs under .cold/ (0 disables the migration)
+COLD_TIER_AFTER_DAYS = float(os.environ.get("COLD_TIER_AFTER_DAYS", "0"))
+COLD_TIER_CHECK_INTERVAL_SECONDS = float(os.environ.get("COLD_TIER_CHECK_INTERVAL_SECONDS", "86400"))
+COLD_PACK_MAX_MB = float(os.environ.get("COLD_PACK_MAX_MB", "1024"))
+# Packs are compressed with zlib (levels above 9 act as 9). zstd is used only if
+# the optional zstandard package is installed; it is not a declared dependency.
+COLD_COMPRESSION_LEVEL = int(os.environ.get("COLD_COMPRESSION_LEVEL", "10"))
+
+# Point-in-time snapshots of storage/ built from hardlinks under .snapshots/
+# (0 disables scheduled snapshots and the automatic one before /kickfolder)
+SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get("SNAPSHOT_INTERVAL_SECONDS", "3600"))
+# Retention: the newest N snapshots, plus the newest of each of the last D days
+SNAPSHOT_KEEP_LAST = int(os.environ.get("SNAPSHOT_KEEP_LAST", "24"))
+SNAPSHOT_KEEP_DAILY = int(os.environ.get("SNAPSHOT_KEEP_DAILY", "14"))
+
+# Watch storage/ for files added or removed by other tools (inotify, or polling without it)
+ENABLE_STORAGE_WATCHER = os.environ.get("ENABLE_STORAGE_WATCHER", "1") == "1"
+STORAGE_WATCHER_DEBOUNCE_SECONDS = float(os.environ.get("STORAGE_WATCHER_DEBOUNCE_SECONDS", "0.25"))
+STORAGE_WATCHER_POLL_SECONDS = float(os.environ.get("STORAGE_WATCHER_POLL_SECONDS", "1.0"))
+# How often the bot registers files bulk-imported by import_files.py while the watcher is off
+IMPORT_NOTICE_CHECK_SECONDS = float(os.environ.get("IMPORT_NOTICE_CHECK_SECONDS", "30"))
+
+# Updates handled concurrently and per-user rate limits. 1 keeps the usual
+# one-update-at-a-time order; above 1, updates of the same chat may be handled
+# out of order, which lets identical simultaneous searches and sends coalesce.
+# Worker processes always handle their updates one at a time.
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", "1"))
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "20"))
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", "10"))
+
+# Event-loop monitoring: stalls and handlers slower than these are logged with a stack
+LOOP_LAG_THRESHOLD_SECONDS = float(os.environ.get("LOOP_LAG_THRESHOLD_SECONDS", "0.25"))
+SLOW_HANDLER_SECONDS = float(os.environ.get("SLOW_HANDLER_SECONDS", "2.0"))
+PROFILE_MAX_SECONDS = int(os.environ.get("PROFILE_MAX_SECONDS", "300"))
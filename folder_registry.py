@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from storage_manager import FOLDER_DELETED, TEMP_SUFFIX, StorageManager
+
+logger = logging.getLogger(__name__)
+
+# Registry location relative to the storage base path
+REGISTRY_FILE = os.path.join(".state", "folders.json")
+
+# Folders the registry is seeded with on first start
+DEFAULT_FOLDERS = [
+    "GK-CA (1-Y) STATIC",
+    "GMB New (2025)",
+    "CLAT Gc Material",
+    "Case Laws & Judgments",
+    "CLAT Notification & Updates",
+    "English Language",
+    "Extra Resources",
+    "Group Study & Discussion Notes",
+    "Legal Maxims & Terms",
+    "Legal Reasoning",
+    "Logical Reasoning",
+    "Mock Tests",
+    "NLU Information",
+    "Notes & Summaries",
+    "Quants (Maths)",
+    "Syllabus & Strategy",
+    "Time Management & Study Planner",
+    "Video Lectures & PDFs"
+]
+
+def sanitize_folder_name(folder_name: str) -> str:
+    """Sanitize folder name to prevent path traversal."""
+    # Remove any path separators and spaces, preserve more characters
+    sanitized = "".join(c for c in folder_name if c.isalnum() or c in "-_@()")
+    logger.debug(f"Sanitizing folder name: '{folder_name}' -> '{sanitized}'")
+    return sanitized
+
+@dataclass(frozen=True)
+class FolderEntry:
+    """A registered folder: its 1-based number, display name and directory name."""
+    number: int
+    name: str
+    folder: str
+
+class FolderRegistry:
+    """Persistent, numbered list of folders with constant-time lookups.
+
+    Every folder keeps the number it was registered with, so /add, /get and
+    subscriptions that name a folder by number never silently move to another
+    one. A removed folder leaves a gap and a tombstone; only the same
+    directory, registered again, gets the number back, and new folders are
+    numbered after the highest number ever used. Lookups by number, directory
+    name and display name use maps rebuilt on every change, and the registry
+    reloads itself when another process rewrote the file.
+    """
+
+    def __init__(self, path: str, defaults: Iterable[str] = ()):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: List[FolderEntry] = []
+        # Removed folders by directory name, keeping their numbers reserved
+        self._removed: Dict[str, FolderEntry] = {}
+        self._by_number: Dict[int, FolderEntry] = {}
+        self._by_folder: Dict[str, FolderEntry] = {}
+        self._by_name: Dict[str, FolderEntry] = {}
+        self._mtime = None
+        # Bumped on every change so callers can cache derived views (e.g. keyboards)
+        self.version = 0
+        with self._lock:
+            if os.path.exists(self.path):
+                self._reload_if_changed()
+            else:
+                self._rebuild([FolderEntry(i + 1, name, sanitize_folder_name(name))
+                               for i, name in enumerate(defaults)], {})
+                self._save()
+                logger.info(f"Seeded folder registry with {len(self._entries)} folders")
+
+    def _rebuild(self, entries: List[FolderEntry], removed: Dict[str, FolderEntry]) -> None:
+        """Replace the entries, tombstones and lookup maps (caller holds _lock)."""
+        self._entries = sorted(entries, key=lambda entry: entry.number)
+        self._removed = removed
+        self._by_number = {entry.number: entry for entry in self._entries}
+        self._by_folder = {entry.folder: entry for entry in self._entries}
+        self._by_name = {entry.name.lower(): entry for entry in self._entries}
+        self.version += 1
+
+    def _reload_if_changed(self) -> None:
+        """Reload the registry if its file changed on disk (caller holds _lock)."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                folders = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load folder registry: {str(e)}", exc_info=True)
+            return
+        entries, removed = [], {}
+        for i, item in enumerate(folders):
+            # Registries written before numbers were stored are numbered by position
+            entry = FolderEntry(item.get('number', i + 1), item['name'], item['folder'])
+            if item.get('removed'):
+                removed[entry.folder] = entry
+            else:
+                entries.append(entry)
+        self._rebuild(entries, removed)
+        self._mtime = mtime
+        logger.info(f"Loaded folder registry with {len(self._entries)} folders")
+
+    def _save(self) -> None:
+        """Atomically write the registry (caller holds _lock)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}{TEMP_SUFFIX}-{uuid.uuid4().hex}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            items = [{'number': entry.number, 'name': entry.name, 'folder': entry.folder} for entry in self._entries]
+            items += [{'number': entry.number, 'name': entry.name, 'folder': entry.folder, 'removed': True}
+                      for entry in self._removed.values()]
+            json.dump(sorted(items, key=lambda item: item['number']), f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._entries)
+
+    def highest_number(self) -> int:
+        """Return the highest number of a registered folder (0 if there is none)."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._entries[-1].number if self._entries else 0
+
+    def entries(self) -> List[FolderEntry]:
+        """Return all folders in numbering order."""
+        with self._lock:
+            self._reload_if_changed()
+            return list(self._entries)
+
+    def by_number(self, number: int) -> Optional[FolderEntry]:
+        """Look up a folder by its 1-based number."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._by_number.get(number)
+
+    def by_folder(self, folder: str) -> Optional[FolderEntry]:
+        """Look up a folder by its directory (sanitized) name."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._by_folder.get(folder)
+
+    def by_name(self, name: str) -> Optional[FolderEntry]:
+        """Look up a folder by its display name, ignoring case."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._by_name.get(name.strip().lower())
+
+    def resolve(self, text: str) -> Optional[FolderEntry]:
+        """Resolve a folder number, display name or directory name."""
+        text = text.strip()
+        if text.isdigit():
+            return self.by_number(int(text))
+        return self.by_name(text) or self.by_folder(sanitize_folder_name(text))
+
+    def add(self, name: str, folder: Optional[str] = None) -> FolderEntry:
+        """Register a folder under a new number, or its old one if it was removed; returns
+        the existing entry if present."""
+        folder = folder or sanitize_folder_name(name)
+        if not folder:
+            raise ValueError(f"Invalid folder name: '{name}'")
+        with self._lock:
+            self._reload_if_changed()
+            existing = self._by_folder.get(folder)
+            if existing:
+                return existing
+            removed = dict(self._removed)
+            tombstone = removed.pop(folder, None)
+            if tombstone:
+                number = tombstone.number
+            else:
+                number = max([entry.number for entry in self._entries] +
+                             [entry.number for entry in removed.values()], default=0) + 1
+            entry = FolderEntry(number, name.strip(), folder)
+            self._rebuild(self._entries + [entry], removed)
+            self._save()
+            logger.info(f"Registered folder '{name}' ({folder}) as number {number}")
+            return entry
+
+    def remove(self, folder: str) -> Optional[FolderEntry]:
+        """Unregister a folder; its number stays reserved for it and other folders keep theirs."""
+        with self._lock:
+            self._reload_if_changed()
+            removed = self._by_folder.get(folder)
+            if removed is None:
+                return None
+            self._rebuild([entry for entry in self._entries if entry.folder != folder],
+                          {**self._removed, folder: removed})
+            self._save()
+            logger.info(f"Unregistered folder '{removed.name}' ({folder})")
+            return removed
+
+    def adopt(self, folders: Iterable[str]) -> List[FolderEntry]:
+        """Register directories that exist on disk but not in the registry."""
+        return [self.add(folder, folder) for folder in folders if self.by_folder(folder) is None]
+
+    def _on_storage_event(self, event: str, folder_name: str, filename: Optional[str]) -> None:
+        """Drop folders deleted by any means, including outside the bot."""
+        if event == FOLDER_DELETED:
+            self.remove(folder_name)
+
+    def attach(self, storage: StorageManager) -> None:
+        """Keep the registry in sync with folder deletions in storage."""
+        storage.add_listener(self._on_storage_event)
@@ -0,0 +1,271 @@
+"""Bulk import of a local directory tree into the bot's storage.
+
+Each top-level directory of the source tree is matched to a registered
+folder by number ("12"), display name ("Mock Tests") or sanitized name
+("MockTests"). Files below it are copied in parallel with SHA-256 checksums
+and registered with StorageManager once per folder. Progress is recorded in a
+manifest so an interrupted import resumes where it stopped.
+
+Registering here only refreshes listings; previews, notifications and the
+search indexes of a running bot follow storage events of the bot's own
+process. The import therefore leaves a notice under .state/imports/pending;
+on its next import check the bot announces the files to subscribers and,
+unless its storage watcher already reported them, registers them itself.
+
+Usage: python import_files.py <source_dir> [--workers N] [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from config import ALLOWED_EXTENSIONS, STORAGE_BACKEND, STORAGE_PATH
+from folder_registry import DEFAULT_FOLDERS, REGISTRY_FILE, FolderRegistry, sanitize_folder_name
+from storage_manager import StorageManager
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_DIR = os.path.join(".state", "imports")
+PENDING_DIR = os.path.join(MANIFEST_DIR, "pending")
+PART_SUFFIX = ".import-part"
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+
+def resolve_folder(dir_name: str, registry: FolderRegistry) -> Optional[str]:
+    """Map a source directory name to a registered folder's directory name."""
+    number_match = re.match(r'^\s*(\d+)\b', dir_name)
+    if number_match:
+        entry = registry.by_number(int(number_match.group(1)))
+        if entry:
+            return entry.folder
+
+    entry = registry.by_name(dir_name) or registry.by_folder(sanitize_folder_name(dir_name))
+    if entry:
+        return entry.folder
+    wanted = sanitize_folder_name(dir_name).lower()
+    for entry in registry.entries():
+        if entry.folder.lower() == wanted:
+            return entry.folder
+    return None
+
+def collect_files(source_dir: str, registry: FolderRegistry) -> Tuple[List[Tuple[str, str, str]], List[str]]:
+    """Return (relative_path, absolute_path, folder) for every importable file and unmatched dirs."""
+    entries = []
+    unmatched = []
+    for dir_name in sorted(os.listdir(source_dir)):
+        dir_path = os.path.join(source_dir, dir_name)
+        if not os.path.isdir(dir_path) or dir_name.startswith('.'):
+            continue
+        folder = resolve_folder(dir_name, registry)
+        if not folder:
+            unmatched.append(dir_name)
+            continue
+        for root, _, files in os.walk(dir_path):
+            for filename in sorted(files):
+                if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS:
+                    continue
+                absolute_path = os.path.join(root, filename)
+                entries.append((os.path.relpath(absolute_path, source_dir), absolute_path, folder))
+    return entries, unmatched
+
+def copy_with_checksum(source_path: str, destination_path: str) -> str:
+    """Copy a file through a temporary part file, returning the SHA-256 of the data."""
+    # Dot-prefixed so the partial file never shows up in listings
+    directory, filename = os.path.split(destination_path)
+    part_path = os.path.join(directory, f".{filename}{PART_SUFFIX}")
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as source, open(part_path, 'wb') as destination:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            destination.write(chunk)
+        destination.flush()
+        os.fsync(destination.fileno())
+    os.replace(part_path, destination_path)
+    return digest.hexdigest()
+
+class ImportManifest:
+    """Resumable record of files already imported from one source tree."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, object]] = {}
+        try:
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+            logger.info(f"Resuming import: {len(self.entries)} files already done")
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, relative_path: str, source_path: str, destination_path: str) -> bool:
+        """Check whether a file was imported and is unchanged on both sides."""
+        entry = self.entries.get(relative_path)
+        if not entry or not os.path.exists(destination_path):
+            return False
+        source_stat = os.stat(source_path)
+        return (entry['size'] == source_stat.st_size
+                and entry['mtime'] == source_stat.st_mtime
+                and os.path.getsize(destination_path) == source_stat.st_size)
+
+    def record(self, relative_path: str, source_path: str, destination: str, checksum: str) -> None:
+        """Remember a completed file."""
+        source_stat = os.stat(source_path)
+        with self._lock:
+            self.entries[relative_path] = {
+                'destination': destination,
+                'size': source_stat.st_size,
+                'mtime': source_stat.st_mtime,
+                'sha256': checksum
+            }
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(temp_path, self.path)
+
+def manifest_path_for(storage: StorageManager, source_dir: str) -> str:
+    """Derive a stable manifest location for a source directory."""
+    source_id = hashlib.sha256(os.path.abspath(source_dir).encode()).hexdigest()[:16]
+    return os.path.join(storage.base_path, MANIFEST_DIR, f"{source_id}.json")
+
+def write_import_notice(storage: StorageManager, imported: Dict[str, List[str]]) -> str:
+    """Leave a notice of imported files for the running bot to register."""
+    pending_dir = os.path.join(storage.base_path, PENDING_DIR)
+    os.makedirs(pending_dir, exist_ok=True)
+    # Sortable by creation time; the dot-prefixed temp name is never picked up half-written
+    name = f"{time.time_ns()}-{uuid.uuid4().hex}.json"
+    temp_path = os.path.join(pending_dir, f".{name}")
+    with open(temp_path, 'w') as f:
+        json.dump(imported, f)
+    notice_path = os.path.join(pending_dir, name)
+    os.replace(temp_path, notice_path)
+    return notice_path
+
+def take_import_notices(storage: StorageManager) -> List[Dict[str, List[str]]]:
+    """Read and remove the pending import notices, oldest first."""
+    pending_dir = os.path.join(storage.base_path, PENDING_DIR)
+    try:
+        names = sorted(name for name in os.listdir(pending_dir) if not name.startswith('.'))
+    except FileNotFoundError:
+        return []
+    notices = []
+    for name in names:
+        notice_path = os.path.join(pending_dir, name)
+        try:
+            with open(notice_path, 'r') as f:
+                notices.append(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Dropping unreadable import notice {name}: {str(e)}")
+        try:
+            os.remove(notice_path)
+        except FileNotFoundError:
+            pass
+    return notices
+
+def run_import(source_dir: str, storage: StorageManager, workers: int = 4,
+               dry_run: bool = False, save_every: int = 50, leave_notice: bool = True) -> Dict[str, int]:
+    """Import a directory tree and return counters of what happened.
+
+    With leave_notice, the imported files are also queued for the running bot
+    (see take_import_notices), which announces them and registers them in its
+    own process.
+    """
+    registry = FolderRegistry(os.path.join(storage.base_path, REGISTRY_FILE), defaults=DEFAULT_FOLDERS)
+    entries, unmatched = collect_files(source_dir, registry)
+    for dir_name in unmatched:
+        logger.warning(f"Skipping '{dir_name}': does not match any registered folder")
+
+    manifest = ImportManifest(manifest_path_for(storage, source_dir))
+    stats = {'copied': 0, 'skipped': 0, 'failed': 0, 'bytes': 0}
+    pending = []
+    claimed = set()
+    for relative_path, source_path, sanitized_folder in entries:
+        filename = os.path.basename(source_path)
+        destination_path = os.path.join(storage.base_path, sanitized_folder, filename)
+        if manifest.is_done(relative_path, source_path, destination_path):
+            stats['skipped'] += 1
+            continue
+        if (sanitized_folder, filename) in claimed:
+            logger.warning(f"Skipping '{relative_path}': another file in this import is named '{filename}'")
+            stats['failed'] += 1
+            continue
+        claimed.add((sanitized_folder, filename))
+        pending.append((relative_path, source_path, sanitized_folder, filename, destination_path))
+
+    logger.info(f"{len(pending)} files to import, {stats['skipped']} already done")
+    if dry_run:
+        for relative_path, _, sanitized_folder, filename, _ in pending:
+            print(f"{relative_path} -> {sanitized_folder}/{filename}")
+        return stats
+
+    imported: Dict[str, List[str]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for relative_path, source_path, sanitized_folder, filename, destination_path in pending:
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            future = executor.submit(copy_with_checksum, source_path, destination_path)
+            futures[future] = (relative_path, source_path, sanitized_folder, filename)
+
+        try:
+            for completed, future in enumerate(as_completed(futures), start=1):
+                relative_path, source_path, sanitized_folder, filename = futures[future]
+                try:
+                    checksum = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to import '{relative_path}': {str(e)}")
+                    stats['failed'] += 1
+                    continue
+                manifest.record(relative_path, source_path, f"{sanitized_folder}/{filename}", checksum)
+                imported.setdefault(sanitized_folder, []).append(filename)
+                stats['copied'] += 1
+                stats['bytes'] += os.path.getsize(source_path)
+                if completed % save_every == 0:
+                    manifest.save()
+                    logger.info(f"Progress: {completed}/{len(futures)} files")
+        finally:
+            manifest.save()
+            # Update storage state once per folder rather than once per file
+            for sanitized_folder, filenames in imported.items():
+                storage.register_files(sanitized_folder, filenames)
+            if imported and leave_notice:
+                write_import_notice(storage, imported)
+
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Bulk import a local directory tree into bot storage.")
+    parser.add_argument("source", help="Directory whose subdirectories match the registered folders")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel copy workers (default: 4)")
+    parser.add_argument("--storage", default=STORAGE_PATH, help="Storage base path")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would be imported")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    if STORAGE_BACKEND != "local":
+        # Files are copied straight into the storage tree, which only the local backend serves
+        logger.error(f"Bulk import needs STORAGE_BACKEND=local (configured: {STORAGE_BACKEND})")
+        return 1
+    if not os.path.isdir(args.source):
+        logger.error(f"Source directory does not exist: {args.source}")
+        return 1
+
+    storage = StorageManager(args.storage)
+    stats = run_import(args.source, storage, workers=args.workers, dry_run=args.dry_run)
+    print(f"Copied {stats['copied']} files ({stats['bytes'] / (1024 * 1024):.1f}MB), "
+          f"skipped {stats['skipped']}, failed {stats['failed']}")
+    return 1 if stats['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
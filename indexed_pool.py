@@ -0,0 +1,165 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from storage_manager import FILE_SAVED, FILE_DELETED, FOLDER_DELETED, TEMP_SUFFIX
+
+try:
+    import fcntl
+except ImportError:  # Non-POSIX platforms fall back to in-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.json"
+
+class IndexedProcessPool:
+    """Base of the background media pools: a spawn-based process pool plus a
+    JSON index of results keyed by "folder/filename" under one directory.
+
+    Several bot processes share the directory, so every index update is a
+    read-merge-write under an advisory file lock, and readers pick up other
+    processes' entries when the file changes. Storage events are handled in
+    order on one background thread, so index writes and file removals never
+    run on the event loop. Subclasses implement on_file_saved and may override
+    on_index_changed and on_forget.
+    """
+
+    kind = "index"
+
+    def __init__(self, directory: str, max_workers: int):
+        self.directory = directory
+        self.max_workers = max_workers
+        os.makedirs(self.directory, exist_ok=True)
+        self._index_path = os.path.join(self.directory, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, object]] = {}
+        self._mtime: Optional[int] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._events = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.kind}-events")
+        with self._lock:
+            self._reload_if_changed()
+
+    @staticmethod
+    def _key(folder_name: str, filename: str) -> str:
+        """Build the index key of a stored file."""
+        return f"{folder_name}/{filename}"
+
+    def _reload_if_changed(self) -> None:
+        """Reload the index if another process rewrote it (caller holds _lock)."""
+        try:
+            mtime = os.stat(self._index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self._index_path, 'r') as f:
+                self._index = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {self.kind} index: {str(e)}")
+            return
+        self._mtime = mtime
+        self.on_index_changed()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Hold the cross-process lock of the index file."""
+        with open(f"{self._index_path}.lock", 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update(self, changes: Dict[str, Optional[Dict[str, object]]]) -> None:
+        """Merge entries (None removes one) into the latest index on disk and write it atomically."""
+        with self._lock, self._file_lock():
+            self._reload_if_changed()
+            for key, entry in changes.items():
+                if entry is None:
+                    self._index.pop(key, None)
+                else:
+                    self._index[key] = entry
+            temp_path = f"{self._index_path}{TEMP_SUFFIX}-{uuid.uuid4().hex}"
+            with open(temp_path, 'w') as f:
+                json.dump(self._index, f)
+            os.replace(temp_path, self._index_path)
+            self._mtime = os.stat(self._index_path).st_mtime_ns
+            self.on_index_changed()
+
+    def _entry(self, folder_name: str, filename: str) -> Optional[Dict[str, object]]:
+        """Return the index entry of a file, seeing other processes' updates."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._index.get(self._key(folder_name, filename))
+
+    def _entries(self) -> Dict[str, Dict[str, object]]:
+        """Return a copy of the whole index."""
+        with self._lock:
+            self._reload_if_changed()
+            return dict(self._index)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the worker pool on first use."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def on_index_changed(self) -> None:
+        """Hook run under _lock whenever the in-memory index changed."""
+
+    def on_forget(self, folder_name: str, filename: Optional[str]) -> None:
+        """Hook run after the entries of a file or folder were dropped."""
+
+    def on_file_saved(self, storage, folder_name: str, filename: str) -> None:
+        """Handle a stored file being saved."""
+        raise NotImplementedError
+
+    def forget(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Drop index entries of a deleted file or folder."""
+        entries = self._entries()
+        if filename is not None:
+            keys = [key for key in [self._key(folder_name, filename)] if key in entries]
+        else:
+            prefix = f"{folder_name}/"
+            keys = [key for key in entries if key.startswith(prefix)]
+        if keys:
+            self._update({key: None for key in keys})
+        self.on_forget(folder_name, filename)
+
+    def attach(self, storage) -> None:
+        """Process new uploads and drop entries of deleted files off the event loop."""
+        def handle(event: str, folder_name: str, filename: Optional[str]) -> None:
+            try:
+                if event == FILE_SAVED:
+                    self.on_file_saved(storage, folder_name, filename)
+                elif event == FILE_DELETED:
+                    self.forget(folder_name, filename)
+                elif event == FOLDER_DELETED:
+                    self.forget(folder_name)
+            except Exception as e:
+                logger.error(f"Failed to handle {event} of {folder_name}/{filename or ''} "
+                             f"in the {self.kind} pool: {str(e)}", exc_info=True)
+
+        def listener(event: str, folder_name: str, filename: Optional[str]) -> None:
+            self._events.submit(handle, event, folder_name, filename)
+        storage.add_listener(listener)
+
+    def shutdown(self) -> None:
+        """Finish pending storage events and stop the worker pool."""
+        self._events.shutdown(wait=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
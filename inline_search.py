@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FileKey = Tuple[str, str]  # (folder_name, filename)
+
+class InlineSearchCache:
+    """Cache of inline search results that reuses prefix results as a query grows.
+
+    Matching is a case-insensitive substring test, so the matches of "const"
+    always contain the matches of "consti". When a complete (untruncated)
+    result for a prefix is cached, a longer query is answered by filtering that
+    list instead of searching storage again. Queries that correct (a spelling
+    corrector's correct) would change are searched afresh: their results come
+    from the corrected words, which a prefix's matches need not contain.
+
+    search is a coroutine function called as search(query, view), so a storage
+    scan never blocks the event loop and skips files the view may not read.
+    Results are cached per view.key, so users with the same permissions share
+    them. Results of a search that was running while clear() was called are
+    returned but not cached.
+    """
+
+    def __init__(self, search: Callable[[str, Any], Awaitable[Tuple[List[FileKey], bool]]],
+                 max_entries: int = 1024, ttl_seconds: float = 60.0,
+                 correct: Optional[Callable[[str], str]] = None):
+        self.search = search
+        self.correct = correct
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # (view key, query) -> (stored_at, results, complete)
+        self._entries: "OrderedDict[Tuple[Hashable, str], Tuple[float, List[FileKey], bool]]" = OrderedDict()
+        self._generation = 0  # Bumped by clear() so stale searches are not cached
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+
+    def _fresh(self, key: Tuple[Hashable, str], now: float) -> Optional[Tuple[float, List[FileKey], bool]]:
+        """Return a cached entry if it has not expired."""
+        entry = self._entries.get(key)
+        if entry and now - entry[0] <= self.ttl_seconds:
+            self._entries.move_to_end(key)
+            return entry
+        return None
+
+    def _store(self, key: Tuple[Hashable, str], results: List[FileKey], complete: bool, now: float) -> None:
+        """Cache a result list, evicting the least recently used entries."""
+        self._entries[key] = (now, results, complete)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, query: str, view=None) -> List[FileKey]:
+        """Return matches for a query from the cache, a cached prefix, or a fresh search.
+
+        view is an acl.AccessView (or None for unrestricted access).
+        """
+        query = query.lower()
+        scope = view.key if view is not None else None
+        now = time.time()
+        entry = self._fresh((scope, query), now)
+        if entry:
+            self.hits += 1
+            return entry[1]
+
+        reusable = self.correct is None or self.correct(query) == query
+        for length in range(len(query) - 1 if reusable else 0, 0, -1):
+            prefix_entry = self._fresh((scope, query[:length]), now)
+            if prefix_entry and prefix_entry[2]:
+                results = [key for key in prefix_entry[1] if query in key[1].lower()]
+                self._store((scope, query), results, True, now)
+                self.prefix_hits += 1
+                return results
+
+        generation = self._generation
+        results, complete = await self.search(query, view)
+        if generation == self._generation:
+            self._store((scope, query), results, complete, now)
+        self.misses += 1
+        return results
+
+    def clear(self) -> None:
+        """Drop every cached result (e.g. after storage changes)."""
+        self._entries.clear()
+        self._generation += 1
+
+class Debouncer:
+    """Run only the last action submitted for a key within a quiet period.
+
+    Inline queries arrive on every keystroke; each new query for a user cancels
+    the pending answer for their previous one.
+    """
+
+    def __init__(self, delay_seconds: float = 0.4):
+        self.delay_seconds = delay_seconds
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def submit(self, key: Hashable, action: Callable[[], Awaitable[None]]) -> None:
+        """Schedule action for key, cancelling any action still waiting for it."""
+        pending = self._tasks.pop(key, None)
+        if pending:
+            pending.cancel()
+        self._tasks[key] = asyncio.get_running_loop().create_task(self._run(key, action))
+
+    async def _run(self, key: Hashable, action: Callable[[], Awaitable[None]]) -> None:
+        """Wait for the quiet period, then run the action."""
+        try:
+            await asyncio.sleep(self.delay_seconds)
+            await action()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Debounced action for {key} failed: {str(e)}", exc_info=True)
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
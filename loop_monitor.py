@@ -0,0 +1,270 @@
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SlowEvent:
+    """A loop stall or slow handler, with the stack seen while it was slow."""
+    kind: str  # "stall" or "handler"
+    name: str
+    update_type: str
+    duration: float
+    stack: str
+    at: float = field(default_factory=time.time)
+
+def describe_update(update: Any) -> str:
+    """Describe which kind of update a handler received."""
+    for attribute in ("callback_query", "inline_query", "message", "edited_message", "chosen_inline_result"):
+        if getattr(update, attribute, None) is not None:
+            message = getattr(update, attribute)
+            text = getattr(message, "text", None)
+            if attribute == "message" and text and text.startswith('/'):
+                return f"command {text.split()[0]}"
+            if attribute == "message" and getattr(message, "effective_attachment", None):
+                return "message with attachment"
+            return attribute
+    return type(update).__name__
+
+class LoopMonitor:
+    """Measure event-loop lag and capture what is running when the bot is slow.
+
+    A heartbeat task records how late each tick wakes up. A watchdog thread
+    samples the loop thread's stack whenever the heartbeat falls behind by
+    more than the lag threshold, which points at the blocking call itself.
+    Instrumented handlers that run longer than the slow-handler threshold are
+    recorded with their update type and the coroutine stack they are waiting in.
+    """
+
+    def __init__(self, interval: float = 0.1, lag_threshold: float = 0.25,
+                 slow_handler_threshold: float = 2.0, max_events: int = 50, window: int = 600):
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.slow_handler_threshold = slow_handler_threshold
+        self.lags: Deque[float] = deque(maxlen=window)
+        self.events: Deque[SlowEvent] = deque(maxlen=max_events)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.slow_handlers = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._current: Dict[asyncio.Task, str] = {}  # running handler task -> update type
+        # The watchdog thread reads _current while the loop thread changes it
+        self._current_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.profiling = False
+
+    async def _beat(self) -> None:
+        """Heartbeat task: record how late each tick is."""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def _loop_stack(self) -> str:
+        """Format the current stack of the event-loop thread."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        return "".join(traceback.format_stack(frame)) if frame else ""
+
+    def _watch(self) -> None:
+        """Watchdog thread: sample the loop thread once per stall."""
+        stalled = False
+        while not self._stop.wait(self.interval / 2):
+            behind = time.monotonic() - self._heartbeat - self.interval
+            if behind > self.lag_threshold and not stalled:
+                stalled = True
+                with self._current_lock:
+                    running = ", ".join(sorted(set(self._current.values()))) or "no handler"
+                stack = self._loop_stack()
+                logger.warning(f"Event loop blocked for {behind:.2f}s so far while handling {running}:\n{stack}")
+                self.stalls += 1
+                self.events.append(SlowEvent("stall", "event loop", running, behind, stack))
+            elif behind <= self.lag_threshold:
+                stalled = False
+
+    def start(self) -> None:
+        """Start the heartbeat and watchdog (call from the running event loop)."""
+        if self._task:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop monitor started (lag threshold {self.lag_threshold}s)")
+
+    def stop(self) -> None:
+        """Stop monitoring."""
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @staticmethod
+    def _await_chain(task: asyncio.Task) -> str:
+        """Format where a suspended task is waiting by following its await chain."""
+        lines = []
+        awaitable = task.get_coro()
+        while awaitable is not None:
+            frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+            if frame is None:
+                lines.append(f"  awaiting {awaitable!r}\n")
+                break
+            lines.append(f'  File "{frame.f_code.co_filename}", line {frame.f_lineno}, in {frame.f_code.co_name}\n')
+            awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+        return "".join(lines)
+
+    def _sample_slow_task(self, task: asyncio.Task, name: str, update_type: str) -> Optional[SlowEvent]:
+        """Record where a handler still running past the threshold is waiting."""
+        if task.done():
+            return None
+        stack = self._await_chain(task)
+        event = SlowEvent("handler", name, update_type, self.slow_handler_threshold, stack)
+        self.events.append(event)
+        logger.warning(f"Handler {name} ({update_type}) still running after "
+                       f"{self.slow_handler_threshold}s, waiting in:\n{stack}")
+        return event
+
+    def track(self, callback: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """Wrap a handler callback so slow runs are recorded."""
+        name = getattr(callback, "__name__", repr(callback))
+
+        @functools.wraps(callback)
+        async def tracked(update: Any, context: Any) -> Any:
+            task = asyncio.current_task()
+            update_type = describe_update(update)
+            with self._current_lock:
+                self._current[task] = update_type
+            sampled: List[SlowEvent] = []
+            sampler = asyncio.get_running_loop().call_later(
+                self.slow_handler_threshold,
+                lambda: sampled.extend(filter(None, [self._sample_slow_task(task, name, update_type)]))
+            )
+            started = time.monotonic()
+            try:
+                return await callback(update, context)
+            finally:
+                sampler.cancel()
+                with self._current_lock:
+                    self._current.pop(task, None)
+                duration = time.monotonic() - started
+                if duration > self.slow_handler_threshold:
+                    self.slow_handlers += 1
+                    logger.warning(f"Slow handler {name} ({update_type}) took {duration:.2f}s")
+                    if sampled:
+                        sampled[0].duration = duration
+                    else:
+                        # The loop itself was blocked, so the sample never fired
+                        self.events.append(SlowEvent("handler", name, update_type, duration, ""))
+
+        return tracked
+
+    def instrument(self, application: Any) -> None:
+        """Wrap the callback of every handler registered on an application."""
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = self.track(handler.callback)
+
+    def lag_percentile(self, percentile: float) -> float:
+        """Return a percentile of recent loop lag in seconds."""
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+    def summary(self) -> str:
+        """Describe loop health and the most recent slow events."""
+        lines = [
+            f"Loop lag (last {len(self.lags)} ticks): p50 {self.lag_percentile(50) * 1000:.1f}ms, "
+            f"p99 {self.lag_percentile(99) * 1000:.1f}ms, max {self.max_lag * 1000:.1f}ms",
+            f"Stalls over {self.lag_threshold}s: {self.stalls}",
+            f"Handlers over {self.slow_handler_threshold}s: {self.slow_handlers}",
+        ]
+        for event in list(self.events)[-10:]:
+            when = time.strftime('%H:%M:%S', time.localtime(event.at))
+            lines.append(f"\n[{when}] {event.kind} {event.name} ({event.update_type}) {event.duration:.2f}s\n{event.stack}")
+        return "\n".join(lines)
+
+    async def profile(self, seconds: float, mode: str = "cprofile") -> str:
+        """Profile live traffic on the loop thread for a while and return a text report.
+
+        "cprofile" traces every call; "sample" takes statistical stack samples
+        of the loop thread from a helper thread, which costs far less.
+        """
+        if self.profiling:
+            raise RuntimeError("A profile is already running")
+        self.profiling = True
+        try:
+            if mode == "sample":
+                report = await self._sample_profile(seconds)
+            else:
+                report = await self._cprofile(seconds)
+        finally:
+            self.profiling = False
+        return (f"Profile of {seconds:g}s of live traffic ({mode})\n"
+                f"Generated {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+                f"{self.summary()}\n\n{report}")
+
+    async def _cprofile(self, seconds: float) -> str:
+        """Run cProfile on the loop thread (work in to_thread helpers is not included)."""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(40)
+        stats.sort_stats('tottime').print_stats(20)
+        return output.getvalue()
+
+    async def _sample_profile(self, seconds: float, rate: float = 0.005) -> str:
+        """Sample the loop thread's stack periodically and aggregate the samples."""
+        leaves: Counter = Counter()
+        stacks: Counter = Counter()
+        samples = 0
+        done = threading.Event()
+
+        def sample() -> None:
+            nonlocal samples
+            while not done.wait(rate):
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is None:
+                    continue
+                summary = traceback.extract_stack(frame)
+                samples += 1
+                leaf = summary[-1]
+                leaves[f"{leaf.name} ({leaf.filename}:{leaf.lineno})"] += 1
+                stacks[" <- ".join(f"{entry.name}" for entry in reversed(summary[-8:]))] += 1
+
+        sampler = threading.Thread(target=sample, name="loop-sampler", daemon=True)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            done.set()
+            sampler.join()
+
+        lines = [f"{samples} samples every {rate * 1000:.0f}ms", "", "Top functions (self):"]
+        lines += [f"{count / max(samples, 1):6.1%}  {name}" for name, count in leaves.most_common(30)]
+        lines += ["", "Top stacks:"]
+        lines += [f"{count / max(samples, 1):6.1%}  {stack}" for stack, count in stacks.most_common(15)]
+        return "\n".join(lines)
@@ -1,11 +1,25 @@
 import logging
 import os
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram import Update
+from telegram.ext import (
+    Application, ApplicationBuilder, CommandHandler, MessageHandler, CallbackQueryHandler,
+    InlineQueryHandler, TypeHandler, filters
+)
 from bot_handlers import (
     start, help_command, handle_file, get_file, create_folder,
     remove_folder, remove_file, handle_unknown_command, handle_error,
-    button_callback, handle_command_with_file, list_files
+    button_callback, handle_command_with_file, list_files, restore_persisted_state,
+    setup_background_jobs, start_storage_watcher, hot_files, inline_query, storage_report,
+    rate_limit_guard, start_loop_monitor, profile_command, instrument_application,
+    start_broadcasts, subscribe_command, unsubscribe_command, broadcast_report,
+    analytics_report, start_spelling_index, init_services, is_leader,
+    lock_command, unlock_command, share_command, unshare_command, unadmin_command, snapshots_report, restore_command
+)
+from config import (
+    WORKER_PROCESSES, WEBHOOK_URL, WEBHOOK_PORT, PERSISTENCE_PATH, PERSISTENCE_UPDATE_INTERVAL,
+    CONCURRENT_UPDATES, LOCAL_BOT_API_URL
 )
+from persistence import SQLitePersistence
 
 # Enable logging
 logging.basicConfig(
@@ -15,16 +29,40 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def main():
-    """Start the bot."""
-    # Get the token from environment variable
-    token = os.environ.get("TELEGRAM_BOT_TOKEN")
-    if not token:
-        logger.error("No token provided!")
-        return
+async def on_startup(application: Application) -> None:
+    """Restore persisted state and start background jobs; the leader also starts the watcher and broadcasts."""
+    await restore_persisted_state(application)
+    setup_background_jobs(application)
+    start_loop_monitor()
+    start_spelling_index()
+    if is_leader():
+        start_storage_watcher()
+        start_broadcasts(application)
 
-    # Create the Application and pass it your bot's token
-    application = Application.builder().token(token).build()
+def configure_api(builder: ApplicationBuilder) -> ApplicationBuilder:
+    """Point the application at a local Bot API server if one is configured."""
+    if not LOCAL_BOT_API_URL:
+        return builder
+    logger.info(f"Using local Bot API server at {LOCAL_BOT_API_URL}")
+    return (builder.base_url(f"{LOCAL_BOT_API_URL}/bot")
+            .base_file_url(f"{LOCAL_BOT_API_URL}/file/bot")
+            .local_mode(True))
+
+def configure_builder(builder: ApplicationBuilder, leader: bool = True) -> ApplicationBuilder:
+    """Build this process's services and apply persistence, concurrency and startup
+    hooks to an application that handles updates."""
+    init_services(leader=leader)
+    builder = configure_api(builder)
+    persistence = SQLitePersistence(PERSISTENCE_PATH, update_interval=PERSISTENCE_UPDATE_INTERVAL)
+    # Concurrent handling (opt-in) lets identical simultaneous requests coalesce, at the cost of per-chat order
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(CONCURRENT_UPDATES)
+    return builder.persistence(persistence).post_init(on_startup)
+
+def register_handlers(application: Application) -> None:
+    """Register all bot handlers on an application."""
+    # Per-user rate limiting runs before every other handler
+    application.add_handler(TypeHandler(Update, rate_limit_guard), group=-1)
 
     # Add command handlers first to ensure they take precedence
     application.add_handler(CommandHandler("start", start))
@@ -37,10 +75,27 @@ def main():
     application.add_handler(CommandHandler("add", handle_command_with_file))
     application.add_handler(CommandHandler("removefile", remove_file))      # Keep for backward compatibility
     application.add_handler(CommandHandler("kick", remove_file))            # New command name
+    application.add_handler(CommandHandler("hot", hot_files))
+    application.add_handler(CommandHandler("storage", storage_report))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    application.add_handler(CommandHandler("broadcasts", broadcast_report))
+    application.add_handler(CommandHandler("analytics", analytics_report))
+    application.add_handler(CommandHandler("lock", lock_command))
+    application.add_handler(CommandHandler("unlock", unlock_command))
+    application.add_handler(CommandHandler("share", share_command))
+    application.add_handler(CommandHandler("unshare", unshare_command))
+    application.add_handler(CommandHandler("unadmin", unadmin_command))
+    application.add_handler(CommandHandler("snapshots", snapshots_report))
+    application.add_handler(CommandHandler("restore", restore_command))
 
     # Add callback query handler for inline buttons
     application.add_handler(CallbackQueryHandler(button_callback))
 
+    # Inline mode: @bot <query> from any chat
+    application.add_handler(InlineQueryHandler(inline_query))
+
     # Add file handler - only for messages containing files, not commands
     file_filter = (
         (filters.ATTACHMENT | filters.Document.ALL | filters.PHOTO | filters.VIDEO) 
@@ -55,8 +110,48 @@ def main():
     # Add error handler
     application.add_error_handler(handle_error)
 
+    # Time every handler so slow ones are captured with their update type, and count them for /analytics
+    instrument_application(application)
+
+def run_application(application: Application) -> None:
+    """Receive updates through a webhook if configured, otherwise by polling."""
+    if WEBHOOK_URL:
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            webhook_url=WEBHOOK_URL,
+            allowed_updates=None
+        )
+    else:
+        application.run_polling(allowed_updates=None)
+
+def main():
+    """Start the bot."""
+    # Get the token from environment variable
+    token = os.environ.get("TELEGRAM_BOT_TOKEN")
+    if not token:
+        logger.error("No token provided!")
+        return
+
+    if WORKER_PROCESSES > 0:
+        # Ingress mode: this process only receives updates and shards them by chat
+        from worker_mode import UpdateDispatcher
+        application = configure_api(Application.builder().token(token)).build()
+        dispatcher = UpdateDispatcher(token, WORKER_PROCESSES)
+        dispatcher.attach(application)
+        dispatcher.start()
+        try:
+            run_application(application)
+        finally:
+            dispatcher.stop()
+        return
+
+    # Create the Application and pass it your bot's token
+    application = configure_builder(Application.builder().token(token)).build()
+    register_handlers(application)
+
     # Start the bot
-    application.run_polling(allowed_updates=None)
+    run_application(application)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from telegram import InputMediaDocument
+from telegram.error import BadRequest, RetryAfter
+
+from request_control import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+FileKey = Tuple[str, str]  # (folder_name, filename)
+
+# Telegram accepts at most 10 items per sendMediaGroup call
+MAX_GROUP_SIZE = 10
+
+class MediaGroupSender:
+    """Send many stored files as albums of up to 10 documents per sendMediaGroup call.
+
+    Files Telegram already has are sent by file id; the others are resolved
+    off the event loop (restoring archived files) while earlier albums are
+    still uploading, and the ids of every sent document are remembered for
+    next time. Albums to one chat are paced by a per-chat token bucket, at
+    most max_parallel albums upload at once across chats, and a RetryAfter
+    pauses every sender for the time Telegram asks.
+    """
+
+    def __init__(self, resolve: Callable[[str, str], Tuple[str, str]], file_ids: Any,
+                 group_size: int = MAX_GROUP_SIZE, max_parallel: int = 4, chat_interval: float = 3.0,
+                 max_attempts: int = 3, local_mode: bool = False):
+        self.resolve = resolve  # (folder, filename) -> (path, send name); blocking
+        self.file_ids = file_ids  # popularity.WarmCache or anything with peek/remember_file_id
+        self.group_size = min(group_size, MAX_GROUP_SIZE)
+        self.max_attempts = max_attempts
+        self.local_mode = local_mode
+        self._parallel = asyncio.Semaphore(max_parallel)
+        self.chat_limiter = RateLimiter(rate_per_minute=60 / chat_interval, burst=1)
+        self._paused_until = 0.0
+        self.groups_sent = 0
+        self.files_uploaded = 0
+        self.ids_reused = 0
+
+    async def _prepare(self, key: FileKey, allow_file_id: bool = True) -> Tuple[Optional[str], Optional[str], str]:
+        """Return (file id, path, send name) for one file; the path is resolved only without a file id."""
+        file_id = self.file_ids.peek_file_id(*key) if allow_file_id else None
+        if file_id:
+            return file_id, None, key[1]
+        path, send_name = await asyncio.to_thread(self.resolve, *key)
+        return None, path, send_name
+
+    async def _wait_turn(self, chat_id: int) -> None:
+        """Wait for a global flood pause to end and for the chat's next album slot."""
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            elif self.chat_limiter.allow(chat_id):
+                return
+            else:
+                await asyncio.sleep(self.chat_limiter.retry_after(chat_id))
+
+    async def _send_group(self, message, keys: List[FileKey], prepared: List[tuple]) -> int:
+        """Send one album, retrying after flood control or with fresh uploads if a cached id is stale."""
+        for attempt in range(self.max_attempts):
+            await self._wait_turn(message.chat_id)
+            handles = []
+            try:
+                documents = []
+                for file_id, path, send_name in prepared:
+                    if file_id:
+                        documents.append((file_id, None))
+                    elif self.local_mode:
+                        # The local server reads the file itself; nothing passes through this process
+                        documents.append((Path(path), send_name))
+                    else:
+                        handle = open(path, 'rb')
+                        handles.append(handle)
+                        documents.append((handle, send_name))
+                async with self._parallel:
+                    if len(documents) == 1:
+                        # Albums need at least two items
+                        messages = [await message.reply_document(document=documents[0][0],
+                                                                 filename=documents[0][1])]
+                    else:
+                        messages = await message.reply_media_group(media=[
+                            InputMediaDocument(media=source, filename=send_name) for source, send_name in documents
+                        ])
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(f"Flood control hit while sending an album; pausing {delay}s")
+                continue
+            except BadRequest as e:
+                if attempt + 1 >= self.max_attempts or not any(file_id for file_id, _, _ in prepared):
+                    raise
+                logger.warning(f"Album with cached file ids failed, re-uploading: {str(e)}")
+                prepared = await asyncio.gather(*(self._prepare(key, allow_file_id=False) for key in keys))
+                continue
+            finally:
+                for handle in handles:
+                    handle.close()
+
+            for key, (file_id, _, _), sent in zip(keys, prepared, messages):
+                if file_id:
+                    self.ids_reused += 1
+                elif sent.document:
+                    self.files_uploaded += 1
+                    self.file_ids.remember_file_id(key[0], key[1], sent.document.file_id)
+            self.groups_sent += 1
+            return len(messages)
+        raise TimeoutError("Album could not be sent within the flood-control retries")
+
+    async def send(self, message, keys: List[FileKey]) -> int:
+        """Send files to the chat of message in albums; returns how many documents were sent.
+
+        Files are resolved concurrently up front, so an album's uploads never
+        wait on the preparation of the next one.
+        """
+        # Even album sizes, so 11 files go out as 6 + 5 rather than 10 + a lone document
+        count = -(-len(keys) // self.group_size)
+        groups = []
+        for i in range(count):
+            start = i * len(keys) // count
+            groups.append(keys[start:(i + 1) * len(keys) // count])
+        preparations = [asyncio.gather(*(self._prepare(key) for key in group)) for group in groups]
+        for preparation in preparations:
+            # Failures of albums never reached after an earlier one failed are not worth a warning
+            preparation.add_done_callback(lambda future: future.cancelled() or future.exception())
+        sent = 0
+        try:
+            for group, preparation in zip(groups, preparations):
+                sent += await self._send_group(message, group, list(await preparation))
+        finally:
+            for preparation in preparations:
+                preparation.cancel()
+        return sent
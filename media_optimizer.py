@@ -0,0 +1,164 @@
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; JPEG recompression is skipped without it
+    Image = None
+
+from indexed_pool import IndexedProcessPool
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = ".variants"
+
+# Legacy video containers that are re-encoded to H.264 MP4
+LEGACY_VIDEO_EXTENSIONS = {'.avi', '.mov'}
+JPEG_EXTENSIONS = {'.jpg', '.jpeg'}
+
+def _optimize_pdf(source_path: str, output_path: str) -> bool:
+    """Downsample embedded images and linearize a PDF with Ghostscript."""
+    if not shutil.which("gs"):
+        return False
+    subprocess.run(
+        ["gs", "-q", "-dBATCH", "-dNOPAUSE", "-dSAFER", "-sDEVICE=pdfwrite",
+         "-dPDFSETTINGS=/ebook", "-dFastWebView=true",
+         "-dDownsampleColorImages=true", "-dColorImageResolution=150",
+         "-dDownsampleGrayImages=true", "-dGrayImageResolution=150",
+         f"-sOutputFile={output_path}", source_path],
+        check=True, capture_output=True, timeout=600
+    )
+    return os.path.exists(output_path)
+
+def _optimize_video(source_path: str, output_path: str) -> bool:
+    """Re-encode a legacy video container to streamable H.264 MP4."""
+    if not shutil.which("ffmpeg"):
+        return False
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-i", source_path,
+         "-c:v", "libx264", "-preset", "medium", "-crf", "26",
+         "-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart", output_path],
+        check=True, capture_output=True, timeout=3600
+    )
+    return os.path.exists(output_path)
+
+def _optimize_jpeg(source_path: str, output_path: str) -> bool:
+    """Recompress a JPEG without its EXIF metadata."""
+    if Image is None:
+        return False
+    with Image.open(source_path) as image:
+        # Saving without passing exif= drops the metadata
+        image.convert("RGB").save(output_path, "JPEG", quality=80, optimize=True, progressive=True)
+    return True
+
+def optimize_file(source_path: str, output_dir: str, min_savings: float) -> Optional[Tuple[str, int, int]]:
+    """Produce a compressed variant of a file.
+
+    Runs inside a worker process. Returns (variant_path, original_size,
+    variant_size) when the variant is at least min_savings smaller than the
+    original, otherwise None. The original file is never modified.
+    """
+    filename = os.path.basename(source_path)
+    stem, extension = os.path.splitext(filename)
+    extension = extension.lower()
+    if extension == '.pdf':
+        optimizer, variant_name = _optimize_pdf, filename
+    elif extension in LEGACY_VIDEO_EXTENSIONS:
+        optimizer, variant_name = _optimize_video, f"{stem}.mp4"
+    elif extension in JPEG_EXTENSIONS:
+        optimizer, variant_name = _optimize_jpeg, filename
+    else:
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    original_size = os.path.getsize(source_path)
+    variant_path = os.path.join(output_dir, variant_name)
+    with tempfile.TemporaryDirectory(dir=output_dir) as work_dir:
+        temp_output = os.path.join(work_dir, variant_name)
+        if not optimizer(source_path, temp_output):
+            return None
+        variant_size = os.path.getsize(temp_output)
+        if variant_size > original_size * (1 - min_savings):
+            return None
+        os.replace(temp_output, variant_path)
+    return variant_path, original_size, variant_size
+
+class MediaOptimizer(IndexedProcessPool):
+    """Create smaller variants of uploaded files in a background process pool.
+
+    Originals stay untouched in the folder; variants live under
+    storage/.variants and are served instead of the original when present.
+    Savings are recorded in the index and exposed through get_metrics().
+    """
+
+    kind = "variant"
+
+    def __init__(self, base_path: str, max_workers: int = 1, min_savings: float = 0.1):
+        self.min_savings = min_savings
+        super().__init__(os.path.join(base_path, VARIANTS_DIR), max_workers)
+        self.variants_dir = self.directory
+        logger.info(f"MediaOptimizer initialized with variants dir: {self.variants_dir}")
+
+    def schedule(self, folder_name: str, filename: str, file_path: str) -> Future:
+        """Queue optimization of a stored file."""
+        output_dir = os.path.join(self.variants_dir, folder_name, filename)
+        future = self._get_executor().submit(optimize_file, file_path, output_dir, self.min_savings)
+        future.add_done_callback(lambda f: self._on_optimized(folder_name, filename, f))
+        return future
+
+    def _on_optimized(self, folder_name: str, filename: str, future: Future) -> None:
+        """Record a finished variant and its savings."""
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Optimization failed for {folder_name}/{filename}: {str(e)}")
+            return
+        if result is None:
+            logger.debug(f"No worthwhile variant for {folder_name}/{filename}")
+            return
+        variant_path, original_size, variant_size = result
+        self._update({self._key(folder_name, filename): {
+            'path': variant_path,
+            'filename': os.path.basename(variant_path),
+            'original_size': original_size,
+            'variant_size': variant_size
+        }})
+        metrics = self.get_metrics()
+        logger.info(f"Optimized {folder_name}/{filename}: saved "
+                    f"{(original_size - variant_size) / (1024 * 1024):.1f}MB "
+                    f"({original_size} -> {variant_size} bytes); {metrics['optimized_files']} variants "
+                    f"save {metrics['bytes_saved'] / (1024 * 1024):.1f}MB in total")
+
+    def get_variant(self, folder_name: str, filename: str) -> Optional[Tuple[str, str]]:
+        """Return (variant_path, variant_filename) if a smaller variant exists."""
+        entry = self._entry(folder_name, filename)
+        if entry and os.path.exists(entry['path']):
+            return entry['path'], entry['filename']
+        return None
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Summarize how much space the variants save."""
+        entries = self._entries().values()
+        original_bytes = sum(entry['original_size'] for entry in entries)
+        variant_bytes = sum(entry['variant_size'] for entry in entries)
+        return {
+            'optimized_files': len(entries),
+            'original_bytes': original_bytes,
+            'variant_bytes': variant_bytes,
+            'bytes_saved': original_bytes - variant_bytes
+        }
+
+    def on_forget(self, folder_name: str, filename: Optional[str]) -> None:
+        """Remove the variant files of a deleted file or folder."""
+        parts = (folder_name, filename) if filename is not None else (folder_name,)
+        shutil.rmtree(os.path.join(self.variants_dir, *parts), ignore_errors=True)
+
+    def on_file_saved(self, storage, folder_name: str, filename: str) -> None:
+        # A re-upload replaces the original, so any old variant is stale
+        self.forget(folder_name, filename)
+        self.schedule(folder_name, filename, os.path.join(storage.base_path, folder_name, filename))
@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from copy import deepcopy
+from typing import Any, Dict, Optional, Set, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+# Row kinds stored in the key/value table
+BOT_DATA = "bot_data"
+CHAT_DATA = "chat_data"
+USER_DATA = "user_data"
+CALLBACK_DATA = "callback_data"
+CONVERSATIONS = "conversations"
+
+# Kinds whose dicts are split into one row per field and per entry of dict fields
+SPLIT_KINDS = (BOT_DATA, CHAT_DATA, USER_DATA)
+# Entry column of a field's own row
+FIELD_ROW = b""
+
+# (field, entry) -> pickled value
+FlatRows = Dict[Tuple[bytes, bytes], bytes]
+# (kind, owner, field, entry)
+EntryId = Tuple[str, str, bytes, bytes]
+
+def flatten(data: Dict[Any, Any]) -> FlatRows:
+    """Split a data dict into one row per top-level field, plus one per entry of dict-valued fields."""
+    rows = {}
+    for field, value in data.items():
+        field_key = pickle.dumps(field)
+        if isinstance(value, dict):
+            rows[(field_key, FIELD_ROW)] = pickle.dumps({})
+            for entry, entry_value in value.items():
+                rows[(field_key, pickle.dumps(entry))] = pickle.dumps(entry_value)
+        else:
+            rows[(field_key, FIELD_ROW)] = pickle.dumps(value)
+    return rows
+
+def unflatten(rows: Dict[Tuple[bytes, bytes], Tuple[bytes, float]]) -> Dict[Any, Any]:
+    """Rebuild a data dict from its rows; dict entries come back oldest first."""
+    data = {}
+    for (field_key, entry), (value, _) in sorted(rows.items(), key=lambda item: (item[0][1] != FIELD_ROW, item[1][1])):
+        field = pickle.loads(field_key)
+        if entry == FIELD_ROW:
+            data[field] = pickle.loads(value)
+        else:
+            data.setdefault(field, {})[pickle.loads(entry)] = pickle.loads(value)
+    return data
+
+class SQLitePersistence(BasePersistence):
+    """Persist PTB state to a local SQLite file with batched background writes.
+
+    The Application hands us data through the ``update_*`` methods on every
+    persistence tick. They only record what changed in memory; a single
+    background task then writes all changes in one transaction on a worker
+    thread, so handlers never wait on disk I/O.
+
+    Bot, chat and user data are stored one row per field, and dict-valued
+    fields (search history, pagination cursors) one row per entry. Only rows
+    that changed since the last write are written, and a row is deleted only
+    if nobody updated it since this process saw it, so worker processes
+    sharing the file merge their changes instead of overwriting each other.
+    """
+
+    def __init__(self, filepath: str, store_data: Optional[PersistenceInput] = None,
+                 update_interval: float = 60, flush_delay: float = 1.0):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = os.path.abspath(filepath)
+        self.flush_delay = flush_delay
+        self._rows: Dict[Tuple[str, str], Any] = {}
+        self._dirty: Set[Tuple[str, str]] = set()
+        self._deleted: Set[Tuple[str, str]] = set()
+        # (kind, owner) -> (field, entry) -> (pickled value, updated) as last loaded or written
+        self._entries: Dict[Tuple[str, str], Dict[Tuple[bytes, bytes], Tuple[bytes, float]]] = {}
+        self._entry_upserts: Dict[EntryId, Tuple[bytes, float]] = {}
+        # Row -> the updated time this process last saw; newer rows are left alone
+        self._entry_deletes: Dict[EntryId, float] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock()
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the state database."""
+        connection = sqlite3.connect(self.filepath, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+            "PRIMARY KEY (kind, key))"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "kind TEXT NOT NULL, owner TEXT NOT NULL, field BLOB NOT NULL, entry BLOB NOT NULL, "
+            "value BLOB NOT NULL, updated REAL NOT NULL, "
+            "PRIMARY KEY (kind, owner, field, entry))"
+        )
+        return connection
+
+    def _migrate(self, connection: sqlite3.Connection) -> None:
+        """Split whole-dict rows written by earlier versions into entry rows."""
+        placeholders = ", ".join("?" * len(SPLIT_KINDS))
+        legacy = connection.execute(
+            f"SELECT kind, key, value FROM state WHERE kind IN ({placeholders})", SPLIT_KINDS
+        ).fetchall()
+        if not legacy:
+            return
+        now = time.time()
+        with connection:
+            for kind, key, value in legacy:
+                try:
+                    data = pickle.loads(value)
+                except Exception as e:
+                    logger.warning(f"Dropping unreadable state row {kind}/{key}: {str(e)}")
+                    continue
+                # Spread timestamps so dict entries keep their order
+                connection.executemany(
+                    "INSERT OR IGNORE INTO entries (kind, owner, field, entry, value, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(kind, key, field, entry, row_value, now + i * 1e-6)
+                     for i, ((field, entry), row_value) in enumerate(flatten(data).items())]
+                )
+            connection.execute(f"DELETE FROM state WHERE kind IN ({placeholders})", SPLIT_KINDS)
+        logger.info(f"Migrated {len(legacy)} persisted state rows to per-entry rows")
+
+    def _load(self) -> None:
+        """Load all stored rows into memory."""
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        connection = self._connect()
+        try:
+            self._migrate(connection)
+            for kind, key, value in connection.execute("SELECT kind, key, value FROM state"):
+                try:
+                    self._rows[(kind, key)] = pickle.loads(value)
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable state row {kind}/{key}: {str(e)}")
+            for kind, owner, field, entry, value, updated in connection.execute(
+                    "SELECT kind, owner, field, entry, value, updated FROM entries"):
+                self._entries.setdefault((kind, owner), {})[(field, entry)] = (value, updated)
+        finally:
+            connection.close()
+        for (kind, owner), rows in self._entries.items():
+            try:
+                self._rows[(kind, owner)] = unflatten(rows)
+            except Exception as e:
+                logger.warning(f"Skipping unreadable state rows of {kind}/{owner}: {str(e)}")
+        logger.info(f"Loaded {len(self._rows)} persisted state rows from {self.filepath}")
+
+    def _write(self, upserts: Dict[Tuple[str, str], bytes], deletes: Set[Tuple[str, str]],
+               entry_upserts: Dict[EntryId, Tuple[bytes, float]], entry_deletes: Dict[EntryId, float]) -> None:
+        """Write a batch of changes in one transaction (runs in a worker thread)."""
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO state (kind, key, value) VALUES (?, ?, ?)",
+                    [(kind, key, value) for (kind, key), value in upserts.items()]
+                )
+                connection.executemany(
+                    "DELETE FROM state WHERE kind = ? AND key = ?",
+                    list(deletes)
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO entries (kind, owner, field, entry, value, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(*entry_id, value, updated) for entry_id, (value, updated) in entry_upserts.items()]
+                )
+                connection.executemany(
+                    "DELETE FROM entries WHERE kind = ? AND owner = ? AND field = ? AND entry = ? AND updated <= ?",
+                    [(*entry_id, seen) for entry_id, seen in entry_deletes.items()]
+                )
+        finally:
+            connection.close()
+
+    async def _write_dirty(self) -> None:
+        """Serialize the dirty rows and write them off the event loop."""
+        async with self._write_lock:
+            if not (self._dirty or self._deleted or self._entry_upserts or self._entry_deletes):
+                return
+            upserts = {row: pickle.dumps(self._rows[row]) for row in self._dirty if row in self._rows}
+            deletes = set(self._deleted)
+            entry_upserts = dict(self._entry_upserts)
+            entry_deletes = dict(self._entry_deletes)
+            self._dirty.clear()
+            self._deleted.clear()
+            self._entry_upserts.clear()
+            self._entry_deletes.clear()
+            try:
+                await asyncio.to_thread(self._write, upserts, deletes, entry_upserts, entry_deletes)
+                logger.debug(f"Persisted {len(upserts) + len(entry_upserts)} rows, "
+                             f"removed {len(deletes) + len(entry_deletes)} rows")
+            except Exception as e:
+                logger.error(f"Failed to persist bot state: {str(e)}", exc_info=True)
+                self._dirty.update(upserts)
+                self._deleted.update(deletes)
+                for entry_id, change in entry_upserts.items():
+                    self._entry_upserts.setdefault(entry_id, change)
+                for entry_id, seen in entry_deletes.items():
+                    if entry_id not in self._entry_upserts:
+                        self._entry_deletes.setdefault(entry_id, seen)
+
+    async def _flush_later(self) -> None:
+        """Wait for the rest of the current batch, then write it."""
+        await asyncio.sleep(self.flush_delay)
+        self._flush_task = None
+        await self._write_dirty()
+
+    def _mark_dirty(self, kind: str, key: Any, value: Any) -> None:
+        """Record a new value and schedule a batched write."""
+        row = (kind, str(key))
+        self._rows[row] = value
+        self._dirty.add(row)
+        self._deleted.discard(row)
+        self._schedule_flush()
+
+    def _mark_deleted(self, kind: str, key: Any) -> None:
+        """Forget a row and schedule a batched write."""
+        row = (kind, str(key))
+        self._rows.pop(row, None)
+        self._dirty.discard(row)
+        self._deleted.add(row)
+        self._schedule_flush()
+
+    def _record_changes(self, kind: str, owner: Any, data: Dict[Any, Any]) -> None:
+        """Queue the entry rows of a data dict that changed since they were last stored."""
+        owner = str(owner)
+        stored = self._entries.setdefault((kind, owner), {})
+        rows = flatten(data)
+        now = time.time()
+        changed = False
+        for row, value in rows.items():
+            previous = stored.get(row)
+            if previous is not None and previous[0] == value:
+                continue
+            stored[row] = (value, now)
+            self._entry_upserts[(kind, owner, *row)] = (value, now)
+            self._entry_deletes.pop((kind, owner, *row), None)
+            changed = True
+        for row in [row for row in stored if row not in rows]:
+            _, seen = stored.pop(row)
+            self._entry_upserts.pop((kind, owner, *row), None)
+            self._entry_deletes[(kind, owner, *row)] = seen
+            changed = True
+        if not stored:
+            del self._entries[(kind, owner)]
+        if changed:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        """Start the background writer unless one is already pending."""
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    def _rows_of_kind(self, kind: str) -> Dict[int, Any]:
+        """Return stored values of one kind keyed by integer id."""
+        return {int(key): deepcopy(value) for (row_kind, key), value in self._rows.items()
+                if row_kind == kind}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return deepcopy(self._rows.get((BOT_DATA, ""), {}))
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._record_changes(BOT_DATA, "", data)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def get_chat_data(self) -> Dict[int, Any]:
+        return self._rows_of_kind(CHAT_DATA)
+
+    async def update_chat_data(self, chat_id: int, data: Any) -> None:
+        self._record_changes(CHAT_DATA, chat_id, data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._record_changes(CHAT_DATA, chat_id, {})
+
+    async def get_user_data(self) -> Dict[int, Any]:
+        return self._rows_of_kind(USER_DATA)
+
+    async def update_user_data(self, user_id: int, data: Any) -> None:
+        self._record_changes(USER_DATA, user_id, data)
+
+    async def refresh_user_data(self, user_id: int, user_data: Any) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._record_changes(USER_DATA, user_id, {})
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return deepcopy(self._rows.get((CALLBACK_DATA, "")))
+
+    async def update_callback_data(self, data: Any) -> None:
+        self._mark_dirty(CALLBACK_DATA, "", deepcopy(data))
+
+    async def get_conversations(self, name: str) -> Dict[Any, Any]:
+        return deepcopy(self._rows.get((CONVERSATIONS, name), {}))
+
+    async def update_conversation(self, name: str, key: Tuple[Any, ...],
+                                  new_state: Optional[object]) -> None:
+        conversations = self._rows.get((CONVERSATIONS, name), {})
+        if new_state is None:
+            conversations.pop(key, None)
+        else:
+            conversations[key] = new_state
+        self._mark_dirty(CONVERSATIONS, name, conversations)
+
+    async def flush(self) -> None:
+        """Write everything still pending; called by PTB on shutdown."""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._write_dirty()
@@ -0,0 +1,462 @@
+import heapq
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from storage_manager import FILE_SAVED, FILE_DELETED, FOLDER_DELETED
+
+logger = logging.getLogger(__name__)
+
+FileKey = Tuple[str, str]  # (folder_name, filename)
+
+def merge_scores(score: float, updated: float, other_score: float, other_updated: float, decay_rate: float) -> float:
+    """Add two decayed scores, expressed at the later of their two timestamps."""
+    if other_updated >= updated:
+        return score * math.exp(-decay_rate * (other_updated - updated)) + other_score
+    return score + other_score * math.exp(-decay_rate * (updated - other_updated))
+
+class PopularityTracker:
+    """Per-file access counters with exponential time decay.
+
+    record() only appends to a deque, so the request path never does more than
+    an O(1) append; a background job calls drain() to fold the pending accesses
+    into the decayed scores.
+
+    With a db_path, scores survive restarts and are shared by worker processes:
+    persist() adds the accesses this process saw since its last call to the
+    stored scores and reloads the merged totals.
+    """
+
+    def __init__(self, half_life_seconds: float = 3 * 24 * 3600, db_path: Optional[str] = None):
+        self.decay_rate = math.log(2) / half_life_seconds
+        self.db_path = db_path
+        self._pending: Deque[Tuple[FileKey, float]] = deque()
+        # key -> (score at last_update, last_update timestamp)
+        self._scores: Dict[FileKey, Tuple[float, float]] = {}
+        self._last_access: Dict[FileKey, float] = {}
+        # Accesses and forgets not written to db_path yet; (folder, None) forgets a folder
+        self._unsaved: Dict[FileKey, Tuple[float, float]] = {}
+        self._forgotten: List[Tuple[str, Optional[str]]] = []
+        self._lock = threading.Lock()
+        if self.db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self.persist()
+
+    def record(self, folder_name: str, filename: str) -> None:
+        """Record one access (cheap; safe to call from handlers)."""
+        self._pending.append(((folder_name, filename), time.time()))
+
+    def _add(self, scores: Dict[FileKey, Tuple[float, float]], key: FileKey, score: float, timestamp: float) -> None:
+        """Add a decayed score to a score table."""
+        previous, last_update = scores.get(key, (0.0, timestamp))
+        scores[key] = (merge_scores(previous, last_update, score, timestamp, self.decay_rate),
+                       max(timestamp, last_update))
+
+    def drain(self) -> int:
+        """Apply pending accesses to the decayed scores and return how many were applied."""
+        applied = 0
+        with self._lock:
+            while self._pending:
+                key, timestamp = self._pending.popleft()
+                self._add(self._scores, key, 1.0, timestamp)
+                if self.db_path:
+                    self._add(self._unsaved, key, 1.0, timestamp)
+                self._last_access[key] = max(timestamp, self._last_access.get(key, 0.0))
+                applied += 1
+        return applied
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the score database."""
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS popularity ("
+            "folder TEXT NOT NULL, filename TEXT NOT NULL, score REAL NOT NULL, updated REAL NOT NULL, "
+            "last_access REAL NOT NULL, PRIMARY KEY (folder, filename))"
+        )
+        connection.create_function("merge_scores", 5, merge_scores, deterministic=True)
+        return connection
+
+    def persist(self) -> None:
+        """Write unsaved accesses and forgets, then reload the merged scores (blocking)."""
+        self.drain()
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, {}
+            forgotten, self._forgotten = self._forgotten, []
+            last_access = {key: self._last_access[key] for key in unsaved if key in self._last_access}
+        connection = self._connect()
+        try:
+            with connection:
+                for folder_name, filename in forgotten:
+                    if filename is None:
+                        connection.execute("DELETE FROM popularity WHERE folder = ?", (folder_name,))
+                    else:
+                        connection.execute("DELETE FROM popularity WHERE folder = ? AND filename = ?",
+                                           (folder_name, filename))
+                connection.executemany(
+                    "INSERT INTO popularity (folder, filename, score, updated, last_access) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (folder, filename) DO UPDATE SET "
+                    "score = merge_scores(score, updated, excluded.score, excluded.updated, ?), "
+                    "updated = MAX(updated, excluded.updated), last_access = MAX(last_access, excluded.last_access)",
+                    [(folder_name, filename, score, updated, last_access.get((folder_name, filename), updated),
+                      self.decay_rate)
+                     for (folder_name, filename), (score, updated) in unsaved.items()]
+                )
+            rows = connection.execute(
+                "SELECT folder, filename, score, updated, last_access FROM popularity").fetchall()
+        except sqlite3.Error:
+            with self._lock:
+                # Keep the changes for the next attempt, ahead of anything recorded meanwhile
+                for key, (score, updated) in unsaved.items():
+                    self._add(self._unsaved, key, score, updated)
+                self._forgotten[:0] = forgotten
+            raise
+        finally:
+            connection.close()
+
+        scores = {(folder_name, filename): (score, updated) for folder_name, filename, score, updated, _ in rows}
+        last_accesses = {(folder_name, filename): accessed for folder_name, filename, _, _, accessed in rows}
+        with self._lock:
+            # Accesses drained while we were writing are not in the database yet
+            for key, (score, updated) in self._unsaved.items():
+                self._add(scores, key, score, updated)
+                last_accesses[key] = max(last_accesses.get(key, 0.0), self._last_access.get(key, 0.0))
+            self._scores = scores
+            self._last_access = last_accesses
+        logger.debug(f"Persisted {len(unsaved)} popularity updates; {len(scores)} files scored")
+
+    def score(self, folder_name: str, filename: str, now: Optional[float] = None) -> float:
+        """Return the current decayed access score of a file."""
+        entry = self._scores.get((folder_name, filename))
+        if not entry:
+            return 0.0
+        score, last_update = entry
+        now = now or time.time()
+        return score * math.exp(-self.decay_rate * max(0.0, now - last_update))
+
+    def rank(self, folder_name: str, filename: str) -> float:
+        """Return a key that orders files like their current scores but only changes on access."""
+        entry = self._scores.get((folder_name, filename))
+        if not entry or entry[0] <= 0:
+            return -math.inf
+        score, last_update = entry
+        # Every score decays at the same rate, so log(score) normalized to time 0 keeps its order
+        return math.log(score) + self.decay_rate * last_update
+
+    def last_access(self, folder_name: str, filename: str) -> Optional[float]:
+        """Return the timestamp of the most recent recorded access."""
+        return self._last_access.get((folder_name, filename))
+
+    def top(self, n: int) -> List[Tuple[FileKey, float]]:
+        """Return the n hottest files with their scores."""
+        now = time.time()
+        return heapq.nlargest(n, ((key, self.score(*key, now=now)) for key in self._scores),
+                              key=lambda item: item[1])
+
+    def forget(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Drop counters of a deleted file or folder."""
+        with self._lock:
+            for table in (self._scores, self._last_access, self._unsaved):
+                for key in [key for key in table
+                            if key[0] == folder_name and (filename is None or key[1] == filename)]:
+                    del table[key]
+            if self.db_path:
+                self._forgotten.append((folder_name, filename))
+
+@dataclass
+class WarmEntry:
+    """What the warm tier knows about one file."""
+    file_id: Optional[str] = None  # Known Telegram file id at lookup time
+    content: Optional[bytes] = None
+    version: Optional[Tuple[int, float]] = None  # (size, mtime) of the file content was read from
+    hits: int = 0
+    misses: int = 0
+
+class WarmCache:
+    """In-memory warm tier for hot files with LFU eviction under a byte budget.
+
+    Telegram file ids are tiny and kept for every sent file, outside the
+    evicted entries; with a db_path they are shared by worker processes and
+    survive restarts through persist(). File contents are only kept for small
+    hot files, and the least frequently used contents are evicted when the
+    budget is exceeded. Eviction pops lazy heaps ordered by
+    PopularityTracker.rank, so it costs O(log n) instead of a full scan.
+
+    Once attached to storage, contents and file ids carry the (size, mtime) of
+    the file they were taken from and are discarded when the storage listing
+    disagrees, so writes made by other processes are never served stale.
+    """
+
+    def __init__(self, tracker: PopularityTracker, max_bytes: int = 64 * 1024 * 1024,
+                 max_file_bytes: int = 5 * 1024 * 1024, max_entries: int = 10000,
+                 db_path: Optional[str] = None):
+        self.tracker = tracker
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_entries = max_entries
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[FileKey, WarmEntry] = {}
+        # Lazy min-heaps of (popularity rank, key) for evicting entries and contents
+        self._entry_heap: List[Tuple[float, FileKey]] = []
+        self._content_heap: List[Tuple[float, FileKey]] = []
+        # key -> (file id, (size, mtime) of the file it was sent from)
+        self._file_ids: Dict[FileKey, Tuple[str, Optional[Tuple[int, float]]]] = {}
+        # File ids not written to db_path yet: key -> (file id, version), or None to
+        # delete; (folder, None) deletes a whole folder
+        self._unsaved_ids: Dict[Tuple[str, Optional[str]], Optional[Tuple[str, Optional[Tuple[int, float]]]]] = {}
+        self._lock = threading.Lock()
+        self.storage = None
+        if self.db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self.persist()
+
+    def _coldest(self, heap: List[Tuple[float, FileKey]], alive) -> Optional[Tuple[float, FileKey]]:
+        """Return the coldest live (rank, key) of a lazy min-heap without popping it.
+
+        Heap ranks only go stale by growing (an access makes a file hotter), so
+        stale tops are re-pushed with their current rank and dead keys dropped.
+        """
+        while heap:
+            rank, key = heap[0]
+            if not alive(key):
+                heapq.heappop(heap)
+                continue
+            current = self.tracker.rank(*key)
+            if current != rank:
+                heapq.heapreplace(heap, (current, key))
+                continue
+            return rank, key
+        return None
+
+    def _push(self, heap: List[Tuple[float, FileKey]], key: FileKey) -> None:
+        """Track a key in an eviction heap, compacting it when dead keys pile up."""
+        heapq.heappush(heap, (self.tracker.rank(*key), key))
+        if len(heap) > 2 * len(self._entries) + 64:
+            ranked = {key: self.tracker.rank(*key) for _, key in heap if key in self._entries}
+            heap[:] = [(rank, key) for key, rank in ranked.items()]
+            heapq.heapify(heap)
+
+    def _entry(self, key: FileKey) -> WarmEntry:
+        """Get or create the entry of a file, evicting the coldest entry if full."""
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_entries:
+                coldest = self._coldest(self._entry_heap, lambda k: k in self._entries)
+                if coldest:
+                    heapq.heappop(self._entry_heap)
+                    self._drop(coldest[1])
+            entry = self._entries[key] = WarmEntry()
+            self._push(self._entry_heap, key)
+        return entry
+
+    def _drop(self, key: FileKey) -> None:
+        """Remove an entry and release its bytes."""
+        entry = self._entries.pop(key, None)
+        if entry and entry.content is not None:
+            self.used_bytes -= len(entry.content)
+
+    def _version(self, folder_name: str, filename: str) -> Optional[Tuple[int, float]]:
+        """Return the current (size, mtime) of a file in the attached storage."""
+        if self.storage is None:
+            return None
+        try:
+            meta = self.storage.file_entries(folder_name).get(filename)
+        except OSError:
+            return None
+        return tuple(meta) if meta else None
+
+    def _file_id(self, key: FileKey, version: Optional[Tuple[int, float]]) -> Optional[str]:
+        """Return the file id of a file if it was sent from this version, forgetting a stale one."""
+        known = self._file_ids.get(key)
+        if known is None:
+            return None
+        if known[1] != version:
+            self.forget_file_id(*key)
+            return None
+        return known[0]
+
+    def lookup(self, folder_name: str, filename: str) -> Optional[WarmEntry]:
+        """Return the warm entry if it can serve the file, counting hits and misses."""
+        key = (folder_name, filename)
+        version = self._version(folder_name, filename)
+        entry = self._entries.get(key)
+        if entry and entry.content is not None and entry.version != version:
+            # Changed by another process since the bytes were read
+            self.used_bytes -= len(entry.content)
+            entry.content = None
+        file_id = self._file_id(key, version)
+        if file_id or (entry and entry.content is not None):
+            entry = entry or self._entry(key)
+            entry.file_id = file_id
+            entry.hits += 1
+            self.hits += 1
+            return entry
+        if entry:
+            entry.misses += 1
+        self.misses += 1
+        return None
+
+    def peek_file_id(self, folder_name: str, filename: str) -> Optional[str]:
+        """Return the known Telegram file id of a file without counting a hit."""
+        return self._file_id((folder_name, filename), self._version(folder_name, filename))
+
+    def remember_file_id(self, folder_name: str, filename: str, file_id: str,
+                         version: Optional[Tuple[int, float]] = None) -> None:
+        """Keep the Telegram file id of a sent file for instant re-sends.
+
+        version is the (size, mtime) of the file that was sent; it defaults to
+        the file's current one.
+        """
+        key = (folder_name, filename)
+        known = (file_id, version or self._version(folder_name, filename))
+        with self._lock:
+            self._file_ids[key] = known
+            if self.db_path:
+                self._unsaved_ids[key] = known
+
+    def forget_file_id(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Drop the file id of a file (e.g. one Telegram rejected) or of a whole folder."""
+        with self._lock:
+            for key in [key for key in self._file_ids
+                        if key[0] == folder_name and (filename is None or key[1] == filename)]:
+                del self._file_ids[key]
+            if self.db_path:
+                if filename is None:
+                    for key in [key for key in self._unsaved_ids if key[0] == folder_name]:
+                        del self._unsaved_ids[key]
+                self._unsaved_ids[(folder_name, filename)] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the file id database."""
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            "folder TEXT NOT NULL, filename TEXT NOT NULL, file_id TEXT NOT NULL, "
+            "size INTEGER, mtime REAL, PRIMARY KEY (folder, filename))"
+        )
+        return connection
+
+    def persist(self) -> None:
+        """Write unsaved file ids and removals, then load the ids other processes stored (blocking)."""
+        with self._lock:
+            unsaved, self._unsaved_ids = self._unsaved_ids, {}
+        connection = self._connect()
+        try:
+            with connection:
+                for (folder_name, filename), known in unsaved.items():
+                    if known is not None:
+                        file_id, version = known
+                        size, mtime = version or (None, None)
+                        connection.execute("INSERT OR REPLACE INTO file_ids (folder, filename, file_id, size, mtime) "
+                                           "VALUES (?, ?, ?, ?, ?)", (folder_name, filename, file_id, size, mtime))
+                    elif filename is None:
+                        connection.execute("DELETE FROM file_ids WHERE folder = ?", (folder_name,))
+                    else:
+                        connection.execute("DELETE FROM file_ids WHERE folder = ? AND filename = ?",
+                                           (folder_name, filename))
+            rows = connection.execute("SELECT folder, filename, file_id, size, mtime FROM file_ids").fetchall()
+        except sqlite3.Error:
+            with self._lock:
+                # Keep the changes for the next attempt unless newer ones replaced them
+                for key, known in unsaved.items():
+                    self._unsaved_ids.setdefault(key, known)
+            raise
+        finally:
+            connection.close()
+
+        file_ids = {(folder_name, filename): (file_id, (size, mtime) if size is not None else None)
+                    for folder_name, filename, file_id, size, mtime in rows}
+        with self._lock:
+            # Changes made while we were writing are not in the database yet
+            for (folder_name, filename), known in self._unsaved_ids.items():
+                if known is not None:
+                    file_ids[(folder_name, filename)] = known
+                else:
+                    for key in [key for key in file_ids
+                                if key[0] == folder_name and (filename is None or key[1] == filename)]:
+                        del file_ids[key]
+            self._file_ids = file_ids
+
+    def store_content(self, folder_name: str, filename: str, content: bytes,
+                      version: Optional[Tuple[int, float]] = None) -> bool:
+        """Keep the bytes of a small hot file, evicting colder contents if needed.
+
+        version is the (size, mtime) of the file before it was read; it
+        defaults to the file's current one.
+        """
+        size = len(content)
+        if size > self.max_file_bytes or size > self.max_bytes:
+            return False
+        key = (folder_name, filename)
+        entry = self._entry(key)
+        if entry.content is not None:
+            self.used_bytes -= len(entry.content)
+            entry.content = None
+
+        rank = self.tracker.rank(folder_name, filename)
+        has_content = lambda k: k in self._entries and self._entries[k].content is not None
+        while self.used_bytes + size > self.max_bytes:
+            coldest = self._coldest(self._content_heap, has_content)
+            if coldest is None:
+                break
+            victim_rank, victim = coldest
+            if victim_rank > rank:
+                # Everything cached is hotter than the newcomer
+                return False
+            heapq.heappop(self._content_heap)
+            self.used_bytes -= len(self._entries[victim].content)
+            self._entries[victim].content = None
+
+        entry.content = content
+        entry.version = version or self._version(folder_name, filename)
+        self.used_bytes += size
+        self._push(self._content_heap, key)
+        return True
+
+    def has_content(self, folder_name: str, filename: str) -> bool:
+        """Check whether a file's bytes are cached."""
+        entry = self._entries.get((folder_name, filename))
+        return bool(entry and entry.content is not None)
+
+    def hit_rate(self, folder_name: Optional[str] = None, filename: Optional[str] = None) -> float:
+        """Return the hit rate of one file, or of the whole cache."""
+        if folder_name is None:
+            hits, total = self.hits, self.hits + self.misses
+        else:
+            entry = self._entries.get((folder_name, filename))
+            hits = entry.hits if entry else 0
+            total = hits + (entry.misses if entry else 0)
+        return hits / total if total else 0.0
+
+    def invalidate(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Forget cached data and file ids of a changed file or a deleted folder."""
+        keys = [key for key in self._entries
+                if key[0] == folder_name and (filename is None or key[1] == filename)]
+        for key in keys:
+            self._drop(key)
+        self.forget_file_id(folder_name, filename)
+
+    def attach(self, storage) -> None:
+        """Check entries against storage and invalidate them (and counters of deleted files) on its mutations."""
+        self.storage = storage
+
+        def listener(event: str, folder_name: str, filename: Optional[str]) -> None:
+            if event == FILE_SAVED:
+                self.invalidate(folder_name, filename)
+            elif event == FILE_DELETED:
+                self.invalidate(folder_name, filename)
+                self.tracker.forget(folder_name, filename)
+            elif event == FOLDER_DELETED:
+                self.invalidate(folder_name)
+                self.tracker.forget(folder_name)
+        storage.add_listener(listener)
@@ -0,0 +1,161 @@
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; image previews are skipped without it
+    Image = None
+
+from indexed_pool import IndexedProcessPool
+
+logger = logging.getLogger(__name__)
+
+PREVIEWS_DIR = ".previews"
+
+PDF_EXTENSIONS = {'.pdf'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov'}
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Compute the SHA-256 content hash of a file."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _render_pdf(file_path: str, output_path: str, max_dimension: int) -> bool:
+    """Render the first page of a PDF to PNG using poppler's pdftoppm."""
+    if not shutil.which("pdftoppm"):
+        return False
+    output_prefix = os.path.splitext(output_path)[0]
+    subprocess.run(
+        ["pdftoppm", "-png", "-f", "1", "-l", "1", "-singlefile",
+         "-scale-to", str(max_dimension), file_path, output_prefix],
+        check=True, capture_output=True, timeout=60
+    )
+    return os.path.exists(output_path)
+
+def _render_image(file_path: str, output_path: str, max_dimension: int) -> bool:
+    """Downscale an image to a small JPEG."""
+    if Image is None:
+        return False
+    with Image.open(file_path) as image:
+        image.thumbnail((max_dimension, max_dimension))
+        image.convert("RGB").save(output_path, "JPEG", quality=70, optimize=True)
+    return True
+
+def _render_video(file_path: str, output_path: str, max_dimension: int) -> bool:
+    """Grab a poster frame from a video using ffmpeg."""
+    if not shutil.which("ffmpeg"):
+        return False
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-ss", "1", "-i", file_path,
+         "-frames:v", "1", "-vf", f"scale='min({max_dimension},iw)':-2", output_path],
+        check=True, capture_output=True, timeout=120
+    )
+    return os.path.exists(output_path)
+
+def generate_preview(file_path: str, cache_dir: str, max_dimension: int) -> Optional[Tuple[str, str]]:
+    """Create (or reuse) the cached preview of a file.
+
+    Runs inside a worker process. Returns (content_hash, preview_path), or None
+    when the media type is unsupported or the required tool is unavailable.
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in PDF_EXTENSIONS:
+        renderer, preview_extension = _render_pdf, '.png'
+    elif extension in IMAGE_EXTENSIONS:
+        renderer, preview_extension = _render_image, '.jpg'
+    elif extension in VIDEO_EXTENSIONS:
+        renderer, preview_extension = _render_video, '.jpg'
+    else:
+        return None
+
+    content_hash = hash_file(file_path)
+    preview_path = os.path.join(cache_dir, f"{content_hash}{preview_extension}")
+    if os.path.exists(preview_path):
+        return content_hash, preview_path
+
+    # Render into a private temp dir, then publish atomically
+    with tempfile.TemporaryDirectory(dir=cache_dir) as work_dir:
+        temp_output = os.path.join(work_dir, f"preview{preview_extension}")
+        if not renderer(file_path, temp_output, max_dimension):
+            return None
+        os.replace(temp_output, preview_path)
+    return content_hash, preview_path
+
+class PreviewManager(IndexedProcessPool):
+    """Generate small previews of stored files in a background process pool.
+
+    Previews are cached on disk by content hash, so identical files share one
+    preview and re-uploads are free. An index maps (folder, filename) to the
+    hash so lookups on /get never need to read the original file. Download
+    buttons carry a token derived from (folder, filename), so identical files
+    in two folders never resolve to each other.
+    """
+
+    kind = "preview"
+
+    def __init__(self, base_path: str, max_workers: int = 2, max_dimension: int = 320):
+        self.max_dimension = max_dimension
+        self._tokens: Dict[str, str] = {}  # download token -> index key
+        super().__init__(os.path.join(base_path, PREVIEWS_DIR), max_workers)
+        self.cache_dir = self.directory
+        logger.info(f"PreviewManager initialized with cache dir: {self.cache_dir}")
+
+    @staticmethod
+    def token_for(folder_name: str, filename: str) -> str:
+        """Return the download token of a stored file (fits in callback data)."""
+        return hashlib.sha256(f"{folder_name}/{filename}".encode()).hexdigest()[:32]
+
+    def on_index_changed(self) -> None:
+        self._tokens = {self.token_for(*key.split('/', 1)): key for key in self._index}
+
+    def schedule(self, folder_name: str, filename: str, file_path: str) -> Future:
+        """Queue preview generation for a stored file."""
+        future = self._get_executor().submit(generate_preview, file_path, self.cache_dir, self.max_dimension)
+        future.add_done_callback(lambda f: self._on_generated(folder_name, filename, f))
+        return future
+
+    def _on_generated(self, folder_name: str, filename: str, future: Future) -> None:
+        """Record a finished preview in the index."""
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.warning(f"Preview generation failed for {folder_name}/{filename}: {str(e)}")
+            return
+        if result is None:
+            logger.debug(f"No preview available for {folder_name}/{filename}")
+            return
+        content_hash, preview_path = result
+        self._update({self._key(folder_name, filename): {'hash': content_hash, 'path': preview_path}})
+        logger.info(f"Preview ready for {folder_name}/{filename}: {preview_path}")
+
+    def get_preview(self, folder_name: str, filename: str) -> Optional[Tuple[str, str]]:
+        """Return (download token, preview_path) if a preview is cached for the file."""
+        entry = self._entry(folder_name, filename)
+        if entry and os.path.exists(entry['path']):
+            return self.token_for(folder_name, filename), entry['path']
+        return None
+
+    def resolve_token(self, token: str) -> Optional[Tuple[str, str]]:
+        """Find the (folder, filename) a download token was issued for."""
+        with self._lock:
+            self._reload_if_changed()
+            key = self._tokens.get(token)
+        if key is None:
+            return None
+        folder_name, filename = key.split('/', 1)
+        return folder_name, filename
+
+    def on_file_saved(self, storage, folder_name: str, filename: str) -> None:
+        # A re-upload replaces the file, so its old preview must not be offered meanwhile
+        self.forget(folder_name, filename)
+        self.schedule(folder_name, filename, os.path.join(storage.base_path, folder_name, filename))
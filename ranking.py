@@ -0,0 +1,126 @@
+import heapq
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+# (folder_name, filename, mtime) of a file considered for a results page
+Candidate = Tuple[str, str, float]
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text: str) -> Set[str]:
+    """Split text into lowercase alphanumeric tokens."""
+    return set(_TOKEN_PATTERN.findall(text.lower()))
+
+@lru_cache(maxsize=65536)
+def _name_tokens(name: str) -> FrozenSet[str]:
+    """Tokenize a filename once; names repeat across every query."""
+    return frozenset(_TOKEN_PATTERN.findall(name))
+
+@dataclass
+class RankingWeights:
+    """Relative weights of the ranking signals."""
+    position: float = 1.0
+    token_overlap: float = 1.0
+    recency: float = 0.3
+    popularity: float = 0.5
+    recency_half_life_days: float = 30.0
+    # Popularity score at which the popularity signal reaches 0.5
+    popularity_midpoint: float = 5.0
+
+class Ranker:
+    """Score search candidates and select a results page with a bounded heap.
+
+    Each signal is normalized to [0, 1]: how early the query occurs in the
+    filename, the share of query tokens present in it, how recently the file
+    changed, and how popular it currently is.
+
+    Scores move with the clock and with popularity, so page() can keep the
+    scores computed for a search under an order key: later pages of the same
+    search are cut from those frozen scores and never repeat or skip a file.
+    """
+
+    def __init__(self, weights: Optional[RankingWeights] = None,
+                 popularity: Optional[Callable[[str, str], float]] = None,
+                 max_orders: int = 256, order_ttl_seconds: float = 1800):
+        self.weights = weights or RankingWeights()
+        self.popularity = popularity
+        self._recency_rate = math.log(2) / (self.weights.recency_half_life_days * 86400)
+        self.max_orders = max_orders
+        self.order_ttl_seconds = order_ttl_seconds
+        # order key -> (scored_at, [(score, candidate)] in candidate order)
+        self._orders: "OrderedDict[Hashable, Tuple[float, List[Tuple[float, Candidate]]]]" = OrderedDict()
+
+    def score(self, query: str, query_tokens: Set[str], candidate: Candidate, now: float) -> float:
+        """Compute the relevance score of one candidate."""
+        folder_name, filename, mtime = candidate
+        weights = self.weights
+        name = os.path.splitext(filename)[0].lower()
+        total = 0.0
+
+        if query:
+            position = name.find(query)
+            if position >= 0:
+                total += weights.position * (1.0 - position / max(len(name), 1))
+            if query_tokens:
+                overlap = len(query_tokens & _name_tokens(name)) / len(query_tokens)
+                total += weights.token_overlap * overlap
+
+        if weights.recency:
+            age = max(0.0, now - mtime)
+            total += weights.recency * math.exp(-self._recency_rate * age)
+
+        if weights.popularity and self.popularity:
+            popularity = self.popularity(folder_name, filename)
+            total += weights.popularity * popularity / (popularity + weights.popularity_midpoint)
+
+        return total
+
+    def top_k(self, query: str, candidates: Iterable[Candidate], k: int) -> List[Candidate]:
+        """Return the k best candidates, best first, in O(N log k)."""
+        if k <= 0:
+            return []
+        query = query.lower()
+        query_tokens = tokenize(query)
+        now = time.time()
+        # nlargest is stable, so ties keep the (cached) directory order across pages
+        return heapq.nlargest(k, candidates, key=lambda c: self.score(query, query_tokens, c, now))
+
+    def _scored(self, query: str, candidates: Iterable[Candidate], order_key: Hashable) -> List[Tuple[float, Candidate]]:
+        """Return the frozen scores of a search, scoring the candidates on first use or after the TTL."""
+        now = time.time()
+        cached = self._orders.get(order_key)
+        if cached and now - cached[0] <= self.order_ttl_seconds:
+            self._orders.move_to_end(order_key)
+            return cached[1]
+        query = query.lower()
+        query_tokens = tokenize(query)
+        scored = [(self.score(query, query_tokens, candidate, now), candidate) for candidate in candidates]
+        self._orders[order_key] = (now, scored)
+        self._orders.move_to_end(order_key)
+        while len(self._orders) > self.max_orders:
+            self._orders.popitem(last=False)
+        return scored
+
+    def page(self, query: str, candidates: Iterable[Candidate], page: int, per_page: int,
+             order_key: Optional[Hashable] = None) -> List[Candidate]:
+        """Return one page of ranked candidates.
+
+        With an order_key, every page of a search is cut from the scores of
+        its first page (see the class docstring).
+        """
+        start_idx = (page - 1) * per_page
+        if order_key is None:
+            return self.top_k(query, candidates, start_idx + per_page)[start_idx:]
+        scored = self._scored(query, candidates, order_key)
+        return [candidate for _, candidate in
+                heapq.nlargest(start_idx + per_page, scored, key=lambda item: item[0])[start_idx:]]
+
+    def clear_orders(self) -> None:
+        """Forget frozen search orders (e.g. after storage changes)."""
+        self._orders.clear()
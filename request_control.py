@@ -0,0 +1,91 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent callers with the same key.
+
+    The first caller (the leader) runs the computation; callers arriving while
+    it runs await the same result instead of repeating the work. Nothing is
+    cached once the computation finishes.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Check whether a computation for key is currently running."""
+        return key in self._flights
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared); shared is True when another caller computed it."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.followers += 1
+            # Shielded so a cancelled follower does not cancel the leader's work
+            return await asyncio.shield(flight), True
+
+        self.leaders += 1
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            # Mark the exception retrieved in case no follower was waiting
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+            return result, False
+        finally:
+            del self._flights[key]
+
+class RateLimiter:
+    """Per-user token buckets.
+
+    Each user may make burst requests at once and then rate_per_minute
+    requests per minute. Buckets of users not seen recently are evicted
+    least recently used first.
+    """
+
+    def __init__(self, rate_per_minute: float = 20, burst: int = 10, max_users: int = 10000):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_users = max_users
+        # user_id -> (tokens, last refill time)
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self.rejected = 0
+
+    def _refill(self, user_id: Hashable, now: float) -> float:
+        """Return the user's current token count after refilling since the last request."""
+        tokens, last = self._buckets.get(user_id, (float(self.burst), now))
+        return min(float(self.burst), tokens + (now - last) * self.rate_per_second)
+
+    def allow(self, user_id: Hashable) -> bool:
+        """Take one token for a request; False when the user is over the limit."""
+        now = time.monotonic()
+        tokens = self._refill(user_id, now)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        else:
+            self.rejected += 1
+        self._buckets[user_id] = (tokens, now)
+        self._buckets.move_to_end(user_id)
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return allowed
+
+    def retry_after(self, user_id: Hashable) -> float:
+        """Seconds until the user has a token again."""
+        tokens = self._refill(user_id, time.monotonic())
+        if tokens >= 1.0 or not self.rate_per_second:
+            return 0.0
+        return (1.0 - tokens) / self.rate_per_second
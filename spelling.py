@@ -0,0 +1,159 @@
+import logging
+import os
+import re
+import threading
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+from ranking import tokenize
+from storage_manager import FILE_SAVED, FILE_DELETED, FOLDER_DELETED, StorageManager
+
+logger = logging.getLogger(__name__)
+
+FileKey = Tuple[str, str]  # (folder_name, filename)
+
+_WORD_PATTERN = re.compile(r'[a-z0-9]+', re.IGNORECASE)
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 once it is known to exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[len(b)]
+
+class SpellCorrector:
+    """Symmetric-delete spelling correction over the words in stored filenames.
+
+    Every word is indexed under all variants of its prefix with up to
+    max_edit_distance characters deleted. A query word is corrected by
+    generating the same deletes of it and verifying the few words found under
+    them, so a lookup costs a handful of dictionary probes instead of a scan.
+    Among candidates the closest wins, then the one in most filenames.
+    """
+
+    def __init__(self, max_edit_distance: int = 2, prefix_length: int = 7, min_word_length: int = 4):
+        self.max_edit_distance = max_edit_distance
+        self.prefix_length = prefix_length
+        self.min_word_length = min_word_length
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}  # word -> number of filenames containing it
+        self._deletes: Dict[str, Set[str]] = {}
+        self._files: Dict[FileKey, FrozenSet[str]] = {}
+
+    def _variants(self, word: str) -> Set[str]:
+        """Return the prefix of a word with every combination of up to max_edit_distance deletions."""
+        variants = {word[:self.prefix_length]}
+        frontier = set(variants)
+        for _ in range(self.max_edit_distance):
+            frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+            variants |= frontier
+        return variants
+
+    def _add_word(self, word: str) -> None:
+        """Count a word, indexing its deletes the first time it is seen (caller holds _lock)."""
+        count = self._counts.get(word, 0)
+        self._counts[word] = count + 1
+        if count == 0:
+            for variant in self._variants(word):
+                self._deletes.setdefault(variant, set()).add(word)
+
+    def _remove_word(self, word: str) -> None:
+        """Uncount a word, dropping its deletes when no filename uses it any more (caller holds _lock)."""
+        count = self._counts.get(word, 0) - 1
+        if count > 0:
+            self._counts[word] = count
+            return
+        self._counts.pop(word, None)
+        for variant in self._variants(word):
+            words = self._deletes.get(variant)
+            if words is not None:
+                words.discard(word)
+                if not words:
+                    del self._deletes[variant]
+
+    def add_file(self, folder_name: str, filename: str) -> None:
+        """Index the words of a filename (no-op if the file is already indexed)."""
+        key = (folder_name, filename)
+        words = frozenset(word for word in tokenize(os.path.splitext(filename)[0])
+                          if len(word) >= self.min_word_length and not word.isdigit())
+        with self._lock:
+            if key in self._files:
+                return
+            self._files[key] = words
+            for word in words:
+                self._add_word(word)
+
+    def remove_file(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Unindex a file, or every file of a folder when filename is None."""
+        with self._lock:
+            keys = [(folder_name, filename)] if filename is not None else \
+                [key for key in self._files if key[0] == folder_name]
+            for key in keys:
+                for word in self._files.pop(key, ()):
+                    self._remove_word(word)
+
+    def rebuild(self, storage: StorageManager) -> int:
+        """Index every stored filename (blocking); returns the number of distinct words."""
+        for folder_name in storage.list_folders():
+            try:
+                filenames = list(storage.file_entries(folder_name))
+            except FileNotFoundError:
+                continue
+            for filename in filenames:
+                self.add_file(folder_name, filename)
+        logger.info(f"Spelling index built: {len(self._counts)} words from {len(self._files)} files")
+        return len(self._counts)
+
+    def lookup(self, word: str) -> Optional[str]:
+        """Return the best known word within the edit distance, or None if there is none."""
+        word = word.lower()
+        if len(word) < self.min_word_length or word.isdigit():
+            return None
+        limit = 1 if len(word) <= 5 else self.max_edit_distance
+        with self._lock:
+            if word in self._counts:
+                return word
+            candidates = set()
+            for variant in self._variants(word):
+                candidates.update(self._deletes.get(variant, ()))
+            best, best_rank = None, None
+            for candidate in candidates:
+                distance = _edit_distance(word, candidate, limit)
+                if distance > limit:
+                    continue
+                rank = (distance, -self._counts[candidate], candidate)
+                if best_rank is None or rank < best_rank:
+                    best, best_rank = candidate, rank
+        return best
+
+    def correct(self, query: str) -> str:
+        """Replace each unknown word of a query with its best correction."""
+        def replace(match: re.Match) -> str:
+            word = match.group()
+            corrected = self.lookup(word)
+            return corrected if corrected and corrected != word.lower() else word
+        return _WORD_PATTERN.sub(replace, query)
+
+    def _on_storage_event(self, event: str, folder_name: str, filename: Optional[str]) -> None:
+        """Keep the dictionary in step with saves and deletions."""
+        if event == FILE_SAVED and filename:
+            self.add_file(folder_name, filename)
+        elif event == FILE_DELETED and filename:
+            self.remove_file(folder_name, filename)
+        elif event == FOLDER_DELETED:
+            self.remove_file(folder_name)
+
+    def attach(self, storage: StorageManager) -> None:
+        """Correct search queries in storage and track its files."""
+        storage.speller = self
+        storage.add_listener(self._on_storage_event)
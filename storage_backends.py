@@ -0,0 +1,347 @@
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from typing import BinaryIO, Callable, ContextManager, Dict, List, NamedTuple, Optional, Protocol
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 is optional; only the S3 backend needs it
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+# In-progress writes are dotfiles named .<filename><TEMP_SUFFIX>-<id> (matches storage_manager)
+TEMP_SUFFIX = ".tmp"
+COPY_CHUNK_BYTES = 1024 * 1024
+
+class ObjectStat(NamedTuple):
+    """Size in bytes and modification time of a stored file."""
+    size: int
+    mtime: float
+
+class StorageBackend(Protocol):
+    """Where StorageManager keeps file contents.
+
+    Files live in flat folders; folder and file names are already sanitized
+    and never start with a dot. Missing files raise FileNotFoundError.
+    Implementations must be safe to call from several threads.
+    """
+
+    def folders(self) -> List[str]:
+        """List folder names."""
+
+    def folder_exists(self, folder_name: str) -> bool:
+        """Check whether a folder exists."""
+
+    def create_folder(self, folder_name: str) -> None:
+        """Create a folder (no-op if it exists)."""
+
+    def delete_folder(self, folder_name: str) -> None:
+        """Delete a folder and everything in it."""
+
+    def list(self, folder_name: str) -> Dict[str, ObjectStat]:
+        """Map each file in a folder to its stat; raises FileNotFoundError for missing folders."""
+
+    def stat(self, folder_name: str, filename: str) -> ObjectStat:
+        """Return a file's size and mtime."""
+
+    def open_stream(self, folder_name: str, filename: str) -> BinaryIO:
+        """Open a file for reading; the caller closes the stream."""
+
+    def put_stream(self, folder_name: str, filename: str, stream: BinaryIO) -> ObjectStat:
+        """Store a file from a readable stream, replacing any previous version atomically."""
+
+    def delete(self, folder_name: str, filename: str) -> None:
+        """Delete a file."""
+
+    def rename(self, folder_name: str, filename: str, new_filename: str) -> None:
+        """Rename a file within a folder, replacing any file with the new name."""
+
+class LocalFSBackend:
+    """Files on the local filesystem under base_path, one directory per folder.
+
+    Writes go to a hidden temp file that is fsynced and renamed into place,
+    so readers see either the old or the new content. Dot-entries are
+    internal (locks, trash, temp files) and never listed. commit_lock, when
+    set, is held around the rename (StorageManager passes its folder lock).
+    """
+
+    def __init__(self, base_path: str, commit_lock: Optional[Callable[[str], ContextManager]] = None):
+        self.base_path = os.path.abspath(base_path)
+        self.commit_lock = commit_lock
+
+    def _commit(self, folder_name: str) -> ContextManager:
+        return self.commit_lock(folder_name) if self.commit_lock else nullcontext()
+
+    def path(self, folder_name: str, filename: Optional[str] = None) -> str:
+        """Return the filesystem path of a folder or file."""
+        folder_path = os.path.join(self.base_path, folder_name)
+        return os.path.join(folder_path, filename) if filename is not None else folder_path
+
+    def folders(self) -> List[str]:
+        return [name for name in os.listdir(self.base_path)
+                if not name.startswith('.') and os.path.isdir(os.path.join(self.base_path, name))]
+
+    def folder_exists(self, folder_name: str) -> bool:
+        return os.path.isdir(self.path(folder_name))
+
+    def create_folder(self, folder_name: str) -> None:
+        os.makedirs(self.path(folder_name), exist_ok=True)
+
+    def delete_folder(self, folder_name: str) -> None:
+        shutil.rmtree(self.path(folder_name))
+
+    def list(self, folder_name: str) -> Dict[str, ObjectStat]:
+        entries = {}
+        with os.scandir(self.path(folder_name)) as it:
+            for entry in it:
+                # Dotfiles are in-progress writes or internal bookkeeping, never user files
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries[entry.name] = ObjectStat(stat.st_size, stat.st_mtime)
+        return entries
+
+    def stat(self, folder_name: str, filename: str) -> ObjectStat:
+        stat = os.stat(self.path(folder_name, filename))
+        return ObjectStat(stat.st_size, stat.st_mtime)
+
+    def open_stream(self, folder_name: str, filename: str) -> BinaryIO:
+        return open(self.path(folder_name, filename), 'rb')
+
+    def put_stream(self, folder_name: str, filename: str, stream: BinaryIO) -> ObjectStat:
+        file_path = self.path(folder_name, filename)
+        temp_path = self.path(folder_name, f".{filename}{TEMP_SUFFIX}-{uuid.uuid4().hex}")
+        try:
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, COPY_CHUNK_BYTES)
+                f.flush()
+                os.fsync(f.fileno())
+            with self._commit(folder_name):
+                os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return self.stat(folder_name, filename)
+
+    def delete(self, folder_name: str, filename: str) -> None:
+        os.remove(self.path(folder_name, filename))
+
+    def rename(self, folder_name: str, filename: str, new_filename: str) -> None:
+        with self._commit(folder_name):
+            os.replace(self.path(folder_name, filename), self.path(folder_name, new_filename))
+
+class MemoryBackend:
+    """Files held in process memory, for tests and benchmarks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._folders: Dict[str, Dict[str, tuple]] = {}  # folder -> {filename: (bytes, mtime)}
+
+    def _folder(self, folder_name: str) -> Dict[str, tuple]:
+        """Return a folder's files (caller holds _lock)."""
+        files = self._folders.get(folder_name)
+        if files is None:
+            raise FileNotFoundError(f"Folder '{folder_name}' does not exist")
+        return files
+
+    def _file(self, folder_name: str, filename: str) -> tuple:
+        """Return (content, mtime) of a file (caller holds _lock)."""
+        try:
+            return self._folder(folder_name)[filename]
+        except KeyError:
+            raise FileNotFoundError(f"File '{folder_name}/{filename}' does not exist")
+
+    def folders(self) -> List[str]:
+        with self._lock:
+            return list(self._folders)
+
+    def folder_exists(self, folder_name: str) -> bool:
+        with self._lock:
+            return folder_name in self._folders
+
+    def create_folder(self, folder_name: str) -> None:
+        with self._lock:
+            self._folders.setdefault(folder_name, {})
+
+    def delete_folder(self, folder_name: str) -> None:
+        with self._lock:
+            self._folder(folder_name)
+            del self._folders[folder_name]
+
+    def list(self, folder_name: str) -> Dict[str, ObjectStat]:
+        with self._lock:
+            return {name: ObjectStat(len(content), mtime) for name, (content, mtime) in self._folder(folder_name).items()}
+
+    def stat(self, folder_name: str, filename: str) -> ObjectStat:
+        with self._lock:
+            content, mtime = self._file(folder_name, filename)
+            return ObjectStat(len(content), mtime)
+
+    def open_stream(self, folder_name: str, filename: str) -> BinaryIO:
+        with self._lock:
+            return io.BytesIO(self._file(folder_name, filename)[0])
+
+    def put_stream(self, folder_name: str, filename: str, stream: BinaryIO) -> ObjectStat:
+        content = stream.read()
+        mtime = time.time()
+        with self._lock:
+            self._folders.setdefault(folder_name, {})[filename] = (content, mtime)
+        return ObjectStat(len(content), mtime)
+
+    def delete(self, folder_name: str, filename: str) -> None:
+        with self._lock:
+            self._file(folder_name, filename)
+            del self._folders[folder_name][filename]
+
+    def rename(self, folder_name: str, filename: str, new_filename: str) -> None:
+        with self._lock:
+            files = self._folder(folder_name)
+            files[new_filename] = self._file(folder_name, filename)
+            if new_filename != filename:
+                del files[filename]
+
+class S3Backend:
+    """Files as objects in an S3-compatible bucket, keyed <prefix><folder>/<filename>.
+
+    One client with a pooled connection set is shared by every thread.
+    Uploads stream in part_size chunks through a multipart upload (a single
+    PUT when the file fits in one part), so memory use is bounded by one
+    part whatever the file size. endpoint_url points the backend at
+    MinIO or any other S3-compatible server. Folders exist as a
+    zero-byte <folder>/ marker object so empty folders can be listed.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region_name: Optional[str] = None, part_size: int = 8 * 1024 * 1024,
+                 max_pool_connections: int = 16, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("S3 storage requires boto3 (pip install boto3)")
+            client = boto3.session.Session().client(
+                "s3", endpoint_url=endpoint_url, region_name=region_name,
+                config=BotoConfig(max_pool_connections=max_pool_connections,
+                                  retries={'max_attempts': 5, 'mode': 'standard'})
+            )
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        # S3 rejects multipart parts under 5MB except the last one
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+
+    def _key(self, folder_name: str, filename: str = "") -> str:
+        return f"{self.prefix}{folder_name}/{filename}"
+
+    @staticmethod
+    def _is_missing(error: Exception) -> bool:
+        return error.response.get('Error', {}).get('Code') in ("404", "NoSuchKey", "NotFound")
+
+    def folders(self) -> List[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        folders = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix, Delimiter="/"):
+            for common in page.get('CommonPrefixes', []):
+                name = common['Prefix'][len(self.prefix):].rstrip("/")
+                if name and not name.startswith('.'):
+                    folders.append(name)
+        return folders
+
+    def folder_exists(self, folder_name: str) -> bool:
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=self._key(folder_name), MaxKeys=1)
+        return response.get('KeyCount', 0) > 0
+
+    def create_folder(self, folder_name: str) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(folder_name), Body=b"")
+
+    def delete_folder(self, folder_name: str) -> None:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(folder_name)):
+            keys = [{'Key': item['Key']} for item in page.get('Contents', [])]
+            if keys:
+                self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys, 'Quiet': True})
+
+    def list(self, folder_name: str) -> Dict[str, ObjectStat]:
+        folder_key = self._key(folder_name)
+        paginator = self.client.get_paginator("list_objects_v2")
+        entries = {}
+        found = False
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=folder_key, Delimiter="/"):
+            for item in page.get('Contents', []):
+                found = True
+                name = item['Key'][len(folder_key):]
+                if name and not name.startswith('.'):
+                    entries[name] = ObjectStat(item['Size'], item['LastModified'].timestamp())
+        if not found:
+            raise FileNotFoundError(f"Folder '{folder_name}' does not exist")
+        return entries
+
+    def stat(self, folder_name: str, filename: str) -> ObjectStat:
+        try:
+            response = self.client.head_object(Bucket=self.bucket, Key=self._key(folder_name, filename))
+        except ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(f"File '{folder_name}/{filename}' does not exist")
+            raise
+        return ObjectStat(response['ContentLength'], response['LastModified'].timestamp())
+
+    def open_stream(self, folder_name: str, filename: str) -> BinaryIO:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(folder_name, filename))
+        except ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(f"File '{folder_name}/{filename}' does not exist")
+            raise
+        return response['Body']
+
+    def put_stream(self, folder_name: str, filename: str, stream: BinaryIO) -> ObjectStat:
+        key = self._key(folder_name, filename)
+        chunk = stream.read(self.part_size)
+        following = stream.read(self.part_size)
+        if not following:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=chunk)
+            return self.stat(folder_name, filename)
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+        parts = []
+        try:
+            while chunk:
+                number = len(parts) + 1
+                response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                   PartNumber=number, Body=chunk)
+                parts.append({'ETag': response['ETag'], 'PartNumber': number})
+                chunk, following = following, stream.read(self.part_size) if following else b""
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                  MultipartUpload={'Parts': parts})
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        logger.debug(f"Uploaded s3://{self.bucket}/{key} in {len(parts)} parts")
+        return self.stat(folder_name, filename)
+
+    def delete(self, folder_name: str, filename: str) -> None:
+        self.stat(folder_name, filename)  # S3 deletes of missing keys succeed silently
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(folder_name, filename))
+
+    def rename(self, folder_name: str, filename: str, new_filename: str) -> None:
+        # Managed copy: server-side, and split into part copies for objects over 5GB
+        self.client.copy({'Bucket': self.bucket, 'Key': self._key(folder_name, filename)},
+                         self.bucket, self._key(folder_name, new_filename))
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(folder_name, filename))
+
+def create_backend(kind: str, base_path: str, **s3_options) -> StorageBackend:
+    """Build the backend named by kind: "local", "memory" or "s3"."""
+    if kind == "local":
+        return LocalFSBackend(base_path)
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "s3":
+        return S3Backend(**s3_options)
+    raise ValueError(f"Unknown storage backend: '{kind}'")
@@ -0,0 +1,100 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Hashable, Tuple
+
+class AsyncRWLock:
+    """Reader/writer lock for asyncio with writer preference.
+
+    Any number of readers may hold the lock together; a writer holds it alone.
+    Once a writer is waiting, new readers queue behind it so writers are not
+    starved by a steady stream of readers.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @property
+    def idle(self) -> bool:
+        """True when nobody holds or waits for the lock."""
+        return not self._readers and not self._writer and not self._waiting_writers
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[None]:
+        """Hold the lock in shared mode."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[None]:
+        """Hold the lock exclusively."""
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._writer = False
+                self._condition.notify_all()
+
+class LockRegistry:
+    """Per-folder and per-file reader/writer locks, created on demand.
+
+    Locks are dropped again once idle so the registry does not grow with
+    every file ever touched.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, AsyncRWLock] = {}
+        self._users: Dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def _hold(self, key: Hashable, exclusive: bool) -> AsyncIterator[None]:
+        """Acquire the lock of key in the requested mode."""
+        lock = self._locks.setdefault(key, AsyncRWLock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with (lock.write() if exclusive else lock.read()):
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key] and lock.idle:
+                del self._users[key]
+                del self._locks[key]
+
+    @staticmethod
+    def _folder_key(folder_name: str) -> Tuple[str, str]:
+        """Key of a folder lock."""
+        return ("folder", folder_name)
+
+    @staticmethod
+    def _file_key(folder_name: str, filename: str) -> Tuple[str, str, str]:
+        """Key of a file lock."""
+        return ("file", folder_name, filename)
+
+    def read_folder(self, folder_name: str):
+        """Shared folder lock: held by anything that must not see the folder vanish."""
+        return self._hold(self._folder_key(folder_name), exclusive=False)
+
+    def write_folder(self, folder_name: str):
+        """Exclusive folder lock: held while a folder is deleted."""
+        return self._hold(self._folder_key(folder_name), exclusive=True)
+
+    def write_file(self, folder_name: str, filename: str):
+        """Exclusive file lock: serializes writers of the same file."""
+        return self._hold(self._file_key(folder_name, filename), exclusive=True)
@@ -0,0 +1,120 @@
+import heapq
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+from storage_manager import StorageManager
+
+logger = logging.getLogger(__name__)
+
+# Internal directories that may hold leftover temporary work directories
+WORK_DIRS = (".previews", ".variants")
+
+class StorageMaintenance:
+    """Background garbage collection and quota reporting for the storage tree.
+
+    Folder usage comes from StorageManager's cached listings, so a pass only
+    rescans folders whose contents changed since the previous pass.
+    """
+
+    def __init__(self, storage: StorageManager, popularity=None, temp_max_age_seconds: float = 3600,
+                 remote_cache_bytes: int = 0):
+        self.storage = storage
+        self.popularity = popularity
+        self.temp_max_age_seconds = temp_max_age_seconds
+        # Local copies of remote-backend files are evicted beyond this size
+        self.remote_cache_bytes = remote_cache_bytes
+        self.last_run: Optional[float] = None
+        self.last_summary: Dict[str, int] = {}
+
+    def _is_stale(self, path: str, now: float) -> bool:
+        """Check whether a temp file or directory is older than the allowed age."""
+        try:
+            return now - os.stat(path).st_mtime > self.temp_max_age_seconds
+        except FileNotFoundError:
+            return False
+
+    def cleanup_temp_files(self) -> Tuple[int, int]:
+        """Remove stale hidden temp files and work dirs; returns (count, bytes)."""
+        now = time.time()
+        removed = 0
+        freed = 0
+        # Remote backends write without temp files in user folders
+        for folder in (self.storage.list_folders() if self.storage.is_local else []):
+            folder_path = os.path.join(self.storage.base_path, folder)
+            for name in os.listdir(folder_path):
+                path = os.path.join(folder_path, name)
+                # Dotfiles in user folders are in-progress writes or import parts
+                if not name.startswith('.') or not os.path.isfile(path) or not self._is_stale(path, now):
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+                    freed += size
+                    logger.info(f"Removed stale temp file: {path}")
+                except OSError as e:
+                    logger.warning(f"Failed to remove stale temp file {path}: {str(e)}")
+
+        for work_dir in WORK_DIRS:
+            root_path = os.path.join(self.storage.base_path, work_dir)
+            for root, dirs, _ in os.walk(root_path):
+                for name in list(dirs):
+                    path = os.path.join(root, name)
+                    if name.startswith('tmp') and self._is_stale(path, now):
+                        shutil.rmtree(path, ignore_errors=True)
+                        dirs.remove(name)
+                        removed += 1
+                        logger.info(f"Removed stale work directory: {path}")
+        return removed, freed
+
+    def run(self) -> Dict[str, int]:
+        """Run one maintenance pass (blocking; call off the event loop)."""
+        started = time.monotonic()
+        removed, freed = self.cleanup_temp_files()
+        trash_purged = self.storage.purge_trash()
+        if not self.storage.is_local:
+            freed += self.storage.trim_remote_cache(self.remote_cache_bytes)
+        usage = self.storage.total_usage()
+        over_quota = [folder for folder, used in usage.items()
+                      if self.storage.folder_quota_bytes and used > self.storage.folder_quota_bytes]
+        for folder in over_quota:
+            logger.warning(f"Folder '{folder}' uses {usage[folder]} bytes, over its quota")
+
+        self.last_run = time.time()
+        self.last_summary = {
+            'temp_files_removed': removed,
+            'temp_bytes_freed': freed,
+            'trash_purged': trash_purged,
+            'total_bytes': sum(usage.values()),
+            'folders_over_quota': len(over_quota),
+        }
+        logger.info(f"Storage maintenance finished in {time.monotonic() - started:.2f}s: {self.last_summary}")
+        return self.last_summary
+
+    def _all_files(self) -> List[Tuple[str, str, int]]:
+        """Return (folder, filename, size) for every stored file."""
+        files = []
+        for folder in self.storage.list_folders():
+            for filename, (size, _) in self.storage.file_entries(folder).items():
+                files.append((folder, filename, size))
+        return files
+
+    def largest_files(self, limit: int = 5) -> List[Tuple[str, str, int]]:
+        """Return the biggest files."""
+        return heapq.nlargest(limit, self._all_files(), key=lambda f: f[2])
+
+    def least_accessed_files(self, limit: int = 5) -> List[Tuple[str, str, int, Optional[float]]]:
+        """Return the coldest files (never-accessed first, then least recently accessed)."""
+        if self.popularity is None:
+            return []
+        candidates = []
+        for folder, filename, size in self._all_files():
+            last_access = self.popularity.last_access(folder, filename)
+            candidates.append((self.popularity.score(folder, filename), last_access or 0.0,
+                               -size, folder, filename, last_access))
+        coldest = heapq.nsmallest(limit, candidates)
+        return [(folder, filename, -negative_size, last_access)
+                for _, _, negative_size, folder, filename, last_access in coldest]
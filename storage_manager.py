@@ -1,18 +1,91 @@
+import asyncio
+import errno
+import io
 import os
 import shutil
 import logging
-from typing import List, Optional, Dict, Tuple
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, List, Optional, Dict, Tuple
 from difflib import SequenceMatcher
+from storage_locks import LockRegistry
+from storage_backends import TEMP_SUFFIX, LocalFSBackend, StorageBackend
+
+try:
+    import fcntl
+except ImportError:  # Non-POSIX platforms fall back to in-process locking only
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# Internal directories under the base path start with a dot so they never clash
+# with sanitized folder names (sanitize_folder_name strips dots).
+LOCKS_DIR = ".locks"
+# Deleted folders are renamed here first and removed in the background
+TRASH_DIR = ".trash"
+# Local copies of files held by a remote backend, fetched on first access
+REMOTE_CACHE_DIR = ".remote-cache"
+
+# Events passed to storage listeners as (event, folder_name, filename)
+FILE_SAVED = "file_saved"
+FILE_DELETED = "file_deleted"
+FOLDER_DELETED = "folder_deleted"
+
+def is_safe_filename(filename: str) -> bool:
+    """Check that a user-supplied filename names a plain visible file inside its folder.
+
+    Backends join names to folder paths and object keys as they are, so path
+    separators, ".." and leading dots (reserved for temp and internal files)
+    are rejected.
+    """
+    return (bool(filename) and not filename.startswith('.')
+            and '/' not in filename and '\\' not in filename and '\0' not in filename
+            and os.path.basename(filename) == filename)
+
+class QuotaExceededError(Exception):
+    """Raised when saving a file would exceed a storage quota."""
+
 class StorageManager:
-    def __init__(self, base_path: str = "storage"):
-        """Initialize storage manager with given base path."""
+    def __init__(self, base_path: str = "storage", max_search_history: int = 500,
+                 backend: Optional[StorageBackend] = None):
+        """Initialize storage manager with given base path.
+
+        File contents live in backend (the base path itself by default); the
+        base path always holds locks and other internal state.
+        """
         self.base_path = os.path.abspath(base_path)
         self._ensure_base_path_exists()
-        logger.info(f"StorageManager initialized with base path: {self.base_path}")
+        self.backend = backend or LocalFSBackend(self.base_path)
+        # Path-based features (cold tier, snapshots, watcher, previews) need files on local disk
+        self.is_local = isinstance(self.backend, LocalFSBackend)
+        if self.is_local and self.backend.commit_lock is None:
+            self.backend.commit_lock = self.folder_lock
+        logger.info(f"StorageManager initialized with base path: {self.base_path} "
+                    f"({type(self.backend).__name__})")
         self.search_history = {}  # Store recent searches for recommendations
+        self.max_search_history = max_search_history
+        # Cached folder listings keyed by folder name -> (generation, {file: (size, mtime)}).
+        # The generation is derived from on-disk mtimes, so a mutation made by
+        # any process sharing this storage tree invalidates the cache.
+        self._listing_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Tuple[int, float]]]] = {}
+        # Optional ranking.Ranker; without it results keep directory order
+        self.ranker = None
+        # Optional spelling.SpellCorrector; queries with no matches are retried corrected
+        self.speller = None
+        # Optional cold_storage.ColdStorage; archived files stay listed and are restored on access
+        self.cold_tier = None
+        # Optional catalog_snapshot.CatalogSnapshot used to seed listings without scanning
+        self.snapshot = None
+        # Async reader/writer locks used by the *_async mutation methods
+        self.locks = LockRegistry()
+        # Quotas in bytes; 0 means unlimited
+        self.folder_quota_bytes = 0
+        self.global_quota_bytes = 0
+        # Per-folder usage totals keyed by the listing generation they were computed for
+        self._usage_cache: Dict[str, Tuple[Tuple[int, int], int]] = {}
+        self._listeners: List[Callable[[str, str, Optional[str]], None]] = []
 
     def _ensure_base_path_exists(self) -> None:
         """Ensure the base storage directory exists."""
@@ -23,12 +96,171 @@ class StorageManager:
             logger.error(f"Failed to create base directory: {str(e)}", exc_info=True)
             raise
 
-    def _get_folder_path(self, folder_name: str) -> str:
-        """Get the full path for a folder."""
+    def folder_path(self, folder_name: str) -> str:
+        """Get the local path of a folder (only holds its files with the local backend)."""
         folder_path = os.path.join(self.base_path, folder_name)
         logger.debug(f"Resolved folder path: {folder_path}")
         return folder_path
 
+    def add_listener(self, listener: Callable[[str, str, Optional[str]], None]) -> None:
+        """Register a callback invoked as listener(event, folder_name, filename) after mutations."""
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, folder_name: str, filename: Optional[str] = None) -> None:
+        """Inform listeners about a mutation; listener errors never fail the mutation."""
+        for listener in self._listeners:
+            try:
+                listener(event, folder_name, filename)
+            except Exception as e:
+                logger.error(f"Storage listener failed for {event} {folder_name}/{filename}: {str(e)}",
+                             exc_info=True)
+
+    def _lock_path(self, folder_name: str) -> str:
+        """Get the path of the lock/generation file for a folder."""
+        locks_dir = os.path.join(self.base_path, LOCKS_DIR)
+        os.makedirs(locks_dir, exist_ok=True)
+        return os.path.join(locks_dir, f"{folder_name}.lock")
+
+    @contextmanager
+    def folder_lock(self, folder_name: str, exclusive: bool = True) -> Iterator[None]:
+        """Hold an advisory cross-process lock on a folder."""
+        lock_path = self._lock_path(folder_name)
+        with open(lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _folder_generation(self, folder_name: str) -> Tuple[int, int]:
+        """Return a stamp that changes whenever the folder's contents change.
+
+        Remote backends have no cheap directory mtime, so only mutations made
+        through a StorageManager sharing this base path are noticed.
+        """
+        folder_mtime = os.stat(self.folder_path(folder_name)).st_mtime_ns if self.is_local else 0
+        try:
+            lock_mtime = os.stat(self._lock_path(folder_name)).st_mtime_ns
+        except FileNotFoundError:
+            lock_mtime = 0
+        return folder_mtime, lock_mtime
+
+    def invalidate_folder(self, folder_name: str) -> None:
+        """Invalidate cached listings of a folder in every process."""
+        self._listing_cache.pop(folder_name, None)
+        try:
+            os.utime(self._lock_path(folder_name))
+        except OSError as e:
+            logger.warning(f"Failed to bump generation for {folder_name}: {str(e)}")
+
+    def list_folders(self) -> List[str]:
+        """List user-visible folders, skipping internal dot-directories."""
+        return self.backend.folders()
+
+    def folder_exists(self, folder_name: str) -> bool:
+        """Check whether a folder exists in the backend."""
+        return self.backend.folder_exists(folder_name)
+
+    def listing_state(self, folder_name: str) -> Tuple[Tuple[int, int], Dict[str, Tuple[int, float]]]:
+        """Return (generation, {file: (size, mtime)}) of a folder, reusing the cache while it is fresh."""
+        generation = self._folder_generation(folder_name)
+        cached = self._listing_cache.get(folder_name)
+        if cached and cached[0] == generation:
+            return cached
+
+        if self.snapshot:
+            # A catalog snapshot taken at this very generation avoids the directory scan
+            entries = self.snapshot.entries_for(folder_name, generation)
+            if entries is not None:
+                self._listing_cache[folder_name] = (generation, entries)
+                return generation, entries
+
+        entries = {name: (stat.size, stat.mtime) for name, stat in self.backend.list(folder_name).items()}
+        if self.cold_tier:
+            # Archived files are listed from the cold index without touching their packs
+            for filename, meta in self.cold_tier.entries(folder_name).items():
+                entries.setdefault(filename, meta)
+        self._listing_cache[folder_name] = (generation, entries)
+        return generation, entries
+
+    def cached_listing_state(self, folder_name: str) -> Optional[Tuple[Tuple[int, int], Dict[str, Tuple[int, float]]]]:
+        """Return the cached (generation, entries) of a folder, fresh or not, without scanning."""
+        return self._listing_cache.get(folder_name)
+
+    def file_entries(self, folder_name: str) -> Dict[str, Tuple[int, float]]:
+        """Map each file in a folder to (size, mtime), reusing the cache while it is fresh."""
+        return self.listing_state(folder_name)[1]
+
+    def apply_external_changes(self, folder_name: str,
+                               changes: Optional[Dict[str, Optional[Tuple[int, float]]]]) -> None:
+        """Fold changes made outside the bot into the cached listing and inform listeners.
+
+        changes maps filenames to their new (size, mtime), or None for removed
+        files; changes=None means the whole folder was removed. A fresh cached
+        listing is patched in place instead of being rescanned.
+        """
+        if changes is None:
+            self._listing_cache.pop(folder_name, None)
+            self._usage_cache.pop(folder_name, None)
+            self._notify(FOLDER_DELETED, folder_name)
+            return
+
+        # Files moved to the cold tier are still present
+        changes = {filename: meta for filename, meta in changes.items()
+                   if meta is not None or not (self.cold_tier and self.cold_tier.contains(folder_name, filename))}
+        cached = self._listing_cache.get(folder_name)
+        if cached:
+            entries = dict(cached[1])
+            for filename, meta in changes.items():
+                if meta is None:
+                    entries.pop(filename, None)
+                else:
+                    entries[filename] = meta
+            try:
+                self._listing_cache[folder_name] = (self._folder_generation(folder_name), entries)
+            except FileNotFoundError:
+                self._listing_cache.pop(folder_name, None)
+
+        for filename, meta in changes.items():
+            self._notify(FILE_DELETED if meta is None else FILE_SAVED, folder_name, filename)
+
+    def _cached_listing(self, folder_name: str) -> List[str]:
+        """List files in a folder, reusing the cached listing while it is fresh."""
+        return list(self.file_entries(folder_name))
+
+    def folder_usage(self, folder_name: str) -> int:
+        """Return the bytes used by a folder, recomputed only when it changed."""
+        generation = self._folder_generation(folder_name)
+        cached = self._usage_cache.get(folder_name)
+        if cached and cached[0] == generation:
+            return cached[1]
+        usage = sum(size for size, _ in self.file_entries(folder_name).values())
+        self._usage_cache[folder_name] = (generation, usage)
+        return usage
+
+    def total_usage(self) -> Dict[str, int]:
+        """Return bytes used per folder."""
+        return {folder: self.folder_usage(folder) for folder in self.list_folders()}
+
+    def _check_quota(self, folder_name: str, filename: str, size: int) -> None:
+        """Raise QuotaExceededError if writing size bytes would exceed a quota."""
+        if not self.folder_quota_bytes and not self.global_quota_bytes:
+            return
+        existing = self.file_entries(folder_name).get(filename, (0, 0.0))[0]
+        growth = size - existing
+        if growth <= 0:
+            return
+        if self.folder_quota_bytes and self.folder_usage(folder_name) + growth > self.folder_quota_bytes:
+            raise QuotaExceededError(
+                f"Folder '{folder_name}' quota of {self.folder_quota_bytes / (1024*1024):.1f}MB exceeded"
+            )
+        if self.global_quota_bytes and sum(self.total_usage().values()) + growth > self.global_quota_bytes:
+            raise QuotaExceededError(
+                f"Storage quota of {self.global_quota_bytes / (1024*1024):.1f}MB exceeded"
+            )
+
     def _calculate_similarity(self, str1: str, str2: str) -> float:
         """Calculate similarity ratio between two strings."""
         return SequenceMatcher(None, str1.lower(), str2.lower()).ratio()
@@ -41,8 +273,57 @@ class StorageManager:
         return [f for f, _ in similarities[:max_results] if _ > 0.3]  # Minimum similarity threshold
 
     def search_files(self, query: str, folder_name: Optional[str] = None, 
-                    page: int = 1, per_page: int = 5) -> Dict[str, any]:
-        """Search for files across all folders or in a specific folder."""
+                    page: int = 1, per_page: int = 5, include_similar: bool = True,
+                    record_history: bool = True, view=None) -> Dict[str, any]:
+        """Search for files across all folders or in a specific folder.
+
+        With an acl.AccessView, folders and files the user may not read are
+        skipped while the listings are scanned. A query that matches nothing is retried with its misspelled words
+        corrected; 'corrected_query' in the result is then the query used.
+        Callers running the search off the event loop pass record_history=False
+        and call record_search() on the loop afterwards.
+        """
+        search_results = self._search_files(query, folder_name, page, per_page, view)
+        search_results['corrected_query'] = None
+        corrected = self.speller.correct(query) if self.speller and not search_results['total_count'] else query
+        if corrected != query:
+            retry = self._search_files(corrected, folder_name, page, per_page, view)
+            logger.debug(f"Corrected query '{query}' to '{corrected}': {retry['total_count']} matches")
+            if retry['total_count']:
+                search_results = retry
+                search_results['corrected_query'] = corrected
+
+        # Similar files are suggested for whichever query produced the results
+        if include_similar:
+            search_results['similar_files'] = self._similar_files(
+                search_results['corrected_query'] or query, folder_name, view)
+
+        if record_history:
+            self.record_search(query, search_results['results'], search_results['similar_files'])
+        return search_results
+
+    def _similar_files(self, query: str, folder_name: Optional[str], view=None) -> List:
+        """Find readable files resembling a query among those that do not contain it."""
+        similar_files = []
+        if folder_name:
+            if self.folder_exists(folder_name) and (view is None or view.can_read_folder(folder_name)):
+                hidden = view.hidden_in(folder_name) if view else ()
+                files = [f for f in self._cached_listing(folder_name)
+                         if f not in hidden and query.lower() not in f.lower()]
+                similar_files = self._find_similar_files(query, files)
+            return similar_files
+
+        for folder in self.list_folders():
+            if view is not None and not view.can_read_folder(folder):
+                continue
+            hidden = view.hidden_in(folder) if view else ()
+            files = [f for f in self.file_entries(folder) if f not in hidden and query.lower() not in f.lower()]
+            similar_files.extend((folder, f) for f in self._find_similar_files(query, files))
+        return similar_files
+
+    def _search_files(self, query: str, folder_name: Optional[str], page: int, per_page: int,
+                      view=None) -> Dict[str, any]:
+        """Run one substring search without similar files; see search_files."""
         logger.debug(f"Searching for '{query}' in {folder_name or 'all folders'}")
         results = []
         total_count = 0
@@ -51,10 +332,9 @@ class StorageManager:
         try:
             if folder_name:
                 # Search in specific folder
-                folder_path = self._get_folder_path(folder_name)
-                if os.path.exists(folder_path):
-                    files = [f for f in os.listdir(folder_path) 
-                            if os.path.isfile(os.path.join(folder_path, f))]
+                if self.folder_exists(folder_name) and (view is None or view.can_read_folder(folder_name)):
+                    hidden = view.hidden_in(folder_name) if view else ()
+                    files = [f for f in self._cached_listing(folder_name) if f not in hidden]
 
                     # Find exact and partial matches
                     matches = [f for f in files if query.lower() in f.lower()]
@@ -63,39 +343,38 @@ class StorageManager:
                     # Paginate results
                     start_idx = (page - 1) * per_page
                     end_idx = start_idx + per_page
-                    results = matches[start_idx:end_idx]
-
-                    # Find similar files
-                    similar_files = self._find_similar_files(query, 
-                                                           [f for f in files if f not in matches])
+                    if self.ranker:
+                        entries = self.file_entries(folder_name)
+                        candidates = ((folder_name, f, entries[f][1]) for f in matches if f in entries)
+                        # Later pages reuse the scores of the first, so none repeat or skip a file
+                        order_key = (query.lower(), folder_name, view.key if view else None)
+                        results = [f for _, f, _ in self.ranker.page(query, candidates, page, per_page, order_key)]
+                    else:
+                        results = matches[start_idx:end_idx]
             else:
                 # Search across all folders
                 all_matches = []
-                for folder in os.listdir(self.base_path):
-                    folder_path = os.path.join(self.base_path, folder)
-                    if os.path.isdir(folder_path):
-                        files = [f for f in os.listdir(folder_path) 
-                                if os.path.isfile(os.path.join(folder_path, f))]
-                        matches = [(folder, f) for f in files if query.lower() in f.lower()]
-                        all_matches.extend(matches)
-
-                        # Find similar files in each folder
-                        similar = self._find_similar_files(query, 
-                                                         [f for f in files if (folder, f) not in matches])
-                        similar_files.extend([(folder, f) for f in similar])
+                candidates = []
+                for folder in self.list_folders():
+                    if view is not None and not view.can_read_folder(folder):
+                        continue
+                    hidden = view.hidden_in(folder) if view else ()
+                    entries = self.file_entries(folder)
+                    files = [f for f in entries if f not in hidden]
+                    matches = [(folder, f) for f in files if query.lower() in f.lower()]
+                    all_matches.extend(matches)
+                    candidates.extend((folder, f, entries[f][1]) for _, f in matches)
 
                 total_count = len(all_matches)
                 # Paginate results
                 start_idx = (page - 1) * per_page
                 end_idx = start_idx + per_page
-                results = all_matches[start_idx:end_idx]
-
-            # Update search history for recommendations
-            self.search_history[query] = {
-                'timestamp': os.times(),
-                'results': results,
-                'similar': similar_files
-            }
+                if self.ranker:
+                    order_key = (query.lower(), None, view.key if view else None)
+                    results = [(folder, f) for folder, f, _ in
+                               self.ranker.page(query, candidates, page, per_page, order_key)]
+                else:
+                    results = all_matches[start_idx:end_idx]
 
             return {
                 'results': results,
@@ -110,32 +389,42 @@ class StorageManager:
             logger.error(f"Error searching files: {str(e)}", exc_info=True)
             raise
 
-    def get_file_path(self, folder_name: str, filename: str) -> str:
-        """Get the full path of a file, supporting partial matches."""
-        folder_path = self._get_folder_path(folder_name)
+    def record_search(self, query: str, results: List, similar_files: List) -> None:
+        """Update search history for recommendations, keeping only the newest entries."""
+        self.search_history.pop(query, None)
+        self.search_history[query] = {
+            'timestamp': os.times(),
+            'results': results,
+            'similar': similar_files
+        }
+        while len(self.search_history) > self.max_search_history:
+            self.search_history.pop(next(iter(self.search_history)))
+
+    def resolve_filename(self, folder_name: str, filename: str) -> str:
+        """Resolve a possibly partial filename to the name of exactly one stored file."""
+        folder_path = self.folder_path(folder_name)
         logger.debug(f"Searching for file '{filename}' in folder: {folder_path}")
 
-        if not os.path.exists(folder_path):
+        if not self.folder_exists(folder_name):
             logger.error(f"Folder does not exist: {folder_path}")
             raise FileNotFoundError(f"Folder '{folder_name}' does not exist")
 
         try:
-            # List all files in the folder
-            files = os.listdir(folder_path)
+            # List all files in the folder (in-progress dotfiles are excluded)
+            files = self._cached_listing(folder_name)
             logger.debug(f"Found {len(files)} files in folder")
 
             # First try exact match (with and without extension)
             if filename in files:
-                file_path = os.path.join(folder_path, filename)
-                logger.debug(f"Found exact match: {file_path}")
-                return file_path
+                logger.debug(f"Found exact match: {filename}")
+                return filename
 
-            # If no exact match, try partial match (case-insensitive)
+            # If no exact match, try partial match (case-insensitive); the
+            # listing holds only regular files, including archived ones
             filename_lower = filename.lower()
             matching_files = [
                 f for f in files 
-                if (filename_lower in os.path.splitext(f.lower())[0]) and  # Match base name
-                os.path.isfile(os.path.join(folder_path, f))
+                if filename_lower in os.path.splitext(f.lower())[0]  # Match base name
             ]
 
             if not matching_files:
@@ -147,10 +436,8 @@ class StorageManager:
                 matches_str = "\n".join(f"- {f}" for f in matching_files)
                 raise ValueError(f"Multiple matching files found:\n{matches_str}\nPlease be more specific.")
 
-            matched_file = matching_files[0]
-            file_path = os.path.join(folder_path, matched_file)
-            logger.debug(f"Found matching file: {file_path}")
-            return file_path
+            logger.debug(f"Found matching file: {matching_files[0]}")
+            return matching_files[0]
 
         except Exception as e:
             if isinstance(e, (FileNotFoundError, ValueError)):
@@ -158,75 +445,327 @@ class StorageManager:
             logger.error(f"Error accessing files in {folder_path}: {str(e)}", exc_info=True)
             raise Exception(f"Error accessing files: {str(e)}")
 
+    def get_file_path(self, folder_name: str, filename: str) -> str:
+        """Get the full path of a file, supporting partial matches.
+
+        Files in the cold tier are restored first, and files of a remote
+        backend are fetched into the local cache (blocking; call off the event loop).
+        """
+        resolved = self.resolve_filename(folder_name, filename)
+        if not self.is_local:
+            return self._fetch_remote(folder_name, resolved)
+        file_path = os.path.join(self.folder_path(folder_name), resolved)
+        if self.cold_tier and not os.path.exists(file_path) and self.cold_tier.contains(folder_name, resolved):
+            return self.cold_tier.restore(folder_name, resolved)
+        return file_path
+
+    def _remote_cache_path(self, folder_name: str, filename: str) -> str:
+        """Get the local cache path of a file held by a remote backend."""
+        return os.path.join(self.base_path, REMOTE_CACHE_DIR, folder_name, filename)
+
+    def _fetch_remote(self, folder_name: str, filename: str) -> str:
+        """Return a local copy of a remote file, downloading it unless the cached copy is current.
+
+        Cached copies carry the backend's mtime, so a size or mtime change
+        means the file was replaced; the access time orders cache eviction.
+        """
+        size, mtime = self.file_entries(folder_name)[filename]
+        mtime_ns = int(mtime * 1e9)
+        cache_path = self._remote_cache_path(folder_name, filename)
+        try:
+            stat = os.stat(cache_path)
+            if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+                os.utime(cache_path, ns=(time.time_ns(), mtime_ns))
+                return cache_path
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temp_path = os.path.join(os.path.dirname(cache_path), f".{filename}{TEMP_SUFFIX}-{uuid.uuid4().hex}")
+        try:
+            with self.backend.open_stream(folder_name, filename) as source, open(temp_path, 'wb') as f:
+                shutil.copyfileobj(source, f, 1024 * 1024)
+            os.utime(temp_path, ns=(time.time_ns(), mtime_ns))
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        logger.debug(f"Fetched {folder_name}/{filename} into the local cache")
+        return cache_path
+
+    def _drop_remote_copy(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Remove cached local copies of a remote file, or of a whole folder."""
+        if self.is_local:
+            return
+        if filename is None:
+            shutil.rmtree(os.path.join(self.base_path, REMOTE_CACHE_DIR, folder_name), ignore_errors=True)
+            return
+        try:
+            os.remove(self._remote_cache_path(folder_name, filename))
+        except FileNotFoundError:
+            pass
+
+    def trim_remote_cache(self, max_bytes: int) -> int:
+        """Evict the least recently used local copies of remote files beyond max_bytes; returns bytes freed."""
+        cached = []
+        for root, _, names in os.walk(os.path.join(self.base_path, REMOTE_CACHE_DIR)):
+            for name in names:
+                if name.startswith('.'):
+                    continue  # Downloads in progress
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                cached.append((stat.st_atime, stat.st_size, path))
+        excess = sum(size for _, size, _ in cached) - max_bytes
+        freed = 0
+        for _, size, path in sorted(cached):
+            if freed >= excess:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def open_file(self, folder_name: str, filename: str):
+        """Open a stored file for streaming reads (blocking); supports partial names."""
+        resolved = self.resolve_filename(folder_name, filename)
+        if self.is_local:
+            return open(self.get_file_path(folder_name, resolved), 'rb')
+        return self.backend.open_stream(folder_name, resolved)
+
     def create_folder(self, folder_name: str) -> None:
         """Create a new folder."""
-        folder_path = self._get_folder_path(folder_name)
+        folder_path = self.folder_path(folder_name)
         try:
-            os.makedirs(folder_path, exist_ok=True)
+            self.backend.create_folder(folder_name)
             logger.info(f"Created/verified folder: {folder_path}")
         except Exception as e:
             logger.error(f"Failed to create folder {folder_path}: {str(e)}", exc_info=True)
             raise
 
-    def save_file(self, folder_name: str, filename: str, content: bytes) -> None:
-        """Save a file to a folder."""
-        folder_path = self._get_folder_path(folder_name)
+    def _write_file(self, folder_name: str, filename: str, content: bytes) -> str:
+        """Atomically write a file; the backend makes the new content visible all at once."""
+        return self._write_stream(folder_name, filename, io.BytesIO(content), len(content))
+
+    def _write_stream(self, folder_name: str, filename: str, stream: BinaryIO, size: int) -> str:
+        """Store size bytes read from stream as a file, creating the folder if needed."""
+        folder_path = self.folder_path(folder_name)
         logger.debug(f"Attempting to save file {filename} to folder: {folder_path}")
 
-        if not os.path.exists(folder_path):
+        if not self.folder_exists(folder_name):
             logger.error(f"Folder does not exist: {folder_path}")
             try:
-                os.makedirs(folder_path, exist_ok=True)
+                self.backend.create_folder(folder_name)
                 logger.info(f"Created missing folder: {folder_path}")
             except Exception as e:
                 logger.error(f"Failed to create folder: {str(e)}", exc_info=True)
                 raise Exception(f"Failed to create folder: {str(e)}")
 
+        self._check_quota(folder_name, filename, size)
+
         file_path = os.path.join(folder_path, filename)
         try:
-            with open(file_path, 'wb') as f:
-                f.write(content)
+            self.backend.put_stream(folder_name, filename, stream)
+            with self.folder_lock(folder_name):
+                self._drop_remote_copy(folder_name, filename)
+                self.invalidate_folder(folder_name)
             logger.info(f"Successfully saved file: {file_path}")
+            return file_path
         except Exception as e:
             logger.error(f"Failed to save file {file_path}: {str(e)}", exc_info=True)
             raise
 
-    def list_files(self, folder_name: str) -> List[str]:
-        """List all files in a folder."""
-        folder_path = self._get_folder_path(folder_name)
-        if not os.path.exists(folder_path):
+    def save_file(self, folder_name: str, filename: str, content: bytes) -> None:
+        """Save a file to a folder."""
+        self._write_file(folder_name, filename, content)
+        self._notify(FILE_SAVED, folder_name, filename)
+
+    async def save_file_async(self, folder_name: str, filename: str, content: bytes) -> None:
+        """Save a file without blocking the event loop.
+
+        Concurrent writers of the same file are serialized, and the folder cannot
+        be deleted mid-write. Readers never wait: the rename makes the new
+        content visible all at once.
+        """
+        async with self.locks.read_folder(folder_name), self.locks.write_file(folder_name, filename):
+            await asyncio.to_thread(self._write_file, folder_name, filename, content)
+        self._notify(FILE_SAVED, folder_name, filename)
+
+    def _ingest_file(self, folder_name: str, filename: str, source_path: str, move: bool = False) -> str:
+        """Place an existing file into a folder without reading it into memory.
+
+        The source is hardlinked (or renamed when move is set) to a hidden temp
+        name and then renamed into place. Across filesystems, or where
+        hardlinks are not permitted, the kernel copies it instead. Remote
+        backends stream the file up instead.
+        """
+        if not self.is_local:
+            with open(source_path, 'rb') as source:
+                file_path = self._write_stream(folder_name, filename, source, os.path.getsize(source_path))
+            if move:
+                os.remove(source_path)
+            return file_path
+
+        folder_path = self.folder_path(folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+        self._check_quota(folder_name, filename, os.path.getsize(source_path))
+
+        file_path = os.path.join(folder_path, filename)
+        temp_path = os.path.join(folder_path, f".{filename}{TEMP_SUFFIX}-{uuid.uuid4().hex}")
+        try:
+            if move:
+                try:
+                    os.rename(source_path, temp_path)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.move(source_path, temp_path)
+            else:
+                try:
+                    os.link(source_path, temp_path)
+                except OSError as e:
+                    logger.debug(f"Hardlinking {source_path} failed, copying instead: {str(e)}")
+                    shutil.copyfile(source_path, temp_path)
+            with self.folder_lock(folder_name):
+                os.replace(temp_path, file_path)
+                self.invalidate_folder(folder_name)
+            logger.info(f"Ingested {source_path} as {file_path}")
+            return file_path
+        except Exception as e:
+            logger.error(f"Failed to ingest {source_path} into {file_path}: {str(e)}", exc_info=True)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    async def ingest_file_async(self, folder_name: str, filename: str, source_path: str, move: bool = False) -> None:
+        """Store a file that already exists on disk, with the same locking as save_file_async."""
+        async with self.locks.read_folder(folder_name), self.locks.write_file(folder_name, filename):
+            await asyncio.to_thread(self._ingest_file, folder_name, filename, source_path, move)
+        self._notify(FILE_SAVED, folder_name, filename)
+
+    def register_files(self, folder_name: str, filenames: List[str]) -> None:
+        """Register files placed in a folder out of band (e.g. bulk import) in one batch."""
+        with self.folder_lock(folder_name):
+            self.invalidate_folder(folder_name)
+        logger.info(f"Registered {len(filenames)} imported files in folder: {folder_name}")
+        for filename in filenames:
+            self._notify(FILE_SAVED, folder_name, filename)
+
+    def list_files(self, folder_name: str, view=None) -> List[str]:
+        """List all files in a folder, leaving out locked files an acl.AccessView may not read."""
+        folder_path = self.folder_path(folder_name)
+        if not self.folder_exists(folder_name):
             logger.error(f"Folder does not exist: {folder_path}")
             raise FileNotFoundError(f"Folder '{folder_name}' does not exist")
 
         try:
-            files = [f for f in os.listdir(folder_path) 
-                    if os.path.isfile(os.path.join(folder_path, f))]
+            if view is not None and not view.can_read_folder(folder_name):
+                files = []
+            else:
+                hidden = view.hidden_in(folder_name) if view else ()
+                files = [f for f in self.file_entries(folder_name) if f not in hidden]
             logger.debug(f"Listed {len(files)} files in folder: {folder_path}")
             return files
         except Exception as e:
             logger.error(f"Error listing files in {folder_path}: {str(e)}", exc_info=True)
             raise
 
-    def delete_file(self, folder_name: str, filename: str) -> None:
-        """Delete a file from a folder."""
-        file_path = self.get_file_path(folder_name, filename)
+    def _remove_file(self, folder_name: str, filename: str) -> str:
+        """Remove a file and return the name of the file actually removed."""
+        file_path = os.path.join(self.folder_path(folder_name), self.resolve_filename(folder_name, filename))
         try:
-            os.remove(file_path)
+            with self.folder_lock(folder_name):
+                # Archived files only need their cold index entry dropped
+                archived = self.cold_tier is not None and self.cold_tier.forget(folder_name, os.path.basename(file_path))
+                if not self.is_local:
+                    self.backend.delete(folder_name, os.path.basename(file_path))
+                    self._drop_remote_copy(folder_name, os.path.basename(file_path))
+                elif not archived or os.path.exists(file_path):
+                    os.remove(file_path)
+                self.invalidate_folder(folder_name)
             logger.info(f"Successfully deleted file: {file_path}")
+            return os.path.basename(file_path)
         except Exception as e:
             logger.error(f"Failed to delete file {file_path}: {str(e)}", exc_info=True)
             raise
 
-    def delete_folder(self, folder_name: str) -> None:
-        """Delete a folder and all its contents."""
-        folder_path = self._get_folder_path(folder_name)
-        if not os.path.exists(folder_path):
+    def delete_file(self, folder_name: str, filename: str) -> None:
+        """Delete a file from a folder."""
+        removed = self._remove_file(folder_name, filename)
+        self._notify(FILE_DELETED, folder_name, removed)
+
+    async def delete_file_async(self, folder_name: str, filename: str) -> None:
+        """Delete a file, waiting for in-flight writes of the same file."""
+        # Resolve partial names first so the lock covers the real file
+        resolved = self.resolve_filename(folder_name, filename)
+        async with self.locks.read_folder(folder_name), self.locks.write_file(folder_name, resolved):
+            removed = await asyncio.to_thread(self._remove_file, folder_name, resolved)
+        self._notify(FILE_DELETED, folder_name, removed)
+
+    def _tombstone_folder(self, folder_name: str) -> Optional[str]:
+        """Atomically move a folder into the trash and return its trash path.
+
+        Remote backends have no rename for folders, so their folders are
+        deleted in place and None is returned.
+        """
+        folder_path = self.folder_path(folder_name)
+        if not self.folder_exists(folder_name):
             logger.error(f"Folder does not exist: {folder_path}")
             raise FileNotFoundError(f"Folder '{folder_name}' does not exist")
-
+        if not self.is_local:
+            with self.folder_lock(folder_name):
+                self.backend.delete_folder(folder_name)
+                self._drop_remote_copy(folder_name)
+                self.invalidate_folder(folder_name)
+            logger.info(f"Deleted folder {folder_name} from {type(self.backend).__name__}")
+            return None
+
+        trash_dir = os.path.join(self.base_path, TRASH_DIR)
+        os.makedirs(trash_dir, exist_ok=True)
+        trash_path = os.path.join(trash_dir, f"{folder_name}-{time.time_ns()}")
         try:
-            shutil.rmtree(folder_path)
-            logger.info(f"Successfully deleted folder: {folder_path}")
+            with self.folder_lock(folder_name):
+                os.rename(folder_path, trash_path)
+                self.invalidate_folder(folder_name)
+            logger.info(f"Tombstoned folder {folder_path} -> {trash_path}")
+            return trash_path
         except Exception as e:
             logger.error(f"Failed to delete folder {folder_path}: {str(e)}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
+
+    def _remove_in_background(self, path: Optional[str]) -> None:
+        """Remove a tombstoned tree on a background thread."""
+        if path is None:
+            return
+        def remove() -> None:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Removed tombstoned folder: {path}")
+        threading.Thread(target=remove, name="storage-trash", daemon=True).start()
+
+    def purge_trash(self) -> int:
+        """Remove tombstoned folders left behind (e.g. by a restart); returns how many."""
+        trash_dir = os.path.join(self.base_path, TRASH_DIR)
+        if not os.path.isdir(trash_dir):
+            return 0
+        entries = os.listdir(trash_dir)
+        for entry in entries:
+            shutil.rmtree(os.path.join(trash_dir, entry), ignore_errors=True)
+        return len(entries)
+
+    def delete_folder(self, folder_name: str) -> None:
+        """Delete a folder and all its contents."""
+        trash_path = self._tombstone_folder(folder_name)
+        self._notify(FOLDER_DELETED, folder_name)
+        self._remove_in_background(trash_path)
+
+    async def delete_folder_async(self, folder_name: str) -> None:
+        """Delete a folder once in-flight writes to it have finished."""
+        async with self.locks.write_folder(folder_name):
+            trash_path = await asyncio.to_thread(self._tombstone_folder, folder_name)
+        self._notify(FOLDER_DELETED, folder_name)
+        self._remove_in_background(trash_path)
@@ -0,0 +1,230 @@
+import errno
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from storage_manager import TEMP_SUFFIX, StorageManager
+
+try:
+    import fcntl
+except ImportError:  # Non-POSIX platforms fall back to hardlinks and copies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_DIR = ".snapshots"
+# Linux FICLONE ioctl: share the data blocks of a file on reflink-capable filesystems
+FICLONE = 0x40049409
+
+# filename -> [size, mtime, object name or None for files only in the cold tier]
+FolderManifest = Dict[str, list]
+
+def _clone_file(source: str, target: str) -> None:
+    """Make target a copy-on-write clone of source, or a plain copy where that is unsupported."""
+    if fcntl is not None:
+        try:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(source, target)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, target)
+
+def _link_file(source: str, target: str) -> None:
+    """Hardlink source to target, falling back to a reflink or copy across devices."""
+    try:
+        os.link(source, target)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+            raise
+        _clone_file(source, target)
+
+class SnapshotStore:
+    """Point-in-time snapshots of the storage tree built from hardlinks.
+
+    Every file version is kept once under .snapshots/objects as a hardlink
+    (or reflink/copy across devices) named after its inode and mtime; storage
+    only ever replaces files atomically, so a linked inode never changes.
+    A snapshot is a JSON manifest mapping each folder's files to objects.
+    Folders whose listing generation did not change reuse the previous
+    manifest wholesale and unchanged files reuse their object, so a snapshot
+    costs filesystem work only for what changed. Restoring a folder or file
+    links back only the files that differ from the live tree.
+
+    Files that sit in the cold tier when first snapshotted have no object;
+    they are restored only while the cold tier still holds them.
+    """
+
+    def __init__(self, storage: StorageManager, keep_last: int = 24, keep_daily: int = 14):
+        self.storage = storage
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self.root = os.path.join(storage.base_path, SNAPSHOTS_DIR)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.manifests_dir = os.path.join(self.root, "manifests")
+        self._lock = threading.Lock()
+        # Last manifest written: (folder generations, folder manifests)
+        self._previous: Optional[Tuple[Dict[str, list], Dict[str, FolderManifest]]] = None
+        self.last_summary: Dict[str, int] = {}
+
+    def _manifest_path(self, snapshot_id: str) -> str:
+        return os.path.join(self.manifests_dir, f"{snapshot_id}.json")
+
+    def ids(self) -> List[str]:
+        """Return snapshot ids, oldest first."""
+        try:
+            names = os.listdir(self.manifests_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def load(self, snapshot_id: str) -> dict:
+        """Read a snapshot manifest; raises FileNotFoundError for unknown ids."""
+        if os.sep in snapshot_id or snapshot_id.startswith('.'):
+            raise FileNotFoundError(f"Snapshot '{snapshot_id}' does not exist")
+        try:
+            with open(self._manifest_path(snapshot_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Snapshot '{snapshot_id}' does not exist")
+
+    def _previous_state(self) -> Tuple[Dict[str, list], Dict[str, FolderManifest]]:
+        """Return the generations and folders of the newest snapshot (caller holds _lock)."""
+        if self._previous is None:
+            snapshots = self.ids()
+            manifest = self.load(snapshots[-1]) if snapshots else {}
+            self._previous = (manifest.get('generations', {}), manifest.get('folders', {}))
+        return self._previous
+
+    def _store_object(self, folder_name: str, filename: str) -> Optional[str]:
+        """Link a live file into the object store; returns its object name, or None if it is not on disk."""
+        path = os.path.join(self.storage.folder_path(folder_name), filename)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None  # Archived in the cold tier, or deleted since the listing was read
+        name = f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        target = os.path.join(self.objects_dir, name[:2], name)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _link_file(path, target)
+        return name
+
+    def create(self) -> Dict[str, int]:
+        """Take a snapshot of every folder (blocking); returns counts of files and new objects."""
+        with self._lock:
+            previous_generations, previous_folders = self._previous_state()
+            generations: Dict[str, list] = {}
+            folders: Dict[str, FolderManifest] = {}
+            linked = reused = 0
+            for folder_name in self.storage.list_folders():
+                try:
+                    generation, entries = self.storage.listing_state(folder_name)
+                except FileNotFoundError:
+                    continue
+                generations[folder_name] = list(generation)
+                before = previous_folders.get(folder_name, {})
+                if previous_generations.get(folder_name) == list(generation):
+                    folders[folder_name] = before
+                    reused += len(before)
+                    continue
+                manifest = {}
+                for filename, (size, mtime) in entries.items():
+                    old = before.get(filename)
+                    if old and old[0] == size and old[1] == mtime and old[2]:
+                        manifest[filename] = old
+                        reused += 1
+                        continue
+                    manifest[filename] = [size, mtime, self._store_object(folder_name, filename)]
+                    linked += 1
+                folders[folder_name] = manifest
+
+            snapshot_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+            if snapshot_id in self.ids():
+                snapshot_id += f"-{uuid.uuid4().hex[:6]}"
+            os.makedirs(self.manifests_dir, exist_ok=True)
+            path = self._manifest_path(snapshot_id)
+            temp_path = f"{path}{TEMP_SUFFIX}-{uuid.uuid4().hex}"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'id': snapshot_id, 'created': time.time(),
+                           'generations': generations, 'folders': folders}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+            self._previous = (generations, folders)
+
+        self.last_summary = {'files': linked + reused, 'linked': linked, 'reused': reused}
+        logger.info(f"Snapshot {snapshot_id}: {linked} files linked, {reused} unchanged")
+        return dict(self.last_summary, id=snapshot_id)
+
+    def prune(self) -> int:
+        """Apply the retention policy and drop unreferenced objects (blocking); returns snapshots removed.
+
+        The newest keep_last snapshots are kept, plus the newest snapshot of
+        each of the last keep_daily days.
+        """
+        with self._lock:
+            snapshots = self.ids()
+            keep = set(snapshots[-self.keep_last:]) if self.keep_last else set()
+            daily: Dict[str, str] = {}
+            for snapshot_id in snapshots:
+                daily[snapshot_id[:8]] = snapshot_id  # Ids start with YYYYMMDD; the newest of a day wins
+            keep.update(sorted(daily.values())[-self.keep_daily:] if self.keep_daily else [])
+            removed = [snapshot_id for snapshot_id in snapshots if snapshot_id not in keep]
+            if not removed:
+                return 0
+            for snapshot_id in removed:
+                os.remove(self._manifest_path(snapshot_id))
+
+            referenced = set()
+            for snapshot_id in keep:
+                for manifest in self.load(snapshot_id)['folders'].values():
+                    referenced.update(entry[2] for entry in manifest.values() if entry[2])
+            dropped = 0
+            for root, _, names in os.walk(self.objects_dir):
+                for name in names:
+                    if name not in referenced:
+                        os.remove(os.path.join(root, name))
+                        dropped += 1
+            self._previous = None
+        logger.info(f"Pruned {len(removed)} snapshots and {dropped} unreferenced objects")
+        return len(removed)
+
+    def restore(self, snapshot_id: str, folder_name: str, filename: Optional[str] = None) -> List[str]:
+        """Bring a folder, or one file, back to its state in a snapshot (blocking).
+
+        Only files missing from the live folder or different from the
+        snapshot are linked back; files added since are kept. Returns the
+        restored filenames; the caller registers them with storage.
+        """
+        manifest = self.load(snapshot_id)['folders'].get(folder_name)
+        if manifest is None:
+            raise FileNotFoundError(f"Folder '{folder_name}' is not in snapshot {snapshot_id}")
+        if filename is not None:
+            if filename not in manifest:
+                raise FileNotFoundError(f"File '{filename}' is not in snapshot {snapshot_id}")
+            manifest = {filename: manifest[filename]}
+
+        folder_path = self.storage.folder_path(folder_name)
+        os.makedirs(folder_path, exist_ok=True)
+        restored = []
+        with self.storage.folder_lock(folder_name):
+            current = self.storage.file_entries(folder_name)
+            for name, (size, mtime, obj) in manifest.items():
+                if current.get(name) == (size, mtime):
+                    continue
+                if not obj:
+                    logger.warning(f"Cannot restore {folder_name}/{name}: it was only in the cold tier")
+                    continue
+                temp_path = os.path.join(folder_path, f".{name}{TEMP_SUFFIX}-{uuid.uuid4().hex}")
+                _link_file(os.path.join(self.objects_dir, obj[:2], obj), temp_path)
+                os.replace(temp_path, os.path.join(folder_path, name))
+                restored.append(name)
+        logger.info(f"Restored {len(restored)} files of '{folder_name}' from snapshot {snapshot_id}")
+        return restored
@@ -0,0 +1,298 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from storage_manager import FILE_SAVED, FOLDER_DELETED, StorageManager
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+FOLDER_MASK = IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+BASE_MASK = IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+def _load_inotify():
+    """Return libc if it provides inotify (Linux), otherwise None."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+# (size, mtime) of a file as seen by the watcher
+FileMeta = Tuple[int, float]
+
+class StorageWatcher:
+    """Detect files added, replaced or removed under storage/ by other tools.
+
+    Events are debounced so an rsync burst becomes one batch per folder. Each
+    batch is diffed against the watcher's own snapshot of the tree, which also
+    follows the bot's own mutations through storage events, so only genuinely
+    external changes are pushed into StorageManager. Without inotify the
+    watcher polls folder mtimes instead, which misses in-place rewrites that
+    leave the directory untouched.
+    """
+
+    def __init__(self, storage: StorageManager, debounce_seconds: float = 0.25,
+                 max_delay_seconds: float = 1.0, poll_interval: float = 1.0):
+        self.storage = storage
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.poll_interval = poll_interval
+        self._known: Dict[str, Dict[str, FileMeta]] = {}
+        self._lock = threading.Lock()
+        # folder -> changed names, or None when the whole folder must be rescanned
+        self._dirty: Dict[str, Optional[Set[str]]] = {}
+        self._folder_mtimes: Dict[str, int] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._libc = None
+        self._fd: Optional[int] = None
+        self._watches: Dict[int, Optional[str]] = {}  # watch descriptor -> folder (None = base)
+        self.batches_applied = 0
+
+    def _scan_folder(self, folder_name: str) -> Optional[Dict[str, FileMeta]]:
+        """Stat every user file in a folder; None if the folder is gone."""
+        entries = {}
+        try:
+            with os.scandir(self.storage.folder_path(folder_name)) as it:
+                for entry in it:
+                    if entry.name.startswith('.') or not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    entries[entry.name] = (stat.st_size, stat.st_mtime)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return entries
+
+    def _stat_file(self, folder_name: str, filename: str) -> Optional[FileMeta]:
+        """Return (size, mtime) of a file, or None if it does not exist."""
+        try:
+            stat = os.stat(os.path.join(self.storage.folder_path(folder_name), filename))
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime
+
+    def _is_archived(self, folder_name: str, filename: str) -> bool:
+        """Check whether a file vanished from disk only because it moved to the cold tier."""
+        cold_tier = self.storage.cold_tier
+        return cold_tier is not None and cold_tier.contains(folder_name, filename)
+
+    def _on_storage_event(self, event: str, folder_name: str, filename: Optional[str]) -> None:
+        """Record the bot's own mutations so their filesystem events are not reported again."""
+        with self._lock:
+            if event == FOLDER_DELETED:
+                self._known.pop(folder_name, None)
+            elif filename:
+                meta = self._stat_file(folder_name, filename) if event == FILE_SAVED else None
+                folder = self._known.setdefault(folder_name, {})
+                if meta is None:
+                    folder.pop(filename, None)
+                else:
+                    folder[filename] = meta
+
+    def _mark(self, folder_name: str, filename: Optional[str] = None) -> None:
+        """Queue a file (or a whole folder when filename is None) for the next batch."""
+        with self._lock:
+            if filename is None:
+                self._dirty[folder_name] = None
+            elif self._dirty.get(folder_name, set()) is not None:
+                self._dirty.setdefault(folder_name, set()).add(filename)
+
+    def _flush(self) -> None:
+        """Diff queued paths against the snapshot and push real changes to storage."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        for folder_name, names in dirty.items():
+            with self._lock:
+                known = self._known.get(folder_name)
+            if names is None:
+                current = self._scan_folder(folder_name)
+                if current is None:
+                    changes = None
+                else:
+                    names = set(current) | set(known or {})
+                    changes = {name: current.get(name) for name in names
+                               if current.get(name) != (known or {}).get(name)
+                               and not (name not in current and self._is_archived(folder_name, name))}
+            elif not os.path.isdir(self.storage.folder_path(folder_name)):
+                changes = None
+            else:
+                changes = {}
+                for name in names:
+                    meta = self._stat_file(folder_name, name)
+                    if meta != (known or {}).get(name) and not (meta is None and self._is_archived(folder_name, name)):
+                        changes[name] = meta
+
+            with self._lock:
+                if changes is None:
+                    if self._known.pop(folder_name, None) is None:
+                        continue  # Already gone from our view (e.g. the bot deleted it)
+                else:
+                    if not changes:
+                        continue
+                    folder = self._known.setdefault(folder_name, {})
+                    for name, meta in changes.items():
+                        if meta is None:
+                            folder.pop(name, None)
+                        else:
+                            folder[name] = meta
+            logger.info(f"External change in folder '{folder_name}': "
+                        f"{'folder removed' if changes is None else f'{len(changes)} files'}")
+            self._deliver(folder_name, changes)
+
+    def _deliver(self, folder_name: str, changes: Optional[Dict[str, Optional[FileMeta]]]) -> None:
+        """Apply a batch on the event loop, where storage listeners normally run."""
+        self.batches_applied += 1
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.storage.apply_external_changes, folder_name, changes)
+        else:
+            self.storage.apply_external_changes(folder_name, changes)
+
+    def _add_folder_watch(self, folder_name: str) -> None:
+        """Start watching one user folder."""
+        path = self.storage.folder_path(folder_name).encode()
+        wd = self._libc.inotify_add_watch(self._fd, path, FOLDER_MASK)
+        if wd < 0:
+            logger.warning(f"Failed to watch {folder_name}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._watches[wd] = folder_name
+
+    def _start_inotify(self) -> bool:
+        """Set up inotify watches on the base path and every folder."""
+        self._libc = _load_inotify()
+        if self._libc is None:
+            return False
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self._fd = fd
+        wd = self._libc.inotify_add_watch(fd, self.storage.base_path.encode(), BASE_MASK)
+        if wd < 0:
+            os.close(fd)
+            self._fd = None
+            return False
+        self._watches[wd] = None
+        for folder_name in self.storage.list_folders():
+            self._add_folder_watch(folder_name)
+        return True
+
+    def _read_events(self) -> None:
+        """Drain pending inotify events into the dirty set."""
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflowed; rescanning all folders")
+                for folder_name in set(self._watches.values()) - {None}:
+                    self._mark(folder_name)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            folder_name = self._watches.get(wd)
+            if not name or name.startswith('.'):
+                continue  # Internal directories, temp files and part files
+            if folder_name is None:
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add_folder_watch(name)
+                    self._mark(name)
+            elif not mask & IN_ISDIR:
+                self._mark(folder_name, name)
+
+    def _run_inotify(self) -> None:
+        """Watcher thread body for inotify mode."""
+        first_event = last_event = None
+        while not self._stop.is_set():
+            timeout = self.debounce_seconds if last_event else 0.5
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            now = time.monotonic()
+            if readable:
+                self._read_events()
+                if self._dirty:
+                    first_event = first_event or now
+                    last_event = now
+            if last_event and (now - last_event >= self.debounce_seconds
+                               or now - first_event >= self.max_delay_seconds):
+                first_event = last_event = None
+                self._flush()
+
+    def _run_polling(self) -> None:
+        """Watcher thread body for the polling fallback."""
+        while not self._stop.wait(self.poll_interval):
+            folders = set(self.storage.list_folders())
+            with self._lock:
+                folders |= set(self._known)
+            for folder_name in folders:
+                try:
+                    mtime = os.stat(self.storage.folder_path(folder_name)).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = None
+                if self._folder_mtimes.get(folder_name) != mtime:
+                    self._folder_mtimes[folder_name] = mtime
+                    self._mark(folder_name)
+            self._flush()
+
+    def _run(self, use_inotify: bool) -> None:
+        """Run the watcher loop, logging instead of dying on unexpected errors."""
+        try:
+            self._run_inotify() if use_inotify else self._run_polling()
+        except Exception as e:
+            logger.error(f"Storage watcher stopped: {str(e)}", exc_info=True)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """Snapshot the tree and start watching it on a background thread."""
+        if self._thread:
+            return
+        self._loop = loop
+        for folder_name in self.storage.list_folders():
+            # Seeded from storage's listings, which come from the catalog snapshot when fresh
+            self._known[folder_name] = dict(self.storage.file_entries(folder_name))
+            self._folder_mtimes[folder_name] = os.stat(self.storage.folder_path(folder_name)).st_mtime_ns
+        self.storage.add_listener(self._on_storage_event)
+
+        use_inotify = self._start_inotify()
+        logger.info(f"Watching {self.storage.base_path} using {'inotify' if use_inotify else 'polling'}")
+        self._thread = threading.Thread(target=self._run, args=(use_inotify,), name="storage-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the watcher thread and release inotify."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
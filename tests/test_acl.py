@@ -0,0 +1,105 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from acl import FULL, READ, AccessControl  # noqa: E402
+from storage_manager import StorageManager  # noqa: E402
+
+def _acl(tmp_path, **kwargs):
+    return AccessControl(str(tmp_path / "acl" / "rules.json"), **kwargs)
+
+def test_locked_folder_needs_a_read_grant(tmp_path):
+    acl = _acl(tmp_path, admin_ids=[1])
+    assert acl.view(2).can_read_folder("Mock")
+    assert acl.set_locked("Mock", True)
+    assert not acl.set_locked("Mock", True)
+    assert not acl.view(2).can_read_folder("Mock")
+    assert acl.view(2).can_read_folder("Notes")
+    assert acl.view(1).can_read_folder("Mock")
+
+    acl.grant("Mock", 2, READ)
+    assert acl.view(2).can_read_folder("Mock")
+    assert not acl.view(2).can_write_folder("Mock")
+    assert not acl.view(3).can_read_folder("Mock")
+
+def test_write_grant_on_open_folder(tmp_path):
+    acl = _acl(tmp_path)
+    acl.grant("Mock", 2, FULL)
+    view = acl.view(2)
+    assert view.writable and view.can_write_folder("Mock")
+    assert not view.can_write_folder("Notes")
+    assert acl.view(3).can_read_folder("Mock") and not acl.view(3).can_write_folder("Mock")
+
+    assert acl.revoke("Mock", 2)
+    assert not acl.revoke("Mock", 2)
+    assert not acl.view(2).can_write_folder("Mock")
+    # An unlocked folder without grants has no rule left
+    assert not acl.has_rules()
+
+def test_locked_file_is_hidden_from_others(tmp_path):
+    acl = _acl(tmp_path, admin_ids=[1])
+    acl.grant("Mock", 2, filename="secret.pdf")
+    assert acl.view(3).hidden_in("Mock") == {"secret.pdf"}
+    assert not acl.view(3).can_read("Mock", "secret.pdf")
+    assert acl.view(3).can_read("Mock", "public.pdf")
+    assert acl.view(2).can_read("Mock", "secret.pdf")
+    assert acl.view(1).can_read("Mock", "secret.pdf")
+
+    assert acl.set_locked("Mock", False, filename="secret.pdf")
+    assert acl.view(3).can_read("Mock", "secret.pdf")
+
+def test_views_are_rebuilt_when_rules_change(tmp_path):
+    acl = _acl(tmp_path)
+    before = acl.view(2)
+    assert acl.view(2) is before
+    # Users with the same permissions share a key, e.g. for cached results
+    assert acl.view(3).key == before.key
+    acl.set_locked("Mock", True)
+    after = acl.view(2)
+    assert after is not before and after.key != before.key
+
+def test_bootstrap_username_is_claimed_once(tmp_path):
+    acl = _acl(tmp_path, bootstrap_usernames=["@Boss"])
+    assert not acl.is_admin(5)
+    assert acl.is_admin(5, "boss")
+    # Only the first user seen with the name is promoted
+    assert not acl.is_admin(6, "Boss")
+    assert acl.admins() == (frozenset(), frozenset({5}))
+
+    assert acl.revoke_admin(5)
+    assert not acl.revoke_admin(5)
+    assert not acl.is_admin(5, "boss")
+    # The claim is stored, so a restart does not hand the name out again
+    assert not _acl(tmp_path, bootstrap_usernames=["boss"]).is_admin(7, "boss")
+
+def test_environment_admins_cannot_be_revoked(tmp_path):
+    acl = _acl(tmp_path, admin_ids=[1])
+    assert not acl.revoke_admin(1)
+    assert acl.is_admin(1)
+
+def test_rules_reload_when_another_process_writes_them(tmp_path):
+    first = _acl(tmp_path)
+    second = _acl(tmp_path)
+    assert first.view(2).can_read_folder("Mock")
+    second.set_locked("Mock", True)
+    # Coarse filesystem clocks can give two quick writes the same mtime
+    stat = os.stat(second.path)
+    os.utime(second.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert not first.view(2).can_read_folder("Mock")
+    assert first.is_locked("Mock")
+
+def test_rules_outlive_deleted_folders_and_files(tmp_path):
+    storage = StorageManager(str(tmp_path / "storage"))
+    storage.create_folder("Mock")
+    storage.save_file("Mock", "secret.pdf", b"a")
+    acl = _acl(tmp_path)
+    acl.set_locked("Mock", True, filename="secret.pdf")
+    acl.grant("Mock", 2, filename="secret.pdf")
+
+    storage.delete_folder("Mock")
+    storage.create_folder("Mock")
+    storage.save_file("Mock", "secret.pdf", b"b")
+    view = _acl(tmp_path).view(3)
+    assert storage.list_files("Mock", view) == []
+    assert storage.list_files("Mock", _acl(tmp_path).view(2)) == ["secret.pdf"]
@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_snapshot import CatalogSnapshot  # noqa: E402
+from storage_manager import StorageManager  # noqa: E402
+
+def _open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+def _snapshot(tmp_path):
+    storage = StorageManager(str(tmp_path / "storage"))
+    storage.create_folder("Mock")
+    storage.save_file("Mock", "a.pdf", b"a")
+    snapshot = CatalogSnapshot(str(tmp_path / "catalog.bin"))
+    snapshot.write(storage)
+    return storage, snapshot
+
+def test_reloads_close_the_previous_mapping(tmp_path):
+    storage, snapshot = _snapshot(tmp_path)
+    previous = snapshot._mapped
+    before = _open_fds()
+    for _ in range(20):
+        assert snapshot.load()
+    assert _open_fds() == before
+    assert previous.closed
+    generation, entries = storage.listing_state("Mock")
+    assert snapshot.entries_for("Mock", generation) == entries
+
+    snapshot.close()
+    assert snapshot._mapped is None
+    assert snapshot.entries_for("Mock", generation) is None
+
+def test_unreadable_snapshot_is_unmapped(tmp_path):
+    _, snapshot = _snapshot(tmp_path)
+    with open(snapshot.path, 'r+b') as f:
+        f.truncate(os.path.getsize(snapshot.path) - 1)
+    before = _open_fds()
+    assert not snapshot.load()
+    assert _open_fds() == before
@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cold_storage import COLD_DIR, ColdStorage  # noqa: E402
+from storage_manager import StorageManager  # noqa: E402
+
+MTIME = 1_000_000_000
+
+def _storage(tmp_path, **kwargs):
+    storage = StorageManager(str(tmp_path))
+    storage.create_folder("Mock")
+    for name, content in (("a.pdf", b"a" * 5000), ("b.pdf", b"b" * 5000)):
+        storage.save_file("Mock", name, content)
+        os.utime(os.path.join(storage.folder_path("Mock"), name), (MTIME, MTIME))
+    cold = ColdStorage(storage, **kwargs)
+    cold.attach(storage)
+    return storage, cold
+
+def _packs(storage):
+    return sorted(name for name in os.listdir(os.path.join(storage.base_path, COLD_DIR)) if name.endswith('.pack'))
+
+def test_archive_and_restore_keep_content_and_mtime(tmp_path):
+    storage, cold = _storage(tmp_path)
+    archived, saved = cold.archive([("Mock", "a.pdf"), ("Mock", "missing.pdf")])
+    assert archived == 1 and saved > 0
+    path = os.path.join(storage.folder_path("Mock"), "a.pdf")
+    assert not os.path.exists(path)
+    # Still listed, with its original size and mtime
+    assert storage.file_entries("Mock")["a.pdf"] == (5000, MTIME)
+    assert cold.stats()['files'] == 1
+
+    assert storage.get_file_path("Mock", "a.pdf") == path
+    with open(path, 'rb') as f:
+        assert f.read() == b"a" * 5000
+    assert os.stat(path).st_mtime == MTIME
+    assert not cold.contains("Mock", "a.pdf")
+    assert cold.restored_count == 1
+
+def test_archive_idle_skips_recent_files(tmp_path):
+    storage, cold = _storage(tmp_path)
+    accessed = {("Mock", "b.pdf"): 2e9}
+    assert cold.archive_idle(3600, lambda folder, name: accessed.get((folder, name)))[0] == 1
+    assert cold.contains("Mock", "a.pdf") and not cold.contains("Mock", "b.pdf")
+
+def test_new_upload_and_delete_forget_archived_copies(tmp_path):
+    storage, cold = _storage(tmp_path)
+    cold.archive([("Mock", "a.pdf"), ("Mock", "b.pdf")])
+    storage.save_file("Mock", "a.pdf", b"new")
+    assert not cold.contains("Mock", "a.pdf")
+    with open(storage.get_file_path("Mock", "a.pdf"), 'rb') as f:
+        assert f.read() == b"new"
+
+    storage.delete_file("Mock", "b.pdf")
+    assert not cold.contains("Mock", "b.pdf")
+    assert "b.pdf" not in storage.file_entries("Mock")
+    assert cold.stats()['files'] == 0
+
+def test_unreferenced_packs_are_removed(tmp_path):
+    # Every archive run starts a new pack once the current one holds anything
+    storage, cold = _storage(tmp_path, max_pack_bytes=1)
+    cold.archive([("Mock", "a.pdf")])
+    cold.archive([("Mock", "b.pdf")])
+    _, second = _packs(storage)
+    storage.get_file_path("Mock", "a.pdf")
+    assert _packs(storage) == [second]
+    # The newest pack is kept for appending even when nothing refers to it
+    assert cold.forget("Mock")
+    assert _packs(storage) == [second]
+    assert not cold.forget("Mock")
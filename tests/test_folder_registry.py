@@ -0,0 +1,42 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from folder_registry import FolderRegistry  # noqa: E402
+
+def _registry(tmp_path, defaults=("Mock Tests", "Notes", "Syllabus")):
+    return FolderRegistry(str(tmp_path / ".state" / "folders.json"), defaults=defaults)
+
+def test_numbers_stay_stable_when_a_folder_is_removed(tmp_path):
+    registry = _registry(tmp_path)
+    assert registry.remove("Notes").number == 2
+    assert registry.by_number(2) is None
+    assert registry.by_number(3).folder == "Syllabus"
+    assert registry.resolve("3").name == "Syllabus"
+    assert len(registry) == 2 and registry.highest_number() == 3
+
+    # New folders never take a freed number
+    assert registry.add("Legal Reasoning").number == 4
+    # The removed folder gets its own number back
+    assert registry.add("Notes").number == 2
+    assert [entry.number for entry in registry.entries()] == [1, 2, 3, 4]
+
+def test_numbers_survive_a_reload(tmp_path):
+    registry = _registry(tmp_path)
+    registry.remove("Syllabus")
+    registry.add("Legal Reasoning")
+    reloaded = _registry(tmp_path)
+    assert [(entry.number, entry.folder) for entry in reloaded.entries()] == [
+        (1, "MockTests"), (2, "Notes"), (4, "LegalReasoning")]
+    assert reloaded.add("Syllabus").number == 3
+
+def test_legacy_registry_is_numbered_by_position(tmp_path):
+    path = tmp_path / ".state" / "folders.json"
+    path.parent.mkdir()
+    path.write_text(json.dumps([{'name': "A", 'folder': "A"}, {'name': "B", 'folder': "B"}]))
+    registry = _registry(tmp_path)
+    assert registry.by_number(2).folder == "B"
+    registry.remove("A")
+    assert _registry(tmp_path).by_number(2).folder == "B"
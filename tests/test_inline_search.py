@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inline_search import InlineSearchCache  # noqa: E402
+
+FILES = [("F", "constitution.pdf"), ("F", "constant.txt"), ("F", "notes.txt")]
+
+def test_longer_query_reuses_complete_prefix_results():
+    searched = []
+
+    async def search(query, view):
+        searched.append(query)
+        return [key for key in FILES if query in key[1]], True
+
+    async def run():
+        cache = InlineSearchCache(search)
+        assert await cache.get("cons") == FILES[:2]
+        assert await cache.get("const") == FILES[:2]
+        assert await cache.get("consti") == FILES[:1]
+        return cache
+
+    cache = asyncio.run(run())
+    assert searched == ["cons"]
+    assert cache.prefix_hits == 2
+
+def test_results_of_search_interrupted_by_clear_are_not_cached():
+    async def run():
+        cache = InlineSearchCache(None)
+
+        async def search(query, view):
+            cache.clear()  # Storage changed while the search ran
+            return FILES, True
+
+        cache.search = search
+        assert await cache.get("txt") == FILES
+        assert await cache.get("txt") == FILES
+        return cache
+
+    assert asyncio.run(run()).misses == 2
+
+class _View:
+    def __init__(self, key, folders):
+        self.key = key
+        self.folders = folders
+
+def test_results_are_cached_per_view():
+    files = [("Open", "notes a.txt"), ("Private", "notes b.txt")]
+
+    async def search(query, view):
+        return [key for key in files if query in key[1] and key[0] in view.folders], True
+
+    async def run():
+        cache = InlineSearchCache(search)
+        assert await cache.get("notes", _View(1, {"Open", "Private"})) == files
+        assert await cache.get("notes", _View(2, {"Open"})) == files[:1]
+        # Prefix reuse stays within the same view
+        assert await cache.get("notes b", _View(2, {"Open"})) == []
+        assert await cache.get("notes b", _View(1, {"Open", "Private"})) == files[1:]
+        return cache
+
+    cache = asyncio.run(run())
+    assert (cache.misses, cache.prefix_hits) == (2, 2)
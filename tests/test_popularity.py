@@ -0,0 +1,95 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from popularity import PopularityTracker, WarmCache  # noqa: E402
+
+def _tracker_with_hits(hits_per_file, **kwargs):
+    tracker = PopularityTracker(half_life_seconds=3600, **kwargs)
+    for i, hits in enumerate(hits_per_file):
+        for _ in range(hits):
+            tracker.record("F", f"f{i}")
+    tracker.drain()
+    return tracker
+
+def test_warm_cache_evicts_coldest_entries_and_contents():
+    tracker = _tracker_with_hits(range(20))
+    cache = WarmCache(tracker, max_bytes=100, max_file_bytes=50, max_entries=5)
+    for i in range(20):
+        cache.remember_file_id("F", f"f{i}", "id")
+        cache.store_content("F", f"f{i}", b"x" * 25)
+    assert sorted(key[1] for key in cache._entries) == ["f15", "f16", "f17", "f18", "f19"]
+    assert [f"f{i}" for i in range(20) if cache.has_content("F", f"f{i}")] == ["f16", "f17", "f18", "f19"]
+    assert cache.used_bytes == 100
+
+def test_colder_newcomer_does_not_evict_hotter_content():
+    tracker = _tracker_with_hits([5, 1])
+    cache = WarmCache(tracker, max_bytes=10, max_file_bytes=10)
+    assert cache.store_content("F", "f0", b"x" * 10)
+    assert not cache.store_content("F", "f1", b"x" * 10)
+    assert cache.has_content("F", "f0")
+
+def test_scores_merge_across_processes(tmp_path):
+    db_path = str(tmp_path / "state.sqlite3")
+    first, second = PopularityTracker(3600, db_path=db_path), PopularityTracker(3600, db_path=db_path)
+    first.record("F", "a")
+    first.record("F", "a")
+    second.record("F", "a")
+    first.persist()
+    second.persist()
+    assert round(second.score("F", "a"), 3) == 3.0
+    second.forget("F", "a")
+    second.persist()
+    assert PopularityTracker(3600, db_path=db_path).score("F", "a") == 0.0
+
+def test_file_ids_persist_across_processes(tmp_path):
+    db_path = str(tmp_path / "state.db")
+    first = WarmCache(PopularityTracker(half_life_seconds=3600), db_path=db_path)
+    second = WarmCache(PopularityTracker(half_life_seconds=3600), db_path=db_path)
+    first.remember_file_id("F", "a", "id-a")
+    first.remember_file_id("F", "b", "id-b")
+    first.persist()
+    second.persist()
+    assert second.lookup("F", "a").file_id == "id-a"
+    second.forget_file_id("F", "a")
+    second.persist()
+    first.persist()
+    assert first.peek_file_id("F", "a") is None
+    assert first.peek_file_id("F", "b") == "id-b"
+    first.invalidate("F")
+    first.persist()
+    assert WarmCache(PopularityTracker(half_life_seconds=3600), db_path=db_path).peek_file_id("F", "b") is None
+
+class _Listing:
+    """Stands in for StorageManager: only file_entries and add_listener are used."""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def file_entries(self, folder_name):
+        return self.entries.get(folder_name, {})
+
+    def add_listener(self, listener):
+        pass
+
+def test_entries_changed_by_another_process_are_discarded(tmp_path):
+    db_path = str(tmp_path / "state.db")
+    listing = _Listing({"F": {"a": (3, 1.0)}})
+    writer = WarmCache(PopularityTracker(half_life_seconds=3600), db_path=db_path)
+    writer.attach(listing)
+    reader = WarmCache(PopularityTracker(half_life_seconds=3600), db_path=db_path)
+    reader.attach(listing)
+    writer.remember_file_id("F", "a", "id-old")
+    writer.persist()
+    reader.persist()
+    assert reader.store_content("F", "a", b"old")
+    assert reader.lookup("F", "a").file_id == "id-old"
+
+    listing.entries["F"]["a"] = (3, 2.0)  # Overwritten elsewhere; no listener ran here
+    assert reader.lookup("F", "a") is None
+    assert not reader.has_content("F", "a")
+    assert reader.used_bytes == 0
+    reader.persist()
+    writer.persist()
+    assert writer.peek_file_id("F", "a") is None
@@ -0,0 +1,64 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preview_manager import PreviewManager  # noqa: E402
+from storage_manager import FILE_DELETED, FILE_SAVED  # noqa: E402
+
+def _record(manager, folder_name, filename, path):
+    manager._update({manager._key(folder_name, filename): {'hash': "same", 'path': str(path)}})
+
+def test_identical_files_get_distinct_tokens(tmp_path):
+    manager = PreviewManager(str(tmp_path))
+    preview = tmp_path / "preview.jpg"
+    preview.write_bytes(b"x")
+    _record(manager, "Mock", "a.pdf", preview)
+    _record(manager, "Private", "a.pdf", preview)
+    mock_token = manager.get_preview("Mock", "a.pdf")[0]
+    private_token = manager.get_preview("Private", "a.pdf")[0]
+    assert mock_token != private_token
+    assert manager.resolve_token(mock_token) == ("Mock", "a.pdf")
+    assert manager.resolve_token(private_token) == ("Private", "a.pdf")
+
+def test_processes_merge_index_updates(tmp_path):
+    first, second = PreviewManager(str(tmp_path)), PreviewManager(str(tmp_path))
+    preview = tmp_path / "preview.jpg"
+    preview.write_bytes(b"x")
+    _record(first, "Mock", "a.pdf", preview)
+    _record(second, "Notes", "b.pdf", preview)
+    third = PreviewManager(str(tmp_path))
+    assert third.get_preview("Mock", "a.pdf") and third.get_preview("Notes", "b.pdf")
+    assert first.resolve_token(PreviewManager.token_for("Notes", "b.pdf")) == ("Notes", "b.pdf")
+    second.forget("Mock")
+    assert first.get_preview("Mock", "a.pdf") is None
+
+def test_reupload_drops_the_old_preview(tmp_path):
+    manager = PreviewManager(str(tmp_path))
+    preview = tmp_path / "preview.jpg"
+    preview.write_bytes(b"x")
+    _record(manager, "Mock", "a.pdf", preview)
+    scheduled = []
+    manager.schedule = lambda *args: scheduled.append(args)
+    manager.on_file_saved(type("Storage", (), {'base_path': str(tmp_path)}), "Mock", "a.pdf")
+    assert manager.get_preview("Mock", "a.pdf") is None
+    assert scheduled == [("Mock", "a.pdf", os.path.join(str(tmp_path), "Mock", "a.pdf"))]
+
+def test_storage_events_are_handled_in_order_off_the_caller(tmp_path):
+    manager = PreviewManager(str(tmp_path))
+    preview = tmp_path / "preview.jpg"
+    preview.write_bytes(b"x")
+    listeners, threads = [], []
+    storage = type("Storage", (), {'base_path': str(tmp_path), 'add_listener': lambda self, f: listeners.append(f)})()
+    manager.attach(storage)
+    manager.schedule = lambda folder_name, filename, path: (
+        threads.append(threading.current_thread()), _record(manager, folder_name, filename, preview))
+
+    listeners[0](FILE_SAVED, "Mock", "a.pdf")
+    listeners[0](FILE_SAVED, "Mock", "b.pdf")
+    listeners[0](FILE_DELETED, "Mock", "a.pdf")
+    manager.shutdown()
+    assert threads and threading.current_thread() not in threads
+    assert manager.get_preview("Mock", "a.pdf") is None
+    assert manager.get_preview("Mock", "b.pdf")
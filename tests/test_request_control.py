@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import request_control  # noqa: E402
+from request_control import RateLimiter, SingleFlight  # noqa: E402
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(request_control.time, "monotonic", clock)
+    return clock
+
+def test_burst_then_refill(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=3)
+    assert [limiter.allow("u") for _ in range(4)] == [True, True, True, False]
+    assert limiter.rejected == 1
+    assert limiter.retry_after("u") == pytest.approx(1.0)
+    # Other users have their own bucket
+    assert limiter.allow("v")
+
+    clock.now += 0.5
+    assert limiter.retry_after("u") == pytest.approx(0.5)
+    assert not limiter.allow("u")
+    clock.now += 1.0
+    assert limiter.retry_after("u") == 0.0
+    assert limiter.allow("u")
+
+    # Tokens never pile up beyond the burst
+    clock.now += 3600
+    assert [limiter.allow("u") for _ in range(4)] == [True, True, True, False]
+
+def test_least_recently_seen_users_are_evicted(clock):
+    limiter = RateLimiter(rate_per_minute=60, burst=1, max_users=2)
+    for user in ("a", "b", "c"):
+        assert limiter.allow(user)
+    # "a" was evicted, so it starts again with a full bucket
+    assert limiter.allow("a")
+    assert not limiter.allow("c")
+
+def test_concurrent_callers_share_one_result():
+    calls = []
+
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return "result"
+
+        tasks = [asyncio.create_task(flight.do("key", compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert flight.in_flight("key")
+        release.set()
+        results = await asyncio.gather(*tasks)
+        assert not flight.in_flight("key")
+        return flight, results
+
+    flight, results = asyncio.run(run())
+    assert calls == [1]
+    assert results == [("result", False), ("result", True), ("result", True)]
+    assert (flight.leaders, flight.followers) == (1, 2)
+
+def test_concurrent_callers_share_one_exception():
+    async def run():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            raise ValueError("boom")
+
+        tasks = [asyncio.create_task(flight.do("key", compute)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        # Nothing is cached, so the next call runs again
+        again = await flight.do("key", lambda: asyncio.sleep(0, "retried"))
+        return outcomes, again
+
+    outcomes, again = asyncio.run(run())
+    assert isinstance(outcomes[0], ValueError) and outcomes[1] is outcomes[0]
+    assert again == ("retried", False)
@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spelling import SpellCorrector  # noqa: E402
+from storage_manager import StorageManager  # noqa: E402
+
+def _speller(*filenames):
+    speller = SpellCorrector()
+    for filename in filenames:
+        speller.add_file("F", filename)
+    return speller
+
+def test_distance_one_and_two_corrections():
+    speller = _speller("constitution.pdf", "contracts.pdf")
+    assert speller.lookup("constitution") == "constitution"
+    assert speller.lookup("constitutoin") == "constitution"  # One transposition
+    assert speller.lookup("konstitusion") == "constitution"  # Two substitutions
+    assert speller.lookup("kontrukts") is None  # Three edits away
+    assert speller.correct("Konstitusion 2024 of") == "constitution 2024 of"
+
+def test_short_words_allow_one_edit_only():
+    speller = _speller("notes.pdf")
+    assert speller.lookup("nites") == "notes"
+    assert speller.lookup("nitas") is None
+
+def test_ties_go_to_the_word_in_most_filenames():
+    speller = _speller("notes.pdf", "votes 1.pdf", "votes 2.pdf")
+    assert speller.lookup("motes") == "votes"
+    speller.remove_file("F", "votes 1.pdf")
+    speller.remove_file("F", "votes 2.pdf")
+    assert speller.lookup("motes") == "notes"
+
+def test_index_follows_storage_changes(tmp_path):
+    storage = StorageManager(str(tmp_path))
+    storage.create_folder("Mock")
+    storage.create_folder("Notes")
+    speller = SpellCorrector()
+    speller.attach(storage)
+
+    storage.save_file("Mock", "syllabus.pdf", b"a")
+    storage.save_file("Notes", "syllabus notes.pdf", b"b")
+    assert speller.lookup("sylabus") == "syllabus"
+    storage.delete_file("Mock", "syllabus.pdf")
+    # Still used by a filename in another folder
+    assert speller.lookup("sylabus") == "syllabus"
+    storage.delete_folder("Notes")
+    assert speller.lookup("sylabus") is None
+
+    storage.save_file("Mock", "syllabus.pdf", b"a")
+    speller.remove_file("Mock")
+    assert SpellCorrector().rebuild(storage) == 1
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage_backends import LocalFSBackend, MemoryBackend  # noqa: E402
+from storage_manager import StorageManager, is_safe_filename  # noqa: E402
+
+@pytest.fixture(params=["local", "memory"])
+def storage(request, tmp_path):
+    backend = LocalFSBackend(str(tmp_path)) if request.param == "local" else MemoryBackend()
+    storage = StorageManager(str(tmp_path), backend=backend)
+    storage.create_folder("Mock")
+    storage.create_folder("Notes")
+    storage.save_file("Mock", "constitution.pdf", b"a")
+    storage.save_file("Mock", "contracts.pdf", b"bb")
+    storage.save_file("Notes", "constitution notes.pdf", b"ccc")
+    return storage
+
+def test_global_search(storage):
+    results = storage.search_files("const", record_history=False)
+    assert sorted(map(tuple, results['results'])) == [("Mock", "constitution.pdf"), ("Notes", "constitution notes.pdf")]
+
+def test_folder_search(storage):
+    results = storage.search_files("const", "Mock", record_history=False)
+    assert results['total_count'] == 1
+    assert results['results'] == ["constitution.pdf"]
+
+class _Speller:
+    """Rewrites queries through a fixed table, like a spell corrector would."""
+
+    def __init__(self, corrections):
+        self.corrections = corrections
+
+    def correct(self, query):
+        return self.corrections.get(query, query)
+
+def test_similar_files_follow_the_query_that_matched(storage):
+    expected = storage.search_files("contract", "Mock", record_history=False)['similar_files']
+    assert expected == ["constitution.pdf"]
+    storage.speller = _Speller({"contract": "constitution", "contrcts": "contract"})
+    # The original query matched, so its similar files are kept despite the correction
+    results = storage.search_files("contract", "Mock", record_history=False)
+    assert results['corrected_query'] is None
+    assert results['similar_files'] == expected
+    # Nothing matched, so both results and similar files come from the corrected query
+    results = storage.search_files("contrcts", "Mock", record_history=False)
+    assert results['corrected_query'] == "contract"
+    assert results['results'] == ["contracts.pdf"]
+    assert results['similar_files'] == expected
+
+def test_list_and_entries(storage):
+    assert sorted(storage.list_files("Mock")) == ["constitution.pdf", "contracts.pdf"]
+    assert storage.file_entries("Mock")["contracts.pdf"][0] == 2
+    assert sorted(storage.list_folders()) == ["Mock", "Notes"]
+    with pytest.raises(FileNotFoundError):
+        storage.list_files("Missing")
+
+def test_delete_file(storage):
+    storage.delete_file("Mock", "contr")
+    assert storage.list_files("Mock") == ["constitution.pdf"]
+    assert storage.search_files("contracts", "Mock", record_history=False)['total_count'] == 0
+
+def test_delete_folder(storage):
+    storage.delete_folder("Notes")
+    assert storage.list_folders() == ["Mock"]
+    assert not storage.folder_exists("Notes")
+
+def test_read_back(storage):
+    with open(storage.get_file_path("Notes", "constitution"), 'rb') as f:
+        assert f.read() == b"ccc"
+    with storage.open_file("Mock", "contracts.pdf") as f:
+        assert f.read() == b"bb"
+
+@pytest.mark.parametrize("filename", ["../escape.pdf", "a/b.pdf", "a\\b.pdf", ".hidden.pdf", "..", ".", ""])
+def test_unsafe_filenames_are_rejected(filename):
+    assert not is_safe_filename(filename)
+
+def test_plain_filenames_are_accepted():
+    assert is_safe_filename("my notes v1..2.pdf")
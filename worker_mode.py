@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import multiprocessing
+from typing import List, Optional
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+def shard_for_update(update: Update, num_workers: int) -> int:
+    """Pick the worker for an update so every chat always lands on the same worker."""
+    if update.effective_chat:
+        key = update.effective_chat.id
+    elif update.effective_user:
+        # Inline queries have no chat; keep them ordered per user instead
+        key = update.effective_user.id
+    else:
+        key = update.update_id
+    return key % num_workers
+
+def _worker_main(token: str, worker_id: int, queue: multiprocessing.Queue) -> None:
+    """Entry point of a worker process."""
+    logging.basicConfig(
+        format=f'%(asctime)s - worker-{worker_id} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    asyncio.run(_run_worker(token, worker_id, queue))
+
+async def _run_worker(token: str, worker_id: int, queue: multiprocessing.Queue) -> None:
+    """Process updates from the ingress queue one at a time, preserving order."""
+    from main import configure_builder, register_handlers  # Imported lazily to avoid a circular import
+
+    # Worker 0 takes over the storage-wide jobs; the ingress process runs none
+    application = configure_builder(Application.builder().token(token).updater(None), leader=worker_id == 0).build()
+    register_handlers(application)
+    loop = asyncio.get_running_loop()
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        logger.info(f"Worker {worker_id} ready")
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            try:
+                update = Update.de_json(data, application.bot)
+                await application.process_update(update)
+            except Exception as e:
+                logger.error(f"Worker {worker_id} failed to process update: {str(e)}", exc_info=True)
+        await application.stop()
+    logger.info(f"Worker {worker_id} stopped")
+
+class UpdateDispatcher:
+    """Fan updates out from the ingress process to a pool of worker processes."""
+
+    def __init__(self, token: str, num_workers: int):
+        self.token = token
+        self.num_workers = num_workers
+        self._context = multiprocessing.get_context("spawn")
+        self.queues: List[multiprocessing.Queue] = []
+        self.processes: List[multiprocessing.Process] = []
+
+    def start(self) -> None:
+        """Spawn the worker processes."""
+        for worker_id in range(self.num_workers):
+            queue = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main,
+                args=(self.token, worker_id, queue),
+                name=f"bot-worker-{worker_id}",
+                daemon=True
+            )
+            process.start()
+            self.queues.append(queue)
+            self.processes.append(process)
+        logger.info(f"Started {self.num_workers} worker processes")
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Ask every worker to drain its queue and exit."""
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not exit in time, terminating")
+                process.terminate()
+        self.queues.clear()
+        self.processes.clear()
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Forward an update to its shard and stop local handler processing."""
+        worker_id = shard_for_update(update, self.num_workers)
+        self.queues[worker_id].put(update.to_dict())
+        logger.debug(f"Dispatched update {update.update_id} to worker {worker_id}")
+        raise ApplicationHandlerStop
+
+    def attach(self, application: Application) -> None:
+        """Install the dispatcher as the only handler of an ingress application."""
+        application.add_handler(TypeHandler(Update, self.dispatch), group=-1)